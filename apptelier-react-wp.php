@@ -82,6 +82,19 @@ function apptelier_reactwp_enqueue_assets() {
             // Default logo URL (can be overridden in React via window.ApptelierConfig.logoUrl)
             'logoUrl'    => 'https://apptelier.sg/wp-content/uploads/2026/01/Logo_new.png',
         ];
+        // Tenant for sites sharing one API host: define('APPTELIER_TENANT', 'acme') in wp-config.php
+        if (defined('APPTELIER_TENANT') && APPTELIER_TENANT) {
+            $cfg['tenant'] = (string) APPTELIER_TENANT;
+        }
+        // Static catalog export (`python manage.py snapshot --tenant ID`, one
+        // directory per tenant): React reads it instead of calling the API.
+        // The version busts the manifest cache.
+        $snapshot_tenant   = sanitize_key(isset($cfg['tenant']) ? $cfg['tenant'] : 'default');
+        $snapshot_manifest = $base_dir . 'catalog/' . $snapshot_tenant . '/manifest.json';
+        if ($snapshot_tenant !== '' && file_exists($snapshot_manifest)) {
+            $cfg['catalogSnapshotUrl']     = $base_url . 'catalog/' . $snapshot_tenant . '/';
+            $cfg['catalogSnapshotVersion'] = (string) filemtime($snapshot_manifest);
+        }
         wp_add_inline_script($last_js, 'window.ApptelierConfig = ' . wp_json_encode($cfg) . ';', 'before');
     }
 
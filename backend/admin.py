@@ -0,0 +1,227 @@
+"""Admin write API for the catalog.
+
+Every endpoint requires ``ADMIN_TOKEN`` (``Authorization: Bearer <token>``
+or ``X-Admin-Token``); without it configured the API answers 403.
+
+Single-row create/update/delete go through the ORM. ``POST .../bulk``
+upserts any number of rows in one transaction with a single
+``INSERT ... ON DUPLICATE KEY UPDATE`` (``ON CONFLICT`` on SQLite) executed
+for all rows at once; PyMySQL rewrites that executemany into multi-row
+INSERTs, so thousands of rows cost a handful of round trips instead of one
+per row. Other databases get a portable merge instead: one SELECT for the
+ids that already exist, then an executemany INSERT for the new rows and an
+UPDATE by primary key for the rest. Plans carry their features: an upserted plan's features are
+replaced with ``DELETE ... WHERE plan_id IN (...)`` and one bulk insert.
+
+Writes apply to the request's tenant (see tenants.py): rows are created with
+its ``tenant_id``, another tenant's row answers 404 to update and delete, and
+a bulk upsert naming another tenant's ids is refused with 409 as a whole.
+
+Every commit calls ``catalog_cache.invalidate(tenant)``, which bumps that
+tenant's cache version in this and (through the shared store) every other
+worker; the next read rebuilds its payloads and therefore their ETags.
+"""
+import hmac
+import os
+import uuid
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.orm import Session
+
+import schemas
+from cache import catalog_cache
+from database import run_db
+from models import SubscriptionPlan, PlanFeature, Service, Testimonial, HeroStat
+from tenants import current_tenant
+
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+ADMIN_BULK_MAX_ROWS = int(os.environ.get('ADMIN_BULK_MAX_ROWS', '50000'))
+# Ids per ... IN (...), well below SQLite's bound-parameter limit
+DELETE_CHUNK_IDS = 1000
+
+
+class TenantConflict(Exception):
+    """Rows named in a bulk upsert belong to another tenant."""
+
+
+def require_admin(authorization: Optional[str] = Header(None), x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API disabled: ADMIN_TOKEN is not set")
+    token = x_admin_token
+    if token is None and authorization and authorization.lower().startswith("bearer "):
+        token = authorization[7:].strip()
+    if token is None or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+admin_router = APIRouter(prefix="/api/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+def _new_id():
+    return str(uuid.uuid4())
+
+
+def _features(plan_id, features, tenant_id):
+    return [{"id": _new_id(), "tenant_id": tenant_id, "plan_id": plan_id, **feature} for feature in features]
+
+
+def _commit(db: Session, tenant_id: str):
+    db.commit()
+    catalog_cache.invalidate(tenant_id)
+
+
+def _owned(db: Session, model, item_id: str, tenant_id: str):
+    item = db.get(model, item_id)
+    return item if item is not None and item.tenant_id == tenant_id else None
+
+
+def create_item(db: Session, model, schema, data: dict, tenant_id: str):
+    features = data.pop("features", None)
+    item = model(id=_new_id(), tenant_id=tenant_id, **data)
+    if features is not None:
+        item.features = [PlanFeature(**row) for row in _features(item.id, features, tenant_id)]
+    db.add(item)
+    _commit(db, tenant_id)
+    # Reload what the database filled in (server defaults, timestamps)
+    db.refresh(item)
+    return schema.model_validate(item)
+
+
+def update_item(db: Session, model, schema, item_id: str, data: dict, tenant_id: str):
+    item = _owned(db, model, item_id, tenant_id)
+    if item is None:
+        return None
+    features = data.pop("features", None)
+    for name, value in data.items():
+        setattr(item, name, value)
+    if features is not None:
+        item.features = [PlanFeature(**row) for row in _features(item.id, features, tenant_id)]
+    _commit(db, tenant_id)
+    db.refresh(item)
+    return schema.model_validate(item)
+
+
+def delete_item(db: Session, model, item_id: str, tenant_id: str) -> bool:
+    item = _owned(db, model, item_id, tenant_id)
+    if item is None:
+        return False
+    # The ORM cascade removes plan features even where the database does not
+    # enforce the foreign key (SQLite).
+    db.delete(item)
+    _commit(db, tenant_id)
+    return True
+
+
+def _upsert(db: Session, model, rows):
+    """Insert or update ``rows`` (dicts with the same keys, including ``id``)
+    with one executemany of a dialect-specific upsert."""
+    dialect = db.get_bind().dialect.name
+    # Never updated: a row stays with the tenant that created it
+    columns = [name for name in rows[0] if name not in ("id", "tenant_id")]
+    extra = {"updated_at": func.now()} if "updated_at" in model.__table__.c else {}
+    if dialect in ("mysql", "mariadb"):
+        stmt = mysql.insert(model)
+        stmt = stmt.on_duplicate_key_update({**{name: stmt.inserted[name] for name in columns}, **extra})
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(model)
+        stmt = stmt.on_conflict_do_update(index_elements=["id"],
+                                          set_={**{name: stmt.excluded[name] for name in columns}, **extra})
+    else:
+        _merge(db, model, rows)
+        return
+    db.execute(stmt, rows)
+
+
+def _merge(db: Session, model, rows):
+    """Portable upsert for dialects without one: insert the rows whose id is
+    new and update the others by primary key (``updated_at`` via onupdate)."""
+    ids = [row["id"] for row in rows]
+    existing = set()
+    for start in range(0, len(ids), DELETE_CHUNK_IDS):
+        existing.update(db.execute(select(model.id).where(model.id.in_(ids[start:start + DELETE_CHUNK_IDS]))).scalars())
+    new = [row for row in rows if row["id"] not in existing]
+    changed = [{name: value for name, value in row.items() if name != "tenant_id"}
+               for row in rows if row["id"] in existing]
+    if new:
+        db.execute(insert(model), new)
+    if changed:
+        db.execute(update(model), changed)
+
+
+def _foreign_ids(db: Session, model, ids, tenant_id: str):
+    foreign = []
+    for start in range(0, len(ids), DELETE_CHUNK_IDS):
+        foreign.extend(db.execute(
+            select(model.id).where(model.id.in_(ids[start:start + DELETE_CHUNK_IDS]), model.tenant_id != tenant_id)
+        ).scalars())
+    return foreign
+
+
+def bulk_upsert(db: Session, model, items: List[dict], tenant_id: str) -> dict:
+    rows, features = [], []
+    for item in items:
+        row = {**item, "id": item.get("id") or _new_id(), "tenant_id": tenant_id}
+        if model is SubscriptionPlan:
+            features.extend(_features(row["id"], row.pop("features"), tenant_id))
+        rows.append(row)
+    foreign = _foreign_ids(db, model, [item["id"] for item in items if item.get("id")], tenant_id)
+    if foreign:
+        raise TenantConflict(foreign)
+    if rows:
+        _upsert(db, model, rows)
+    if model is SubscriptionPlan and rows:
+        plan_ids = [row["id"] for row in rows]
+        for start in range(0, len(plan_ids), DELETE_CHUNK_IDS):
+            db.execute(delete(PlanFeature).where(
+                PlanFeature.tenant_id == tenant_id,
+                PlanFeature.plan_id.in_(plan_ids[start:start + DELETE_CHUNK_IDS]),
+            ))
+        if features:
+            db.execute(insert(PlanFeature), features)
+    _commit(db, tenant_id)
+    result = {"upserted": len(rows)}
+    if model is SubscriptionPlan:
+        result["features"] = len(features)
+    return result
+
+
+def _register(path, model, create_schema, upsert_schema, schema):
+    # create / update / delete / bulk upsert for one catalog resource
+    @admin_router.post(f"/{path}", response_model=schema, status_code=201)
+    async def create(item: create_schema, tenant: str = Depends(current_tenant)):
+        return await run_db(create_item, model, schema, item.model_dump(), tenant)
+
+    @admin_router.put(f"/{path}/{{item_id}}", response_model=schema)
+    async def update(item_id: str, item: create_schema, tenant: str = Depends(current_tenant)):
+        updated = await run_db(update_item, model, schema, item_id, item.model_dump(), tenant)
+        if updated is None:
+            raise HTTPException(status_code=404, detail=f"{path} item {item_id} not found")
+        return updated
+
+    @admin_router.delete(f"/{path}/{{item_id}}", status_code=204)
+    async def remove(item_id: str, tenant: str = Depends(current_tenant)):
+        if not await run_db(delete_item, model, item_id, tenant):
+            raise HTTPException(status_code=404, detail=f"{path} item {item_id} not found")
+        return Response(status_code=204)
+
+    @admin_router.post(f"/{path}/bulk")
+    async def bulk(items: List[upsert_schema], tenant: str = Depends(current_tenant)):
+        if len(items) > ADMIN_BULK_MAX_ROWS:
+            raise HTTPException(status_code=413, detail=f"At most {ADMIN_BULK_MAX_ROWS} rows per request")
+        try:
+            return await run_db(bulk_upsert, model, [item.model_dump() for item in items], tenant)
+        except TenantConflict as e:
+            ids = e.args[0]
+            raise HTTPException(status_code=409, detail=f"{len(ids)} {path} ids belong to another tenant, "
+                                                        f"e.g. {', '.join(ids[:5])}")
+
+
+_register("plans", SubscriptionPlan, schemas.SubscriptionPlanCreate, schemas.SubscriptionPlanUpsert,
+          schemas.SubscriptionPlan)
+_register("services", Service, schemas.ServiceCreate, schemas.ServiceUpsert, schemas.Service)
+_register("testimonials", Testimonial, schemas.TestimonialCreate, schemas.TestimonialUpsert, schemas.Testimonial)
+_register("hero-stats", HeroStat, schemas.HeroStatCreate, schemas.HeroStatUpsert, schemas.HeroStat)
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+Load and latency benchmark for the Apptelier API.
+
+By default the FastAPI app is booted in-process against a disposable SQLite
+database, seeded and then scaled to each ``--scales`` size (that many extra
+plan features and testimonials). Every catalog endpoint is then driven at
+each ``--concurrency`` level and RPS, p50/p95/p99 latency and SQL statements
+per request are reported:
+
+    python benchmark.py --scales 10 1000 100000 --json results.json
+    python benchmark.py --baseline benchmark_baseline.json      # exit 1 on regression
+    python benchmark.py --save-baseline benchmark_baseline.json --runs 3
+
+Requests send ``Accept-Encoding: identity`` unless --encoding says
+otherwise (e.g. ``--encoding br`` to include decompression); the encoding is
+recorded in the results and a baseline taken with another one is flagged.
+
+Use --database-url to run against a disposable MySQL/MariaDB instead
+(its tables are dropped and recreated), --no-cache to measure the database
+path, --memory to report the catalog snapshot's memory and the allocations
+of encoding each section from it versus reading it through MySQL, and --url
+to drive an already running server (no scaling or SQL
+counts; the sync/async comparison from the DB_ASYNC docs uses this):
+
+    CACHE_ENABLED=false DB_ASYNC=true uvicorn server:app --port 8001
+    python benchmark.py --url http://localhost:8001 --paths /api/plans
+
+Recorded sync/async figures (SQLite, in-process) are kept in
+benchmark_results_async.json along with the command that produced them.
+
+--tenants creates that many tenants, each with the seed catalog, and checks
+that per-tenant cost stays flat as the count grows: it times tenant
+resolution from a header and from a host name, then requests --paths
+(``/api/plans`` by default) for --requests random tenants twice, cold (a
+tenant-scoped database read) and warm (that tenant's cache partition):
+
+    python benchmark.py --tenants 10 1000 10000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import httpx
+
+DEFAULT_PATHS = ["/api/plans", "/api/services", "/api/testimonials", "/api/hero-stats", "/api/landing"]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_level(client: httpx.AsyncClient, path: str, concurrency: int, total: int, sql_counter=None,
+                    tenants=None) -> Dict:
+    """Request ``path`` ``total`` times from ``concurrency`` workers; with
+    ``tenants``, request ``i`` is made as tenant ``tenants[i]`` (X-Tenant)."""
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in remaining:
+            headers = {"X-Tenant": tenants[i]} if tenants is not None else None
+            start = time.perf_counter()
+            try:
+                response = await client.get(path, headers=headers)
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    sql_before = sql_counter() if sql_counter else 0
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "path": path,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+    if sql_counter:
+        result["sql_per_request"] = round((sql_counter() - sql_before) / total, 3)
+    return result
+
+
+async def drive(client, args, scale=None, sql_counter=None) -> List[Dict]:
+    results = []
+    for path in args.paths:
+        for concurrency in args.concurrency:
+            await run_level(client, path, concurrency, min(concurrency, args.requests))  # warm-up
+            # Keep the fastest of --repeat runs; scheduling noise only ever slows a run down.
+            runs = [await run_level(client, path, concurrency, max(args.requests, concurrency), sql_counter)
+                    for _ in range(args.repeat)]
+            result = max(runs, key=lambda run: run["rps"])
+            if scale is not None:
+                result["scale"] = scale
+            results.append(result)
+            print(f"{'' if scale is None else f'scale={scale:<7}'}{path:<18} c={concurrency:<4} "
+                  f"rps={result['rps']:<9} p50={result['p50_ms']}ms p95={result['p95_ms']}ms "
+                  f"p99={result['p99_ms']}ms sql/req={result.get('sql_per_request', '-')} errors={result['errors']}")
+    return results
+
+
+def prepare_database(scale: int):
+    """Recreate the schema, seed it, then add ``scale`` plan features (spread
+    over the seeded plans) and ``scale`` testimonials with bulk inserts."""
+    import uuid
+    from database import SessionLocal, engine, Base
+    from models import SubscriptionPlan, PlanFeature, Testimonial, create_schema
+    from seed_data import seed_database, bulk_insert
+
+    Base.metadata.drop_all(bind=engine)
+    create_schema()
+    db = SessionLocal()
+    try:
+        seed_database(db)
+        plan_ids = [plan_id for (plan_id,) in db.query(SubscriptionPlan.id).all()]
+        features = [
+            {"id": str(uuid.uuid4()), "plan_id": plan_ids[i % len(plan_ids)],
+             "name": f"Benchmark feature {i}", "included": i % 3 != 0, "order_index": 100 + i}
+            for i in range(scale)
+        ]
+        bulk_insert(db, PlanFeature, features)
+        testimonials = [
+            {"id": str(uuid.uuid4()), "name": f"Customer {i}", "role": "Owner, Benchmark Co",
+             "content": "Apptelier keeps our bookings running smoothly. " * 3, "rating": 5, "avatar": "BC"}
+            for i in range(scale)
+        ]
+        bulk_insert(db, Testimonial, testimonials)
+        db.commit()
+    finally:
+        db.close()
+
+
+def prepare_tenants(count: int):
+    """Recreate the schema with the default tenant and ``count`` more
+    (``tenant-0``...), each with the seed catalog and its own domain."""
+    from database import SessionLocal, engine, Base
+    from models import Tenant, create_schema
+    from seed_data import DEFAULT_CHUNK_SIZE, bulk_insert, seed_database, seed_rows
+
+    Base.metadata.drop_all(bind=engine)
+    create_schema()
+    db = SessionLocal()
+    try:
+        seed_database(db)
+        names = [f"tenant-{i}" for i in range(count)]
+        bulk_insert(db, Tenant, [{"id": name, "name": name, "domain": f"{name}.example.com"} for name in names])
+        # Buffered per table across tenants so inserts stay a handful of executemany calls
+        buffered, pending = {}, 0
+        for name in names:
+            for model, rows in seed_rows(name).items():
+                buffered.setdefault(model, []).extend(rows)
+                pending += len(rows)
+            if pending >= DEFAULT_CHUNK_SIZE or name == names[-1]:
+                for model, rows in buffered.items():
+                    bulk_insert(db, model, rows)
+                buffered, pending = {}, 0
+        db.commit()
+    finally:
+        db.close()
+    return names
+
+
+def time_resolution(registry, names, lookups: int = 100000) -> Dict:
+    """Mean nanoseconds per tenant resolution, by header and by host name."""
+    sample = [random.choice(names) for _ in range(lookups)]
+    hosts = [f"{name}.example.com" for name in sample]
+    result = {}
+    for label, resolve in (("header", lambda i: registry.resolve("bench", sample[i])),
+                           ("host", lambda i: registry.resolve(hosts[i]))):
+        started = time.perf_counter()
+        for i in range(lookups):
+            resolve(i)
+        result[f"resolve_{label}_ns"] = round((time.perf_counter() - started) / lookups * 1e9, 1)
+    return result
+
+
+async def run_tenants(client, args, sql_counter) -> List[Dict]:
+    from cache import catalog_cache
+    from tenants import tenant_registry
+
+    results = []
+    for count in args.tenants:
+        started = time.perf_counter()
+        names = prepare_tenants(count)
+        await tenant_registry.reload()
+        catalog_cache.invalidate()
+        print(f"-- {count} tenants: database prepared in {time.perf_counter() - started:.1f}s")
+        resolution = time_resolution(tenant_registry, names)
+        sample = random.sample(names, min(args.requests, count))
+        for path in args.paths:
+            for concurrency in args.concurrency:
+                # Invalidated before every level, so each cold run really misses
+                catalog_cache.invalidate()
+                for phase in ("cold", "warm"):
+                    if phase == "warm":
+                        # Loads what load shedding turned away from the cold run, so warm only hits
+                        await run_level(client, path, 1, len(sample), tenants=sample)
+                    result = await run_level(client, path, concurrency, len(sample), sql_counter, sample)
+                    result.update(tenants=count, phase=phase, **resolution)
+                    results.append(result)
+                    print(f"tenants={count:<6} {phase:<4} {path:<14} c={concurrency:<4} "
+                          f"p50={result['p50_ms']}ms p95={result['p95_ms']}ms sql/req={result['sql_per_request']} "
+                          f"resolve={resolution['resolve_header_ns']}/{resolution['resolve_host_ns']}ns "
+                          f"errors={result['errors']}")
+        stats = catalog_cache.stats()
+        print(f"   cache: {stats['tenants']} tenant partitions, {stats['bytes'] / 1024:.0f} KiB")
+    return results
+
+
+def measure_memory(scale: int) -> Dict:
+    """Snapshot size and peak Python allocations (tracemalloc) of building
+    each section payload from the snapshot versus from the database."""
+    import tracemalloc
+    from database import SessionLocal
+    from catalog import CATALOG, read_payload
+    from catalog_snapshot import load_snapshot, snapshot_payload
+
+    db = SessionLocal()
+    try:
+        tracemalloc.start()
+        snapshot = load_snapshot(db, "default", (0, 0))
+        traced = tracemalloc.get_traced_memory()[0]
+        result = {"scale": scale, "snapshot_bytes": snapshot.size_bytes, "snapshot_traced_bytes": traced,
+                  "sections": {}}
+        for key in CATALOG:
+            peaks = []
+            for build in (lambda: snapshot_payload(snapshot, key), lambda: read_payload(db, key).precompress()):
+                db.expunge_all()
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                build()
+                peaks.append(tracemalloc.get_traced_memory()[1] - before)
+            result["sections"][key] = {"snapshot_peak_bytes": peaks[0], "database_peak_bytes": peaks[1]}
+    finally:
+        tracemalloc.stop()
+        db.close()
+    print(f"scale={scale:<7} snapshot {result['snapshot_bytes'] / 1024:.1f} KiB "
+          f"(traced {result['snapshot_traced_bytes'] / 1024:.1f} KiB); per-payload peak allocation "
+          + ", ".join(f"{key} {v['snapshot_peak_bytes'] / 1024:.1f} vs {v['database_peak_bytes'] / 1024:.1f} KiB"
+                      for key, v in result["sections"].items()))
+    return result
+
+
+async def run_in_process(args) -> List[Dict]:
+    if args.database_url:
+        os.environ["MYSQL_URL"] = args.database_url
+    else:
+        tmpdir = tempfile.mkdtemp(prefix="apptelier-bench-")
+        os.environ["MYSQL_URL"] = f"sqlite:///{tmpdir}/bench.db"
+    os.environ["STARTUP_MODE"] = "fast"
+
+    import server
+    import metrics
+    from cache import catalog_cache
+    from database import dispose_engines
+
+    # server.py configures INFO logging; per-request client logs would dominate the timings.
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    catalog_cache.enabled = not args.no_cache
+    sql_counter = lambda: metrics.sql_totals()[0]
+    results = []
+    try:
+        if args.tenants:
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout,
+                                         headers=client_headers(args)) as client:
+                return await run_tenants(client, args, sql_counter)
+        for scale in args.scales:
+            started = time.perf_counter()
+            prepare_database(scale)
+            catalog_cache.invalidate()
+            print(f"-- scale {scale}: database prepared in {time.perf_counter() - started:.1f}s")
+            if args.memory:
+                args.memory_results.append(measure_memory(scale))
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout,
+                                         headers=client_headers(args)) as client:
+                results.extend(await drive(client, args, scale, sql_counter))
+    finally:
+        await dispose_engines()
+    return results
+
+
+def client_headers(args) -> Dict:
+    # httpx asks for br/gzip by default and would then decompress every
+    # response inside the timed loop; the encoding is recorded in the results.
+    return {"Accept-Encoding": args.encoding}
+
+
+async def run_remote(args) -> List[Dict]:
+    results = []
+    for concurrency in args.concurrency:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout,
+                                     headers=client_headers(args)) as client:
+            level_args = argparse.Namespace(**{**vars(args), "concurrency": [concurrency]})
+            results.extend(await drive(client, level_args))
+    return results
+
+
+def result_key(result: Dict):
+    return (result.get("scale"), result.get("tenants"), result.get("phase"), result["path"], result["concurrency"])
+
+
+def slowest(runs: List[List[Dict]]) -> List[Dict]:
+    """Merge whole runs, keeping each level's lowest rps and highest latencies."""
+    merged = {}
+    for results in runs:
+        for result in results:
+            key = result_key(result)
+            if key not in merged:
+                merged[key] = dict(result)
+                continue
+            worst = merged[key]
+            worst["rps"] = min(worst["rps"], result["rps"])
+            for field in ("p50_ms", "p95_ms", "p99_ms", "errors"):
+                worst[field] = max(worst[field], result[field])
+    return list(merged.values())
+
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float, min_delta_ms: float = 1.0) -> List[str]:
+    """Return a description of every result that regressed beyond ``tolerance``.
+
+    Latency changes smaller than ``min_delta_ms`` are ignored so sub-millisecond
+    jitter on cached endpoints does not fail the comparison.
+    """
+    previous = {result_key(r): r for r in baseline}
+    regressions = []
+    for result in results:
+        base = previous.get(result_key(result))
+        if base is None:
+            continue
+        scale, tenants, phase, path, concurrency = result_key(result)
+        label = " ".join(filter(None, (
+            f"scale={scale}" if scale is not None else None,
+            f"tenants={tenants} {phase}" if tenants is not None else None,
+            f"{path} c={concurrency}",
+        )))
+        if result["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{label}: rps {base['rps']} -> {result['rps']}")
+        if result["p95_ms"] > base["p95_ms"] * (1 + tolerance) and result["p95_ms"] - base["p95_ms"] > min_delta_ms:
+            regressions.append(f"{label}: p95 {base['p95_ms']}ms -> {result['p95_ms']}ms")
+        if "sql_per_request" in base and result.get("sql_per_request", 0) > base["sql_per_request"]:
+            regressions.append(f"{label}: sql/req {base['sql_per_request']} -> {result['sql_per_request']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apptelier API load and latency benchmark")
+    parser.add_argument("--url", help="benchmark a running server instead of booting the app in-process")
+    parser.add_argument("--database-url", help="disposable database for in-process runs (default: temporary SQLite)")
+    parser.add_argument("--paths", nargs="+", help="endpoints to drive (default: all catalog endpoints, "
+                                                     "or /api/plans with --tenants)")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 1000],
+                        help="extra features and testimonials to load per run")
+    parser.add_argument("--tenants", type=int, nargs="+",
+                        help="benchmark with this many tenants instead of --scales (in-process only)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 50])
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and concurrency level")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per level; the fastest is reported")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--encoding", default="identity",
+                        help="Accept-Encoding sent with every request (default: %(default)s)")
+    parser.add_argument("--no-cache", action="store_true", help="disable the catalog cache (in-process only)")
+    parser.add_argument("--memory", action="store_true",
+                        help="report catalog snapshot memory and per-payload allocations (in-process only)")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare against this results file and exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression (default 0.2)")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore p95 changes smaller than this")
+    parser.add_argument("--save-baseline", help="write results as the new baseline")
+    parser.add_argument("--runs", type=int, default=1,
+                        help="repeat the whole benchmark and keep the slowest result per level, "
+                             "so a saved baseline is not one lucky run")
+    args = parser.parse_args()
+    args.paths = args.paths or (["/api/plans"] if args.tenants else DEFAULT_PATHS)
+    args.memory_results = []
+
+    results = slowest([asyncio.run(run_remote(args) if args.url else run_in_process(args))
+                       for _ in range(args.runs)])
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "target": args.url or ("database-url" if args.database_url else "sqlite"),
+            "cache": not args.no_cache,
+            "db_async": os.environ.get("DB_ASYNC", "false"),
+            "encoding": args.encoding,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": results,
+    }
+    if args.memory_results:
+        report["memory"] = args.memory_results
+    for path in filter(None, (args.json, args.save_baseline)):
+        with open(path, "w") as fh:
+            json.dump(report, fh, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        base_encoding = baseline.get("meta", {}).get("encoding", "identity")
+        if base_encoding != args.encoding:
+            print("\nWarning: %s was recorded with Accept-Encoding %r, this run used %r"
+                  % (args.baseline, base_encoding, args.encoding))
+        regressions = compare(results, baseline["results"], args.tolerance, args.min_delta_ms)
+        if regressions:
+            print("\nRegressions against %s:" % args.baseline)
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print("\nNo regressions against %s (tolerance %d%%)" % (args.baseline, args.tolerance * 100))
+
+
+if __name__ == "__main__":
+    main()
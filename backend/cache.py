@@ -0,0 +1,471 @@
+"""Read-through cache for the catalog endpoints.
+
+Entries are keyed by tenant and name (``plans``, ``services``...) and tagged
+with the tenant's cache version when they were loaded: the global version
+plus a per-tenant counter. ``invalidate(tenant)`` bumps one tenant's counter
+and ``invalidate()`` the global version, which makes every matching entry
+stale at once; write paths (seeding, admin edits) call it after committing.
+
+Each tenant has its own LRU partition. Stale entries stay in it, for serving
+when a reload fails, until evicted. A partition over CACHE_TENANT_MAX_BYTES
+(or CACHE_MAX_ENTRIES) evicts its own oldest entries, so a tenant with a
+huge catalog only ever pushes out its own payloads; values bigger than the
+quota are served but not kept. Past CACHE_MAX_BYTES overall, entries go from
+the least recently used tenants first.
+
+Behind the per-process LRU sits an optional shared store (see
+``cache_store``) so several workers and hosts share one warm copy. An
+``invalidate(tenant)`` in any process is logged there under a new version;
+the version is polled every CACHE_VERSION_CHECK_SECONDS and the log tells
+every other worker which tenant to drop, so a change to one tenant never
+empties anyone else's entries. When the store is unreachable the cache
+carries on with the local LRU and direct database reads, retrying after
+CACHE_STORE_RETRY_SECONDS.
+"""
+import asyncio
+import inspect
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+
+from cache_store import store_from_env
+from models import DEFAULT_TENANT
+from payload import Payload
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = float(os.environ.get('CACHE_TTL_SECONDS', '300'))
+MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '256'))  # per tenant
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+CACHE_TENANT_MAX_BYTES = int(os.environ.get('CACHE_TENANT_MAX_BYTES', str(64 * 1024 * 1024)))
+CACHE_ENABLED = os.environ.get('CACHE_ENABLED', 'true').lower() not in ('0', 'false', 'no')
+CACHE_VERSION_CHECK_SECONDS = float(os.environ.get('CACHE_VERSION_CHECK_SECONDS', '1'))
+CACHE_STORE_TIMEOUT = float(os.environ.get('CACHE_STORE_TIMEOUT', '0.25'))
+CACHE_STORE_RETRY_SECONDS = float(os.environ.get('CACHE_STORE_RETRY_SECONDS', '5'))
+# A worker further behind than this many changes drops every tenant instead of
+# reading the log.
+CACHE_CHANGE_LOG_BATCH = int(os.environ.get('CACHE_CHANGE_LOG_BATCH', '256'))
+
+
+def ttl_for(key: str) -> float:
+    # Per-endpoint override, e.g. CACHE_TTL_PLANS=60 or CACHE_TTL_HERO_STATS=600
+    env_key = 'CACHE_TTL_' + key.upper().replace('-', '_')
+    return float(os.environ.get(env_key, DEFAULT_TTL))
+
+
+class _Entry:
+    __slots__ = ('value', 'version', 'expires_at', 'size')
+
+    def __init__(self, value, version, expires_at, size):
+        self.value = value
+        self.version = version
+        self.expires_at = expires_at
+        self.size = size
+
+
+class _Partition:
+    __slots__ = ('entries', 'bytes')
+
+    def __init__(self):
+        self.entries = OrderedDict()  # least recently used first
+        self.bytes = 0
+
+
+def _size(value) -> int:
+    return value.nbytes if hasattr(value, 'nbytes') else sys.getsizeof(value)
+
+
+def wake(loop, event):
+    """Set asyncio ``event`` belonging to ``loop`` from any thread.
+
+    Invalidation listeners run wherever ``invalidate()`` was called: a
+    worker thread (run_db), the loop itself, or a process without one.
+    """
+    if loop is None or event is None or loop.is_closed():
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        event.set()
+    else:
+        loop.call_soon_threadsafe(event.set)
+
+
+class CatalogCache:
+    """``store`` is an optional shared ``CacheStore``; ``encode``/``decode``
+    convert cached values to and from the bytes kept there."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, enabled: bool = CACHE_ENABLED,
+                 store=None, encode=None, decode=None, max_bytes: int = CACHE_MAX_BYTES,
+                 tenant_max_bytes: int = CACHE_TENANT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.tenant_max_bytes = tenant_max_bytes
+        self.enabled = enabled
+        self.version = 0
+        self._tenant_versions = {}
+        self.store = store
+        self._encode = encode
+        self._decode = decode
+        # Last change in the shared store applied here; None until known.
+        self.shared_version = None
+        # Version of the last change to each tenant (None: to all of them)
+        self._marks = {}
+        self._version_checked_at = float('-inf')
+        self._store_down_until = 0.0
+        # Tenants invalidated here but not yet logged in the store; shared
+        # entries are not read until the count drops back to zero.
+        self._unpublished = []
+        self._pending = 0
+        self._loop = None
+        self._publishing = set()
+        self.shared_hits = 0
+        self.shared_misses = 0
+        self.store_errors = 0
+        # Tenant -> _Partition, least recently used first
+        self._partitions = OrderedDict()
+        self.bytes = 0
+        self.stale_served = 0
+        self._inflight = {}
+        self._listeners = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.tenant_evictions = 0
+        self.oversize = 0
+        self.loads = 0
+        self.coalesced = 0
+        self.load_errors = 0
+
+    def version_of(self, tenant: str = DEFAULT_TENANT):
+        """The version ``tenant``'s entries must carry to be fresh; it only
+        ever increases."""
+        return (self.version, self._tenant_versions.get(tenant, 0))
+
+    async def get_or_load(self, key: str, loader, ttl: float = None, stale_on_error: bool = False,
+                          tenant: str = DEFAULT_TENANT):
+        """Return ``tenant``'s cached value for ``key``, calling ``loader`` on a miss.
+
+        Concurrent misses for the same key share a single ``loader`` call.
+        ``loader`` may be a plain callable or return an awaitable. With
+        ``stale_on_error`` a failing load returns the last value loaded for
+        ``key`` instead of raising, when there is one.
+        """
+        try:
+            return await self._get_or_load(tenant, key, loader, ttl)
+        except Exception as exc:
+            stale = self.peek_stale(key, tenant) if stale_on_error else None
+            if stale is None:
+                raise
+            self.stale_served += 1
+            logger.warning("Serving stale %s for tenant %s after load failure: %s", key, tenant, exc)
+            return stale
+
+    async def _get_or_load(self, tenant, key, loader, ttl):
+        if not self.enabled:
+            return await _call(loader)
+        if self.store is not None:
+            self._loop = asyncio.get_running_loop()
+            await self._sync_shared_version()
+
+        version = self.version_of(tenant)
+        entry = self._lookup(tenant, key)
+        if entry is not None and entry.version == version and entry.expires_at > time.monotonic():
+            self.hits += 1
+            return entry.value
+
+        self.misses += 1
+        flight_key = (tenant, key, version)
+        pending = self._inflight.get(flight_key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        ttl = ttl if ttl is not None else ttl_for(key)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[flight_key] = future
+        try:
+            value = await self._load(tenant, key, loader, ttl)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            self.load_errors += 1
+            future.set_exception(exc)
+            # Mark the exception as retrieved for the no-waiter case.
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(flight_key, None)
+
+        self.loads += 1
+        future.set_result(value)
+        # Stored even if invalidated meanwhile: it is still the newest copy to fall back on
+        self._store(tenant, key, value, version, ttl)
+        return value
+
+    async def _load(self, tenant, key, loader, ttl):
+        shared_key = None
+        mark = await self._mark_for(tenant) if self.store is not None else None
+        if mark is not None:
+            shared_key = self.store.entry_key(mark, f"{tenant}:{key}")
+            raw = await self._store_call(self.store.get(shared_key))
+            if raw is not None:
+                self.shared_hits += 1
+                return await asyncio.to_thread(self._decode, raw)
+            self.shared_misses += 1
+        value = await _call(loader)
+        if shared_key is not None:
+            await self._store_call(self.store.set(shared_key, self._encode(value), ttl))
+        return value
+
+    async def _store_call(self, command):
+        """Await a store command, returning None instead of raising while the
+        store is down so callers fall back to the loader."""
+        if time.monotonic() < self._store_down_until:
+            command.close()
+            return None
+        try:
+            return await asyncio.wait_for(command, CACHE_STORE_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            self.store_errors += 1
+            self._store_down_until = time.monotonic() + CACHE_STORE_RETRY_SECONDS
+            logger.warning("Shared cache store unavailable (%s: %s); serving from the database for %ss",
+                           exc.__class__.__name__, exc, CACHE_STORE_RETRY_SECONDS)
+            return None
+
+    async def _sync_shared_version(self):
+        now = time.monotonic()
+        if now - self._version_checked_at < CACHE_VERSION_CHECK_SECONDS:
+            return
+        # Claim the check before awaiting so concurrent requests don't all poll.
+        self._version_checked_at = now
+        if self._unpublished:
+            # An earlier invalidate() could not reach the store; deliver it first.
+            await self._publish_version()
+            return
+        version = await self._store_call(self.store.get_version())
+        if version is None or self._pending:
+            return
+        await self._catch_up(version)
+
+    async def _catch_up(self, version):
+        """Drop what the changes other workers logged up to ``version`` made
+        stale: only the tenants they name, everything where the log is gone."""
+        seen = self.shared_version
+        if seen is not None and version <= seen:
+            return
+        self.shared_version = version
+        if seen is None:
+            return
+        changes = None
+        if version - seen <= CACHE_CHANGE_LOG_BATCH:
+            changes = await self._store_call(self.store.get_changes(seen + 1, version))
+        if changes is None or None in changes or "*" in changes:
+            self._marks.clear()
+            self._bump_local()
+            return
+        for changed, tenant in enumerate(changes, seen + 1):
+            self._marks[tenant] = max(self._marks.get(tenant, 0), changed)
+        for tenant in set(changes):
+            self._bump_tenant(tenant)
+
+    async def _mark_for(self, tenant):
+        """The version ``tenant``'s shared entries are kept under, or None
+        while it is unknown or an invalidation is still being published."""
+        if self.shared_version is None or self._pending:
+            return None
+        if None not in self._marks or tenant not in self._marks:
+            marks = await self._store_call(self.store.get_marks(tenant))
+            if marks is None or self._pending:
+                return None
+            self._marks[None] = max(self._marks.get(None, 0), marks[0])
+            self._marks[tenant] = max(self._marks.get(tenant, 0), marks[1])
+        return max(self._marks[None], self._marks[tenant])
+
+    def _lookup(self, tenant, key):
+        partition = self._partitions.get(tenant)
+        entry = partition.entries.get(key) if partition is not None else None
+        if entry is not None:
+            partition.entries.move_to_end(key)
+            self._partitions.move_to_end(tenant)
+        return entry
+
+    def _store(self, tenant, key, value, version, ttl):
+        partition = self._partitions.get(tenant)
+        old = partition.entries.get(key) if partition is not None else None
+        if old is not None and old.version > version:
+            return  # a load for a newer version finished first
+        size = _size(value)
+        if size > self.tenant_max_bytes:
+            self.oversize += 1
+            return
+        if partition is None:
+            partition = self._partitions[tenant] = _Partition()
+        if old is not None:
+            partition.bytes -= old.size
+            self.bytes -= old.size
+        partition.entries[key] = _Entry(value, version, time.monotonic() + ttl, size)
+        partition.entries.move_to_end(key)
+        partition.bytes += size
+        self.bytes += size
+        self._partitions.move_to_end(tenant)
+        # A tenant over its own quota only evicts its own entries...
+        while partition.bytes > self.tenant_max_bytes or len(partition.entries) > self.max_entries:
+            self._evict_oldest(tenant, partition)
+        # ...and the overall budget takes from the least recently used tenants.
+        while self.bytes > self.max_bytes:
+            lru_tenant, lru_partition = next(iter(self._partitions.items()))
+            if lru_tenant == tenant:
+                break
+            self._evict_oldest(lru_tenant, lru_partition)
+
+    def _evict_oldest(self, tenant, partition):
+        _, entry = partition.entries.popitem(last=False)
+        partition.bytes -= entry.size
+        self.bytes -= entry.size
+        self.evictions += 1
+        if not partition.entries:
+            del self._partitions[tenant]
+            self.tenant_evictions += 1
+
+    def peek_stale(self, key: str, tenant: str = DEFAULT_TENANT):
+        """Return the most recently loaded value for ``key``, however old,
+        or None. Never loads and does not count as a hit or miss."""
+        partition = self._partitions.get(tenant)
+        entry = partition.entries.get(key) if partition is not None else None
+        return entry.value if entry is not None else None
+
+    def contains(self, key: str, tenant: str = DEFAULT_TENANT) -> bool:
+        """True if ``key`` has a fresh entry for the tenant's current version."""
+        partition = self._partitions.get(tenant)
+        entry = partition.entries.get(key) if partition is not None else None
+        return (entry is not None and entry.version == self.version_of(tenant)
+                and entry.expires_at > time.monotonic())
+
+    def invalidate(self, tenant: str = None):
+        """Bump ``tenant``'s version (every tenant's without one) so its
+        entries, and any load already in flight, are treated as stale, here
+        and (through the shared store) in every other worker.
+
+        Safe to call from a worker thread or from a process without a running
+        event loop such as ``manage.py``.
+        """
+        if tenant is None:
+            self._bump_local()
+        else:
+            self._bump_tenant(tenant)
+        if self.store is None:
+            return
+        # Stop reading shared entries until the change is logged.
+        self._unpublished.append(tenant)
+        self._pending += 1
+        self._store_down_until = 0.0
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        loop = self._loop if self._loop is not None and self._loop.is_running() else running
+        if loop is None:
+            asyncio.run(self._publish_version())
+        elif loop is running:
+            task = loop.create_task(self._publish_version())
+            self._publishing.add(task)
+            task.add_done_callback(self._publishing.discard)
+        else:
+            asyncio.run_coroutine_threadsafe(self._publish_version(), loop)
+
+    async def _publish_version(self):
+        while self._unpublished:
+            tenant = self._unpublished.pop(0)
+            version = await self._store_call(self.store.incr_version())
+            if version is None or await self._store_call(self.store.record_change(version, tenant)) is None:
+                # Logged under a fresh version on the next attempt; others
+                # treat the unlogged one as a change to every tenant.
+                self._unpublished.insert(0, tenant)
+                return
+            await self._catch_up(version - 1)
+            self.shared_version = max(self.shared_version, version)
+            self._marks[tenant] = version
+            self._pending -= 1
+            self._version_checked_at = time.monotonic()
+
+    def _bump_local(self):
+        self.version += 1
+        logger.info("Catalog cache invalidated (version %s)", self.version)
+        self._notify(None)
+
+    def _bump_tenant(self, tenant):
+        self._tenant_versions[tenant] = self._tenant_versions.get(tenant, 0) + 1
+        logger.info("Catalog cache invalidated for tenant %s", tenant)
+        self._notify(tenant)
+
+    def _notify(self, tenant):
+        for listener in self._listeners:
+            listener(self.version, tenant)
+
+    def on_invalidate(self, listener):
+        """Register ``listener(version, tenant)`` to be called after every
+        invalidation; ``tenant`` is None when every tenant was invalidated."""
+        self._listeners.append(listener)
+        return listener
+
+    def stats(self, tenant: str = None) -> dict:
+        lookups = self.hits + self.misses
+        partitions = list(self._partitions.items())
+        stats = {
+            "enabled": self.enabled,
+            "version": self.version,
+            "size": sum(len(partition.entries) for _, partition in partitions),
+            "max_entries": self.max_entries,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "tenant_max_bytes": self.tenant_max_bytes,
+            "tenants": len(partitions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "tenant_evictions": self.tenant_evictions,
+            "oversize": self.oversize,
+            "loads": self.loads,
+            "coalesced": self.coalesced,
+            "load_errors": self.load_errors,
+            "stale_served": self.stale_served,
+            "inflight": len(self._inflight),
+            "store": self.store.name if self.store is not None else None,
+            "shared_version": self.shared_version,
+            "shared_hits": self.shared_hits,
+            "shared_misses": self.shared_misses,
+            "store_errors": self.store_errors,
+        }
+        if tenant is not None:
+            partition = self._partitions.get(tenant)
+            stats["tenant"] = {"id": tenant, "version": list(self.version_of(tenant)),
+                               "bytes": partition.bytes if partition is not None else 0,
+                               "entries": len(partition.entries) if partition is not None else 0}
+        return stats
+
+    def largest_tenants(self, limit: int = 5) -> list:
+        """The tenants holding the most cache memory; names other tenants, so
+        only for admin endpoints."""
+        largest = sorted(self._partitions.items(), key=lambda item: item[1].bytes, reverse=True)[:limit]
+        return [{"tenant": name, "bytes": partition.bytes, "entries": len(partition.entries)}
+                for name, partition in largest]
+
+
+async def _call(loader):
+    value = loader()
+    if inspect.isawaitable(value):
+        value = await value
+    return value
+
+
+catalog_cache = CatalogCache(store=store_from_env(), encode=lambda payload: payload.body,
+                             decode=lambda body: Payload(body).precompress())
@@ -0,0 +1,331 @@
+"""Shared stores behind the catalog cache.
+
+A store holds encoded payload bytes under versioned keys
+(``apptelier:catalog:v<mark>:<tenant>:<key>``) plus a change counter. Every
+invalidation ``INCR``s the counter, logs which tenant it was for under
+``:change:<version>`` and records that version as the tenant's mark
+(``:mark:<tenant>``; ``:mark`` for a change to every tenant). A tenant's
+entries live under the newest of its own mark and the global one, so a
+change to one tenant retires only that tenant's keys, everywhere at once;
+workers polling the counter read the log to find out which tenants to drop
+locally. Old keys simply age out through their TTL.
+
+Without ``CACHE_STORE`` the cache runs with no shared store at all.
+``MemoryStore`` (``CACHE_STORE=memory``) keeps everything in the current
+process, which only helps a single worker and tests; it holds at most
+CACHE_MEMORY_STORE_MAX_ENTRIES entries and drops a tenant's old keys as soon
+as its mark moves on. ``RedisStore`` talks RESP to Redis or anything
+compatible with it (KeyDB, Dragonfly, Valkey) with a small built-in asyncio
+client, so no extra dependency is needed:
+
+    CACHE_STORE=redis CACHE_REDIS_URL=redis://cache:6379/0
+"""
+import abc
+import asyncio
+import os
+import time
+from typing import Optional
+from urllib.parse import urlparse, unquote
+
+CACHE_STORE = os.environ.get('CACHE_STORE', '').lower()
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+CACHE_REDIS_POOL_SIZE = int(os.environ.get('CACHE_REDIS_POOL_SIZE', '8'))
+CACHE_KEY_PREFIX = os.environ.get('CACHE_KEY_PREFIX', 'apptelier:catalog')
+# How long the change log remembers which tenant a version was for; a worker
+# that falls further behind than this treats the gap as a global change.
+CACHE_CHANGE_LOG_TTL = float(os.environ.get('CACHE_CHANGE_LOG_TTL_SECONDS', '3600'))
+CACHE_MEMORY_STORE_MAX_ENTRIES = int(os.environ.get('CACHE_MEMORY_STORE_MAX_ENTRIES', '1024'))
+
+
+class StoreError(Exception):
+    """The shared store could not complete a command."""
+
+
+class CacheStore(abc.ABC):
+    """Interface for the shared cache store; values are bytes. A subclass
+    missing any of the abstract methods cannot be instantiated."""
+    name = "store"
+
+    def __init__(self, prefix: str = CACHE_KEY_PREFIX):
+        self.prefix = prefix
+        self.version_key = prefix + ":version"
+
+    def entry_key(self, version: int, key: str) -> str:
+        return "%s:v%d:%s" % (self.prefix, version, key)
+
+    def mark_key(self, tenant: Optional[str]) -> str:
+        return self.prefix + ":mark" if tenant is None else "%s:mark:%s" % (self.prefix, tenant)
+
+    def change_key(self, version: int) -> str:
+        return "%s:change:%d" % (self.prefix, version)
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get_version(self) -> int:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def incr_version(self) -> int:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get_marks(self, tenant: str) -> tuple:
+        """The versions of the last change to every tenant and to ``tenant``."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def record_change(self, version: int, tenant: Optional[str]) -> int:
+        """Log ``version`` as a change to ``tenant`` (None: every tenant) and
+        return it."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def get_changes(self, first: int, last: int) -> list:
+        """The tenants changed by versions ``first``..``last``: ``"*"`` for a
+        global change and None where the log entry is gone."""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MemoryStore(CacheStore):
+    name = "memory"
+
+    def __init__(self, prefix: str = CACHE_KEY_PREFIX, max_entries: int = CACHE_MEMORY_STORE_MAX_ENTRIES):
+        super().__init__(prefix)
+        self.max_entries = max_entries
+        # Insertion ordered, so the first key is the oldest write
+        self._data = {}
+
+    def _live(self, key):
+        item = self._data.get(key)
+        if item is not None and item[1] is not None and item[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return item
+
+    async def get(self, key):
+        item = self._live(key)
+        return None if item is None else item[0]
+
+    async def set(self, key, value, ttl):
+        self._data.pop(key, None)
+        self._data[key] = (value, time.monotonic() + ttl)
+        while len(self._data) - (self.version_key in self._data) > self.max_entries:
+            oldest = next(name for name in self._data if name != self.version_key)
+            del self._data[oldest]
+
+    async def get_version(self):
+        item = self._live(self.version_key)
+        return 0 if item is None else item[0]
+
+    async def incr_version(self):
+        version = await self.get_version() + 1
+        self._data[self.version_key] = (version, None)
+        return version
+
+    async def get_marks(self, tenant):
+        marks = [self._live(self.mark_key(name)) for name in (None, tenant)]
+        return tuple(0 if item is None else item[0] for item in marks)
+
+    async def record_change(self, version, tenant):
+        self._data[self.change_key(version)] = ("*" if tenant is None else tenant,
+                                                time.monotonic() + CACHE_CHANGE_LOG_TTL)
+        self._data[self.mark_key(tenant)] = (version, None)
+        # Nothing reads the tenant's older entries again; drop them rather
+        # than waiting for them to expire.
+        entries = self.prefix + ":v"
+
+        def retired(key):
+            mark, _, rest = key[len(entries):].partition(":")
+            if not key.startswith(entries) or not mark.isdigit():
+                return False
+            return int(mark) < version and tenant in (None, rest.partition(":")[0])
+
+        self._data = {key: item for key, item in self._data.items() if not retired(key)}
+        return version
+
+    async def get_changes(self, first, last):
+        changes = []
+        for version in range(first, last + 1):
+            item = self._live(self.change_key(version))
+            changes.append(None if item is None else item[0])
+        return changes
+
+
+class RedisStore(CacheStore):
+    name = "redis"
+
+    def __init__(self, url: str = CACHE_REDIS_URL, pool_size: int = CACHE_REDIS_POOL_SIZE,
+                 prefix: str = CACHE_KEY_PREFIX):
+        super().__init__(prefix)
+        parsed = urlparse(url)
+        if parsed.scheme not in ("redis", "rediss"):
+            raise ValueError("CACHE_REDIS_URL must be a redis:// URL, got %r" % url)
+        if parsed.scheme == "rediss":
+            raise ValueError("TLS (rediss://) is not supported by the built-in client")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.pool_size = pool_size
+        self._idle = []
+        self._open = 0
+        self._waiters = None
+        self._loop = None
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        conn = (reader, writer)
+        try:
+            if self.password is not None:
+                auth = ("AUTH", self.username, self.password) if self.username else ("AUTH", self.password)
+                _check(await _roundtrip(conn, auth))
+            if self.db:
+                _check(await _roundtrip(conn, ("SELECT", self.db)))
+        except BaseException:
+            writer.close()
+            raise
+        return conn
+
+    async def _acquire(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Streams belong to the loop that opened them (e.g. manage.py's asyncio.run)
+            self._idle, self._open, self._loop = [], 0, loop
+            self._waiters = asyncio.Semaphore(self.pool_size)
+        await self._waiters.acquire()
+        if self._idle:
+            return self._idle.pop()
+        try:
+            conn = await self._connect()
+        except BaseException:
+            self._waiters.release()
+            raise
+        self._open += 1
+        return conn
+
+    def _release(self, conn, healthy):
+        if healthy:
+            self._idle.append(conn)
+        else:
+            self._open -= 1
+            conn[1].close()
+        self._waiters.release()
+
+    async def execute(self, *args):
+        """Send one command and return its decoded reply."""
+        try:
+            conn = await self._acquire()
+        except OSError as exc:
+            raise StoreError("connect to %s:%s failed: %s" % (self.host, self.port, exc)) from exc
+        healthy = False
+        try:
+            reply = await _roundtrip(conn, args)
+            healthy = True
+        except (OSError, asyncio.IncompleteReadError) as exc:
+            raise StoreError(str(exc) or exc.__class__.__name__) from exc
+        finally:
+            # A cancelled or failed command leaves the reply unread; drop the connection.
+            self._release(conn, healthy)
+        return _check(reply)
+
+    async def get(self, key):
+        return await self.execute("GET", key)
+
+    async def set(self, key, value, ttl):
+        await self.execute("SET", key, value, "PX", max(1, int(ttl * 1000)))
+
+    async def get_version(self):
+        value = await self.execute("GET", self.version_key)
+        return int(value) if value is not None else 0
+
+    async def incr_version(self):
+        return await self.execute("INCR", self.version_key)
+
+    async def get_marks(self, tenant):
+        marks = await self.execute("MGET", self.mark_key(None), self.mark_key(tenant))
+        return tuple(int(value) if value is not None else 0 for value in marks)
+
+    async def record_change(self, version, tenant):
+        await self.execute("SET", self.change_key(version), "*" if tenant is None else tenant,
+                           "PX", int(CACHE_CHANGE_LOG_TTL * 1000))
+        await self.execute("SET", self.mark_key(tenant), version)
+        return version
+
+    async def get_changes(self, first, last):
+        if last < first:
+            return []
+        values = await self.execute("MGET", *(self.change_key(version) for version in range(first, last + 1)))
+        return [value.decode() if value is not None else None for value in values]
+
+    async def close(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+            self._open -= 1
+
+
+def encode_command(args) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode()
+        elif isinstance(arg, int):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    """Decode one RESP2 reply; error replies are returned as ``StoreError``."""
+    line = await reader.readuntil(b"\r\n")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        return StoreError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if kind == b"*":
+        length = int(rest)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise StoreError("unexpected reply %r" % line)
+
+
+def _check(reply):
+    if isinstance(reply, StoreError):
+        raise reply
+    return reply
+
+
+async def _roundtrip(conn, args):
+    reader, writer = conn
+    writer.write(encode_command(args))
+    await writer.drain()
+    return await read_reply(reader)
+
+
+def store_from_env() -> Optional[CacheStore]:
+    if CACHE_STORE in ("", "none"):
+        return None
+    if CACHE_STORE == "redis":
+        return RedisStore()
+    if CACHE_STORE == "memory":
+        return MemoryStore()
+    raise ValueError("CACHE_STORE must be 'none', 'memory' or 'redis', got %r" % CACHE_STORE)
@@ -0,0 +1,132 @@
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+from models import DEFAULT_TENANT, SubscriptionPlan, PlanFeature, Service, Testimonial, HeroStat
+import schemas
+from payload import Payload
+import os
+import time
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to Pydantic serialization
+    orjson = None
+
+from metrics import record_serialize
+
+# Encode trusted catalog reads straight from SQL rows with orjson instead of
+# validating ORM objects through the response schemas. Output is byte-identical.
+FAST_SERIALIZATION = os.environ.get('FAST_SERIALIZATION', 'false').lower() in ('1', 'true', 'yes')
+
+
+# Every read is scoped to one tenant with an equality on tenant_id, the
+# leading column of each table's index, so its cost does not grow with the
+# number of tenants.
+
+def load_plans(db: Session, tenant_id: str = DEFAULT_TENANT):
+    # Two set-based queries regardless of plan count: one for the plans and
+    # one `IN (...)` query for all of their features, ordered by the relationship.
+    return (
+        db.query(SubscriptionPlan)
+        .options(selectinload(SubscriptionPlan.features.and_(PlanFeature.tenant_id == tenant_id)))
+        .filter(SubscriptionPlan.tenant_id == tenant_id)
+        .order_by(SubscriptionPlan.order_index, SubscriptionPlan.id)
+        .all()
+    )
+
+
+def load_services(db: Session, tenant_id: str = DEFAULT_TENANT):
+    return (db.query(Service).filter(Service.tenant_id == tenant_id)
+            .order_by(Service.order_index, Service.id).all())
+
+
+def load_testimonials(db: Session, tenant_id: str = DEFAULT_TENANT):
+    # Same order as the keyset pages in pagination.py
+    return (db.query(Testimonial).filter(Testimonial.tenant_id == tenant_id)
+            .order_by(Testimonial.created_at, Testimonial.id).all())
+
+
+def load_hero_stats(db: Session, tenant_id: str = DEFAULT_TENANT):
+    return (db.query(HeroStat).filter(HeroStat.tenant_id == tenant_id)
+            .order_by(HeroStat.order_index, HeroStat.id).all())
+
+
+# Cache key -> (loader, response schema). Rows are validated into schema
+# objects, so nothing bound to a Session outlives the request.
+CATALOG = {
+    "plans": (load_plans, schemas.SubscriptionPlan),
+    "services": (load_services, schemas.Service),
+    "testimonials": (load_testimonials, schemas.Testimonial),
+    "hero_stats": (load_hero_stats, schemas.HeroStat),
+}
+
+
+def read_section(db: Session, key: str, tenant_id: str = DEFAULT_TENANT):
+    loader, schema = CATALOG[key]
+    return [schema.model_validate(row) for row in loader(db, tenant_id)]
+
+
+def read_payload(db: Session, key: str, tenant_id: str = DEFAULT_TENANT) -> Payload:
+    # Compress here, off the event loop, so requests only pick a variant.
+    if FAST_SERIALIZATION and orjson is not None:
+        return read_payload_fast(db, key, tenant_id).precompress()
+    return Payload.from_models(CATALOG[key][1], read_section(db, key, tenant_id)).precompress()
+
+
+def _fields(schema, model, exclude=()):
+    # Select columns in schema field order so rows zip straight into dicts
+    # whose key order matches what Pydantic would emit.
+    names = [name for name in schema.model_fields if name not in exclude]
+    return names, [getattr(model, name) for name in names]
+
+
+# Cache key -> (model, schema, ORDER BY) for the flat sections; must order
+# the same way as the ORM loaders above.
+_FLAT_SECTIONS = {
+    "services": (Service, schemas.Service, (Service.order_index, Service.id)),
+    "testimonials": (Testimonial, schemas.Testimonial, (Testimonial.created_at, Testimonial.id)),
+    "hero_stats": (HeroStat, schemas.HeroStat, (HeroStat.order_index, HeroStat.id)),
+}
+
+
+def _plan_records(db: Session, tenant_id: str = DEFAULT_TENANT):
+    plan_names, plan_columns = _fields(schemas.SubscriptionPlan, SubscriptionPlan, exclude=("features",))
+    feature_names, feature_columns = _fields(schemas.PlanFeature, PlanFeature)
+    features_at = list(schemas.SubscriptionPlan.model_fields).index("features")
+    plan_id_at = feature_names.index("plan_id")
+
+    plans = db.execute(
+        select(*plan_columns)
+        .where(SubscriptionPlan.tenant_id == tenant_id)
+        .order_by(SubscriptionPlan.order_index, SubscriptionPlan.id)
+    ).all()
+    features_by_plan = {row[plan_names.index("id")]: [] for row in plans}
+    if features_by_plan:
+        rows = db.execute(
+            select(*feature_columns)
+            .where(PlanFeature.tenant_id == tenant_id, PlanFeature.plan_id.in_(list(features_by_plan)))
+            # Per-plan order as the relationship, read off ix_plan_features_tenant_plan_order without a sort
+            .order_by(PlanFeature.plan_id, PlanFeature.order_index, PlanFeature.id)
+        )
+        for row in rows:
+            features_by_plan[row[plan_id_at]].append(dict(zip(feature_names, row)))
+
+    names = plan_names[:features_at] + ["features"] + plan_names[features_at:]
+    id_at = plan_names.index("id")
+    return [
+        dict(zip(names, (*row[:features_at], features_by_plan[row[id_at]], *row[features_at:])))
+        for row in plans
+    ]
+
+
+def read_payload_fast(db: Session, key: str, tenant_id: str = DEFAULT_TENANT) -> Payload:
+    if key == "plans":
+        records = _plan_records(db, tenant_id)
+    else:
+        model, schema, order_by = _FLAT_SECTIONS[key]
+        names, columns = _fields(schema, model)
+        query = select(*columns).where(model.tenant_id == tenant_id).order_by(*order_by)
+        records = [dict(zip(names, row)) for row in db.execute(query)]
+    start = time.perf_counter()
+    payload = Payload(orjson.dumps(records))
+    record_serialize(time.perf_counter() - start)
+    return payload
@@ -0,0 +1,404 @@
+"""Immutable in-memory copies of each tenant's catalog.
+
+``load_snapshot`` reads every section of one tenant with plain column selects
+(no ORM objects or identity map) into named tuples in response-schema field
+order, with each plan's features already grouped onto it as a tuple.
+Repeated short strings (periods, icons, plan ids on features...) are shared,
+so the copy stays small.
+
+``SnapshotHolder`` keeps a snapshot per tenant and replaces one by swapping a
+reference, so readers never see a half-built catalog. Each snapshot is tagged
+with the tenant's cache version it was loaded for: ``get(tenant)`` reloads
+(single-flight per tenant) whenever ``catalog_cache`` has been invalidated
+for that tenant since. A background task reloads the resident snapshots of
+the tenants an invalidation named right after it; a global invalidation only
+retags, so each tenant reloads on its next read rather than all at once. To
+pick up edits made outside the API, a read of a snapshot last checked more
+than CATALOG_SNAPSHOT_REFRESH_SECONDS ago re-reads that one tenant in the
+background, so idle tenants never cost a query. Payloads are then encoded
+from the snapshot without touching MySQL.
+
+Like the cache, memory is bounded per tenant and overall: the least recently
+used tenants' snapshots are dropped past CATALOG_SNAPSHOT_MAX_BYTES, and a
+tenant whose catalog alone exceeds CATALOG_SNAPSHOT_TENANT_MAX_BYTES is not
+kept at all; ``oversize(tenant)`` tells callers to read it from the database
+instead until its catalog next changes.
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict, namedtuple
+from types import MappingProxyType
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import schemas
+from cache import catalog_cache, wake
+from catalog import FAST_SERIALIZATION, orjson, _fields, _FLAT_SECTIONS
+from database import run_db
+from models import DEFAULT_TENANT, SubscriptionPlan, PlanFeature
+from payload import Payload
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CATALOG_SNAPSHOT = os.environ.get('CATALOG_SNAPSHOT', 'true').lower() in ('1', 'true', 'yes')
+CATALOG_SNAPSHOT_REFRESH_SECONDS = float(os.environ.get('CATALOG_SNAPSHOT_REFRESH_SECONDS', '300'))
+CATALOG_SNAPSHOT_MAX_BYTES = int(os.environ.get('CATALOG_SNAPSHOT_MAX_BYTES', str(512 * 1024 * 1024)))
+CATALOG_SNAPSHOT_TENANT_MAX_BYTES = int(os.environ.get('CATALOG_SNAPSHOT_TENANT_MAX_BYTES',
+                                                       str(128 * 1024 * 1024)))
+
+PlanRecord = namedtuple("PlanRecord", list(schemas.SubscriptionPlan.model_fields))
+FeatureRecord = namedtuple("FeatureRecord", list(schemas.PlanFeature.model_fields))
+ServiceRecord = namedtuple("ServiceRecord", list(schemas.Service.model_fields))
+TestimonialRecord = namedtuple("TestimonialRecord", list(schemas.Testimonial.model_fields))
+HeroStatRecord = namedtuple("HeroStatRecord", list(schemas.HeroStat.model_fields))
+
+_RECORDS = {
+    "services": ServiceRecord,
+    "testimonials": TestimonialRecord,
+    "hero_stats": HeroStatRecord,
+}
+_SCHEMAS = {
+    "plans": schemas.SubscriptionPlan,
+    "services": schemas.Service,
+    "testimonials": schemas.Testimonial,
+    "hero_stats": schemas.HeroStat,
+}
+
+
+class CatalogSnapshot:
+    __slots__ = ("tenant_id", "version", "sections", "features_by_plan", "loaded_at", "load_seconds",
+                 "size_bytes")
+
+    def __init__(self, tenant_id, version, sections, features_by_plan, load_seconds=0.0):
+        self.tenant_id = tenant_id
+        self.version = version
+        self.sections = MappingProxyType(sections)
+        self.features_by_plan = MappingProxyType(features_by_plan)
+        self.loaded_at = time.time()
+        self.load_seconds = load_seconds
+        self.size_bytes = _deep_size((sections, features_by_plan))
+
+    def retag(self, version) -> "CatalogSnapshot":
+        """Return the same data tagged with another cache version."""
+        copy = object.__new__(CatalogSnapshot)
+        for name in CatalogSnapshot.__slots__:
+            object.__setattr__(copy, name, version if name == "version" else getattr(self, name))
+        return copy
+
+    def __setattr__(self, name, value):
+        if hasattr(self, "size_bytes"):
+            raise AttributeError("CatalogSnapshot is immutable")
+        object.__setattr__(self, name, value)
+
+    def stats(self) -> dict:
+        return {
+            "tenant": self.tenant_id,
+            "version": list(self.version),
+            "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.loaded_at)),
+            "load_ms": round(self.load_seconds * 1000, 2),
+            "size_bytes": self.size_bytes,
+            "rows": {key: len(records) for key, records in self.sections.items()},
+            "features": sum(len(features) for features in self.features_by_plan.values()),
+        }
+
+
+def _deep_size(obj, seen=None) -> int:
+    """Approximate bytes held by ``obj`` and everything it references."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (tuple, list)):
+        size += sum(_deep_size(item, seen) for item in obj)
+    return size
+
+
+def _interner():
+    # Share one object per distinct short string across the whole snapshot.
+    pool = {}
+
+    def intern(value):
+        if isinstance(value, str) and len(value) <= 64:
+            return pool.setdefault(value, value)
+        return value
+    return intern
+
+
+def load_snapshot(db: Session, tenant_id: str, version) -> CatalogSnapshot:
+    start = time.perf_counter()
+    intern = _interner()
+
+    plan_names, plan_columns = _fields(schemas.SubscriptionPlan, SubscriptionPlan, exclude=("features",))
+    feature_names, feature_columns = _fields(schemas.PlanFeature, PlanFeature)
+    plan_rows = db.execute(
+        select(*plan_columns)
+        .where(SubscriptionPlan.tenant_id == tenant_id)
+        .order_by(SubscriptionPlan.order_index, SubscriptionPlan.id)
+    ).all()
+    id_at = plan_names.index("id")
+    plan_ids = {row[id_at]: intern(row[id_at]) for row in plan_rows}
+
+    grouped = {plan_id: [] for plan_id in plan_ids.values()}
+    if grouped:
+        feature_rows = db.execute(
+            select(*feature_columns)
+            .where(PlanFeature.tenant_id == tenant_id, PlanFeature.plan_id.in_(list(grouped)))
+            .order_by(PlanFeature.plan_id, PlanFeature.order_index, PlanFeature.id)
+        )
+        plan_id_at = feature_names.index("plan_id")
+        for row in feature_rows:
+            values = [intern(value) for value in row]
+            values[plan_id_at] = plan_ids[row[plan_id_at]]
+            grouped[values[plan_id_at]].append(FeatureRecord(*values))
+    features_by_plan = {plan_id: tuple(features) for plan_id, features in grouped.items()}
+
+    plans = []
+    for row in plan_rows:
+        values = dict(zip(plan_names, (intern(value) for value in row)))
+        values["id"] = plan_ids[row[id_at]]
+        plans.append(PlanRecord(features=features_by_plan[values["id"]], **values))
+    sections = {"plans": tuple(plans)}
+
+    for key, (model, schema, order_by) in _FLAT_SECTIONS.items():
+        names, columns = _fields(schema, model)
+        record = _RECORDS[key]
+        sections[key] = tuple(
+            record(*(intern(value) for value in row))
+            for row in db.execute(select(*columns).where(model.tenant_id == tenant_id).order_by(*order_by))
+        )
+    return CatalogSnapshot(tenant_id, version, sections, features_by_plan, time.perf_counter() - start)
+
+
+def _plain(records, key):
+    if key == "plans":
+        return [{**plan._asdict(), "features": [feature._asdict() for feature in plan.features]}
+                for plan in records]
+    return [record._asdict() for record in records]
+
+
+def snapshot_payload(snapshot: CatalogSnapshot, key: str) -> Payload:
+    """Encode one section exactly as its endpoint's response schema would."""
+    rows = _plain(snapshot.sections[key], key)
+    if FAST_SERIALIZATION and orjson is not None:
+        start = time.perf_counter()
+        payload = Payload(orjson.dumps(rows))
+        metrics.record_serialize(time.perf_counter() - start)
+    else:
+        schema = _SCHEMAS[key]
+        payload = Payload.from_models(schema, [schema.model_validate(row) for row in rows])
+    return payload.precompress()
+
+
+class SnapshotHolder:
+    def __init__(self, refresh_seconds: float = CATALOG_SNAPSHOT_REFRESH_SECONDS,
+                 max_bytes: int = CATALOG_SNAPSHOT_MAX_BYTES,
+                 tenant_max_bytes: int = CATALOG_SNAPSHOT_TENANT_MAX_BYTES):
+        self.refresh_seconds = refresh_seconds
+        self.max_bytes = max_bytes
+        self.tenant_max_bytes = tenant_max_bytes
+        self.snapshots = OrderedDict()  # tenant -> snapshot, least recently used first
+        self.bytes = 0
+        self.loads = 0
+        self.swaps = 0
+        self.evictions = 0
+        self.load_errors = 0
+        # Tenant -> version its catalog was found too large at
+        self._oversize = {}
+        self._pending = {}
+        # Tenants invalidated since the refresher last ran
+        self._dirty = set()
+        # Tenant -> time.monotonic() its resident snapshot was last compared to the database
+        self._checked_at = {}
+        self._checks = set()
+        self._changed = None
+        self._loop = None
+        self._task = None
+        self._listeners = []
+        catalog_cache.on_invalidate(self._on_invalidate)
+
+    def peek(self, tenant: str = DEFAULT_TENANT):
+        """The tenant's resident snapshot, however old, or None."""
+        return self.snapshots.get(tenant)
+
+    def oversize(self, tenant: str = DEFAULT_TENANT) -> bool:
+        """True while the tenant's current catalog is too large to keep."""
+        return self._oversize.get(tenant) == catalog_cache.version_of(tenant)
+
+    async def get(self, tenant: str = DEFAULT_TENANT) -> CatalogSnapshot:
+        snapshot = self.snapshots.get(tenant)
+        if snapshot is not None and snapshot.version >= catalog_cache.version_of(tenant):
+            self.snapshots.move_to_end(tenant)
+            self._maybe_check(tenant)
+            return snapshot
+        return await self.reload(tenant)
+
+    def _maybe_check(self, tenant):
+        now = time.monotonic()
+        if self._loop is None or now - self._checked_at.get(tenant, now) < self.refresh_seconds:
+            return
+        self._checked_at[tenant] = now
+        task = self._loop.create_task(self._check_logged(tenant))
+        self._checks.add(task)
+        task.add_done_callback(self._checks.discard)
+
+    async def reload(self, tenant: str = DEFAULT_TENANT) -> CatalogSnapshot:
+        """Load a new snapshot, sharing one load between concurrent callers."""
+        pending = self._pending.get(tenant)
+        if pending is None:
+            pending = self._pending[tenant] = asyncio.ensure_future(self._load(tenant))
+            pending.add_done_callback(lambda future: self._clear_pending(tenant, future))
+        return await asyncio.shield(pending)
+
+    def _clear_pending(self, tenant, future):
+        if self._pending.get(tenant) is future:
+            del self._pending[tenant]
+
+    async def _load(self, tenant) -> CatalogSnapshot:
+        # Tag with the version from before the read: an invalidation that
+        # lands mid-load leaves this snapshot older than the cache, so the
+        # next get() loads again.
+        version = catalog_cache.version_of(tenant)
+        try:
+            snapshot = await run_db(load_snapshot, tenant, version)
+        except Exception:
+            self.load_errors += 1
+            raise
+        self.loads += 1
+        self._swap(snapshot)
+        current = self.snapshots.get(tenant)
+        return current if current is not None and current.version >= snapshot.version else snapshot
+
+    def _swap(self, snapshot):
+        tenant = snapshot.tenant_id
+        previous = self.snapshots.get(tenant)
+        if previous is not None and snapshot.version < previous.version:
+            return
+        if previous is not None:
+            del self.snapshots[tenant]
+            self.bytes -= previous.size_bytes
+        if snapshot.size_bytes > self.tenant_max_bytes:
+            if tenant not in self._oversize:
+                logger.warning("Catalog of tenant %s (%d bytes) is over CATALOG_SNAPSHOT_TENANT_MAX_BYTES; "
+                               "serving it from the database", tenant, snapshot.size_bytes)
+            self._oversize[tenant] = snapshot.version
+        else:
+            self._oversize.pop(tenant, None)
+            self.snapshots[tenant] = snapshot
+            self.bytes += snapshot.size_bytes
+            self._checked_at[tenant] = time.monotonic()
+            while self.bytes > self.max_bytes and len(self.snapshots) > 1:
+                evicted_tenant, evicted = self.snapshots.popitem(last=False)
+                self._checked_at.pop(evicted_tenant, None)
+                self.bytes -= evicted.size_bytes
+                self.evictions += 1
+        self.swaps += 1
+        for listener in self._listeners:
+            listener(snapshot)
+
+    def on_swap(self, listener):
+        """Register ``listener(snapshot)``, called on the event loop after every swap."""
+        self._listeners.append(listener)
+        return listener
+
+    def _on_invalidate(self, version, tenant):
+        if tenant is None:
+            return
+        self._dirty.add(tenant)
+        wake(self._loop, self._changed)
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        for task in list(self._checks):
+            task.cancel()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._loop = None
+
+    async def _refresh_loop(self):
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            dirty, self._dirty = self._dirty, set()
+            for tenant in [tenant for tenant in dirty if tenant in self.snapshots]:
+                try:
+                    await self.get(tenant)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("Catalog snapshot refresh failed for tenant %s: %s", tenant, e)
+
+    async def _check_logged(self, tenant):
+        try:
+            await self._check_for_changes(tenant)
+        except Exception as e:
+            logger.warning("Catalog snapshot check failed for tenant %s: %s", tenant, e)
+
+    async def _check_for_changes(self, tenant):
+        # Re-read for edits that bypassed the API (manual SQL, another
+        # deploy's seed without a shared cache store).
+        previous = self.snapshots.get(tenant)
+        snapshot = await run_db(load_snapshot, tenant, catalog_cache.version_of(tenant))
+        self.loads += 1
+        if previous is None:
+            self._swap(snapshot)
+            return
+        if snapshot.sections == previous.sections:
+            return
+        # Swap first, tagged for the version invalidate() is about to create,
+        # so cached payloads rebuild from this snapshot without another load.
+        version, tenant_version = catalog_cache.version_of(tenant)
+        self._swap(snapshot.retag((version, tenant_version + 1)))
+        logger.info("Catalog of tenant %s changed outside the API; invalidating cached payloads", tenant)
+        catalog_cache.invalidate(tenant)
+
+    def stats(self, tenant: str = None) -> dict:
+        stats = {
+            "enabled": CATALOG_SNAPSHOT,
+            "loads": self.loads,
+            "swaps": self.swaps,
+            "load_errors": self.load_errors,
+            "evictions": self.evictions,
+            "tenants": len(self.snapshots),
+            "oversize_tenants": len(self._oversize),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "tenant_max_bytes": self.tenant_max_bytes,
+        }
+        if tenant is not None:
+            current = self.snapshots.get(tenant)
+            stats["current"] = current.stats() if current is not None else None
+            stats["oversize"] = self.oversize(tenant)
+        return stats
+
+
+catalog_snapshot = SnapshotHolder()
+
+
+@metrics.register_collector
+def snapshot_metric_lines():
+    lines = metrics.gauge_lines("apptelier_catalog_snapshot_bytes", "Approximate memory held by catalog snapshots.",
+                                [({}, catalog_snapshot.bytes)])
+    lines.extend(metrics.gauge_lines("apptelier_catalog_snapshot_tenants", "Tenants with a resident catalog snapshot.",
+                                     [({}, len(catalog_snapshot.snapshots))]))
+    for key in ("loads", "swaps", "evictions", "load_errors"):
+        lines.extend(metrics.gauge_lines(f"apptelier_catalog_snapshot_{key}_total",
+                                         f"Catalog snapshot {key.replace('_', ' ')}.",
+                                         [({}, getattr(catalog_snapshot, key))], "counter"))
+    return lines
@@ -0,0 +1,302 @@
+"""Server-Sent Events feed of catalog changes (``GET /api/changes``).
+
+Every catalog state has an id: a digest of its sections' contents, so all
+workers reading the same database agree on it and a client can resume on
+any of them. Each tenant with open streams has its own feed; when the
+tenant's catalog is invalidated or its snapshot swapped (see
+catalog_snapshot.py) and the content changed, the feed diffs it against the
+previous state and publishes one ``change`` event listing the sections that
+changed and the ids added, updated or removed in each. The last
+CHANGES_BUFFER_SIZE events are kept, so a client reconnecting with
+``Last-Event-ID`` gets exactly the events it missed; one whose id is unknown
+(too old, or a state this worker never saw) gets a ``state`` event with
+``"reset": true`` and should refetch. A feed is dropped once it has had no
+clients for CHANGES_IDLE_SECONDS.
+
+Fan-out costs nothing per idle client. Published items form a chain of
+futures, each resolving to ``(frame, next_future)``: a stream awaits the
+future it holds, writes the frame and moves on to the next one, so a slow
+client never misses an event and no per-client timer or queue exists. One
+task publishes the changes of every tenant and the
+CHANGES_HEARTBEAT_SECONDS keepalive comments that stop proxies from closing
+idle connections.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import deque, namedtuple
+
+from cache import catalog_cache, wake
+from catalog_snapshot import catalog_snapshot
+from models import DEFAULT_TENANT
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CHANGES_FEED = os.environ.get('CHANGES_FEED', 'true').lower() in ('1', 'true', 'yes')
+CHANGES_BUFFER_SIZE = int(os.environ.get('CHANGES_BUFFER_SIZE', '256'))
+CHANGES_HEARTBEAT_SECONDS = float(os.environ.get('CHANGES_HEARTBEAT_SECONDS', '15'))
+CHANGES_MAX_CLIENTS = int(os.environ.get('CHANGES_MAX_CLIENTS', '10000'))
+CHANGES_RETRY_MS = int(os.environ.get('CHANGES_RETRY_MS', '3000'))
+CHANGES_IDLE_SECONDS = float(os.environ.get('CHANGES_IDLE_SECONDS', '300'))
+
+SECTIONS = ("hero_stats", "services", "plans", "testimonials")
+# Beyond this many ids a section's diff only says it changed
+MAX_DIFF_IDS = 100
+HEARTBEAT = b": keepalive\n\n"
+
+CatalogState = namedtuple("CatalogState", "id digests sections")
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def catalog_state(snapshot, previous=None) -> CatalogState:
+    """Digest every section of ``snapshot``, reusing ``previous`` digests for
+    sections whose records are unchanged."""
+    digests = {}
+    for key in SECTIONS:
+        records = snapshot.sections[key]
+        if previous is not None and previous.sections[key] == records:
+            digests[key] = previous.digests[key]
+        else:
+            digests[key] = _digest(repr(records).encode())
+    state_id = _digest(",".join(digests[key] for key in SECTIONS).encode())
+    return CatalogState(state_id, digests, snapshot.sections)
+
+
+def diff_section(before, after) -> dict:
+    old = {record.id: record for record in before}
+    new = {record.id: record for record in after}
+    diff = {
+        "added": [record_id for record_id in new if record_id not in old],
+        "updated": [record_id for record_id, record in new.items() if record_id in old and old[record_id] != record],
+        "removed": [record_id for record_id in old if record_id not in new],
+    }
+    if sum(len(ids) for ids in diff.values()) > MAX_DIFF_IDS:
+        return {"truncated": True}
+    return diff
+
+
+def _frame(event: str, event_id: str, data: dict) -> bytes:
+    body = json.dumps(data, separators=(",", ":"))
+    return f"id: {event_id}\nevent: {event}\ndata: {body}\n\n".encode()
+
+
+def change_frame(previous: CatalogState, state: CatalogState) -> bytes:
+    changed = {key: diff_section(previous.sections[key], state.sections[key])
+               for key in SECTIONS if previous.digests[key] != state.digests[key]}
+    return _frame("change", state.id, {"id": state.id, "previous": previous.id,
+                                       "sections": state.digests, "changed": changed})
+
+
+def state_frame(state: CatalogState, reset: bool) -> bytes:
+    return _frame("state", state.id, {"id": state.id, "sections": state.digests, "reset": reset})
+
+
+class TenantFeed:
+    def __init__(self, tenant, buffer_size):
+        self.tenant = tenant
+        self.state = None
+        self.version = None  # of the snapshot ``state`` was taken from
+        self.events = deque(maxlen=buffer_size)  # (state id, frame or None for the first state)
+        self.clients = 0
+        self.idle_since = time.monotonic()
+        self.tail = asyncio.get_running_loop().create_future()
+        self.lock = asyncio.Lock()
+
+    def publish(self, frame):
+        tail = self.tail
+        self.tail = asyncio.get_running_loop().create_future()
+        tail.set_result((frame, self.tail))
+
+
+class ChangeFeed:
+    def __init__(self, buffer_size: int = CHANGES_BUFFER_SIZE, heartbeat: float = CHANGES_HEARTBEAT_SECONDS,
+                 max_clients: int = CHANGES_MAX_CLIENTS, idle_seconds: float = CHANGES_IDLE_SECONDS):
+        self.buffer_size = buffer_size
+        self.heartbeat = heartbeat
+        self.max_clients = max_clients
+        self.idle_seconds = idle_seconds
+        self.feeds = {}
+        self.clients = 0
+        self.published = 0
+        self.resumed = 0
+        self.resets = 0
+        # Tenants whose catalog may have changed; None means all
+        self._dirty = set()
+        self._loop = None
+        self._changed = None
+        self._task = None
+        catalog_snapshot.on_swap(self._on_swap)
+        catalog_cache.on_invalidate(self._on_invalidate)
+
+    def _on_swap(self, snapshot):
+        if snapshot.tenant_id in self.feeds:
+            self._dirty.add(snapshot.tenant_id)
+            wake(self._loop, self._changed)
+
+    def _on_invalidate(self, version, tenant):
+        # The snapshot refresher may not reload this tenant (evicted, too
+        # large to keep), so the feed asks for the new catalog itself.
+        self._dirty.add(tenant)
+        wake(self._loop, self._changed)
+
+    def _feed(self, tenant) -> TenantFeed:
+        feed = self.feeds.get(tenant)
+        if feed is None:
+            feed = self.feeds[tenant] = TenantFeed(tenant, self.buffer_size)
+        return feed
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Ends every open stream, so shutdown does not wait on idle clients
+        for feed in list(self.feeds.values()):
+            feed.publish(None)
+        self.feeds.clear()
+
+    async def _run(self):
+        next_beat = time.monotonic() + self.heartbeat
+        while True:
+            try:
+                await asyncio.wait_for(self._changed.wait(), max(next_beat - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                pass
+            if time.monotonic() >= next_beat:
+                next_beat = time.monotonic() + self.heartbeat
+                self._beat()
+            if not self._changed.is_set():
+                continue
+            self._changed.clear()
+            dirty, self._dirty = self._dirty, set()
+            for tenant in [tenant for tenant in self.feeds if None in dirty or tenant in dirty]:
+                try:
+                    await self._advance(await catalog_snapshot.get(tenant))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("Change feed update failed for tenant %s: %s", tenant, e)
+
+    def _beat(self):
+        now = time.monotonic()
+        for tenant, feed in list(self.feeds.items()):
+            if feed.clients:
+                feed.publish(HEARTBEAT)
+            elif now - feed.idle_since > self.idle_seconds:
+                del self.feeds[tenant]
+
+    async def _advance(self, snapshot):
+        feed = self._feed(snapshot.tenant_id)
+        async with feed.lock:
+            previous = feed.state
+            if feed.version is not None and snapshot.version < feed.version:
+                return
+            if previous is not None and snapshot.sections is previous.sections:
+                feed.version = snapshot.version
+                return
+            state = await asyncio.to_thread(catalog_state, snapshot, previous)
+            if previous is None:
+                # Recorded so clients that saw the first state can resume from it
+                feed.events.append((state.id, None))
+            elif state.id != previous.id:
+                frame = await asyncio.to_thread(change_frame, previous, state)
+                feed.events.append((state.id, frame))
+                self.published += 1
+                feed.publish(frame)
+            feed.state = state
+            feed.version = snapshot.version
+
+    async def current(self, tenant: str = DEFAULT_TENANT) -> CatalogState:
+        feed = self._feed(tenant)
+        if feed.state is None or feed.version < catalog_cache.version_of(tenant):
+            await self._advance(await catalog_snapshot.get(tenant))
+        return feed.state
+
+    def full(self) -> bool:
+        return self.clients >= self.max_clients
+
+    def _catch_up(self, feed, last_event_id, state):
+        if last_event_id == state.id:
+            return []
+        if last_event_id:
+            ids = [event_id for event_id, _ in feed.events]
+            # Search from the newest: a reverted catalog repeats an older id
+            for at in range(len(ids) - 1, -1, -1):
+                if ids[at] == last_event_id:
+                    self.resumed += 1
+                    return [frame for _, frame in list(feed.events)[at + 1:] if frame is not None]
+            self.resets += 1
+        return [state_frame(state, reset=bool(last_event_id))]
+
+    async def stream(self, last_event_id=None, tenant: str = DEFAULT_TENANT):
+        """Yield SSE frames of ``tenant``'s catalog until the client
+        disconnects or the feed stops."""
+        feed = self._feed(tenant)
+        # Counted before the first await, so the feed is not dropped as idle meanwhile
+        feed.clients += 1
+        self.clients += 1
+        try:
+            state = await self.current(tenant)
+            # Taken in the same step as the catch-up, so nothing falls in between
+            waiter = feed.tail
+            frames = self._catch_up(feed, last_event_id, state)
+            yield f"retry: {CHANGES_RETRY_MS}\n\n".encode()
+            for frame in frames:
+                yield frame
+            while True:
+                # Shielded: a disconnect cancels this stream, never the shared future
+                frame, waiter = await asyncio.shield(waiter)
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            feed.clients -= 1
+            self.clients -= 1
+            feed.idle_since = time.monotonic()
+
+    def stats(self, tenant: str = None) -> dict:
+        stats = {
+            "clients": self.clients,
+            "tenants": len(self.feeds),
+            "published": self.published,
+            "resumed": self.resumed,
+            "resets": self.resets,
+        }
+        if tenant is not None:
+            feed = self.feeds.get(tenant)
+            stats["tenant"] = {
+                "id": tenant,
+                "state": feed.state.id if feed is not None and feed.state is not None else None,
+                "clients": feed.clients if feed is not None else 0,
+                "buffered": len(feed.events) if feed is not None else 0,
+            }
+        return stats
+
+
+change_feed = ChangeFeed()
+
+
+@metrics.register_collector
+def change_feed_metric_lines():
+    lines = metrics.gauge_lines("apptelier_changes_clients", "Open /api/changes streams.",
+                                [({}, change_feed.clients)])
+    lines.extend(metrics.gauge_lines("apptelier_changes_tenants", "Tenants with an active change feed.",
+                                     [({}, len(change_feed.feeds))]))
+    lines.extend(metrics.gauge_lines("apptelier_changes_published_total", "Catalog change events published.",
+                                     [({}, change_feed.published)], "counter"))
+    return lines
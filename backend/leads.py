@@ -0,0 +1,325 @@
+"""Lead capture with batched, failure-tolerant persistence.
+
+``POST /api/leads`` only validates and enqueues; ``LeadWriter`` drains the
+queue in a background task and writes up to LEAD_BATCH_SIZE rows per
+transaction, flushing at the latest LEAD_FLUSH_SECONDS after the first lead
+of a batch arrived. A spike of submissions therefore becomes a few bulk
+inserts instead of one transaction per lead.
+
+If a batch cannot be written, it is appended (and fsynced) to the NDJSON
+spill file at LEAD_SPILL_PATH and replayed every LEAD_REPLAY_SECONDS until
+the database accepts it. Inserts ignore duplicate ids, so replaying a
+partially written file is safe. Every worker shares the spill file: appends
+and the move aside for replay hold ``<spill>.lock``, and only the worker
+holding ``<spill>.replay.lock`` replays, so two workers never replay the
+same file.
+
+Once written (directly or by a replay), leads are also POSTed one by one to
+LEAD_FORWARD_URL when set, as the form fields the WordPress contact handler
+(``apptelier-contact.php``) expects, so its notification emails keep going
+out. A failed forward is logged with the lead id; the lead itself is safe in
+the database.
+
+The writer task survives errors in a batch. Should it stop all the same,
+``submit`` refuses leads (the API answers 503) instead of queueing rows
+nothing will write.
+"""
+import asyncio
+import json
+import logging
+import os
+import urllib.request
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlencode
+
+try:
+    import fcntl
+except ImportError:  # optional: without it (Windows) run a single worker
+    fcntl = None
+
+from database import run_db
+from models import Lead
+from ratelimit import TokenBucketLimiter
+from seed_data import bulk_insert
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LEAD_QUEUE_MAX = int(os.environ.get('LEAD_QUEUE_MAX', '10000'))
+LEAD_BATCH_SIZE = int(os.environ.get('LEAD_BATCH_SIZE', '200'))
+LEAD_FLUSH_SECONDS = float(os.environ.get('LEAD_FLUSH_SECONDS', '1'))
+LEAD_REPLAY_SECONDS = float(os.environ.get('LEAD_REPLAY_SECONDS', '30'))
+# Per-IP throttle: LEAD_BURST submissions, then one every LEAD_RATE_SECONDS
+LEAD_RATE_SECONDS = float(os.environ.get('LEAD_RATE_SECONDS', '10'))
+LEAD_BURST = int(os.environ.get('LEAD_BURST', '3'))
+LEAD_SPILL_PATH = Path(os.environ.get('LEAD_SPILL_PATH', str(Path(__file__).parent / 'leads-spill.ndjson')))
+# e.g. https://cart.apptelier.sg/wp-content/themes/woostify-child/apptelier-contact.php
+LEAD_FORWARD_URL = os.environ.get('LEAD_FORWARD_URL', '')
+LEAD_FORWARD_TIMEOUT = float(os.environ.get('LEAD_FORWARD_TIMEOUT', '10'))
+
+_STOP = object()
+_FORWARD_FIELDS = ("name", "mobile", "email", "business", "message")
+
+
+def write_leads(db, rows):
+    bulk_insert(db, Lead, rows)
+    db.commit()
+
+
+def forward_lead(url: str, row: dict):
+    """POST ``row`` to ``url`` form-encoded; raises on a non-2xx reply."""
+    body = urlencode({field: row.get(field) or "" for field in _FORWARD_FIELDS}).encode()
+    request = urllib.request.Request(
+        url, data=body, headers={"Content-Type": "application/x-www-form-urlencoded;charset=UTF-8"})
+    with urllib.request.urlopen(request, timeout=LEAD_FORWARD_TIMEOUT) as response:
+        response.read()
+
+
+@contextmanager
+def _file_lock(path: Path, blocking: bool = True):
+    """Hold an exclusive ``flock`` on ``path``; yields False if ``blocking``
+    is off and another process holds it."""
+    with open(path, "a") as fh:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _lock_path(path: Path, suffix: str) -> Path:
+    return path.with_name(path.name + suffix)
+
+
+def _append_spill(path: Path, rows):
+    data = "".join(json.dumps({**row, "created_at": row["created_at"].isoformat()}) + "\n" for row in rows)
+    with _file_lock(_lock_path(path, ".lock")):
+        with open(path, "a", encoding="utf-8") as fh:
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+
+def _take_spill(path: Path, replay: Path):
+    """Move the spill file aside (unless a previous replay left one) and
+    return its rows; new failures then append to a fresh file."""
+    with _file_lock(_lock_path(path, ".lock")):
+        if not replay.exists():
+            if not path.exists():
+                return []
+            os.replace(path, replay)
+    return _read_spill(replay)
+
+
+def _read_spill(path: Path):
+    rows = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                # A crash mid-append can leave a torn last line.
+                logger.warning("Skipping unreadable line in %s", path)
+                continue
+            row["created_at"] = datetime.fromisoformat(row["created_at"])
+            rows.append(row)
+    return rows
+
+
+class LeadWriter:
+    def __init__(self, spill_path: Path = LEAD_SPILL_PATH, batch_size: int = LEAD_BATCH_SIZE,
+                 flush_seconds: float = LEAD_FLUSH_SECONDS, queue_max: int = LEAD_QUEUE_MAX,
+                 forward_url: str = LEAD_FORWARD_URL):
+        self.spill_path = Path(spill_path)
+        self.forward_url = forward_url
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.queue_max = queue_max
+        self._queue = None
+        self._task = None
+        self._forwarding = set()
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.batches = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.write_errors = 0
+        self.lost = 0
+        self.forwarded = 0
+        self.forward_errors = 0
+
+    @property
+    def _replay_path(self):
+        return self.spill_path.with_name(self.spill_path.name + ".replay")
+
+    def _spill_pending(self):
+        return self.spill_path.exists() or self._replay_path.exists()
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_max)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued, spilling it if the database is down."""
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        if self._forwarding:
+            await asyncio.gather(*self._forwarding)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def submit(self, row: dict) -> bool:
+        """Queue ``row`` for writing; False if the queue is full or the writer has stopped."""
+        if self._queue is None or not self.running:
+            return False
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.accepted += 1
+        return True
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        await self._replay_logged()
+        stopping = False
+        while not stopping:
+            try:
+                first = await asyncio.wait_for(
+                    self._queue.get(), LEAD_REPLAY_SECONDS if self._spill_pending() else None)
+            except asyncio.TimeoutError:
+                await self._replay_logged()
+                continue
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = loop.time() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                await self._flush(batch)
+            except Exception:
+                # Never lets one batch end the task; the rows are logged as lost
+                self.lost += len(batch)
+                logger.exception("Dropping %d leads that could not be written or spilled", len(batch))
+
+    async def _flush(self, batch):
+        try:
+            await run_db(write_leads, batch)
+        except Exception as e:
+            self.write_errors += 1
+            logger.error("Writing %d leads failed (%s); spilling to %s", len(batch), e, self.spill_path)
+            await asyncio.to_thread(_append_spill, self.spill_path, batch)
+            self.spilled += len(batch)
+            return
+        self.written += len(batch)
+        self.batches += 1
+        self._forward(batch)
+        if self._spill_pending():
+            await self._replay_logged()
+
+    async def _replay_logged(self):
+        try:
+            await self._replay()
+        except Exception as e:
+            logger.warning("Replaying %s failed (%s); retrying in %ss", self._replay_path, e, LEAD_REPLAY_SECONDS)
+
+    async def _replay(self):
+        # Held across the database writes; another worker already replaying means nothing to do here
+        with _file_lock(_lock_path(self.spill_path, ".replay.lock"), blocking=False) as acquired:
+            if not acquired:
+                return
+            replay = self._replay_path
+            rows = await asyncio.to_thread(_take_spill, self.spill_path, replay)
+            for start in range(0, len(rows), self.batch_size):
+                await run_db(write_leads, rows[start:start + self.batch_size])
+            replay.unlink(missing_ok=True)
+        if rows:
+            self.replayed += len(rows)
+            logger.info("Replayed %d spilled leads", len(rows))
+            self._forward(rows)
+
+    def _forward(self, rows):
+        if not self.forward_url:
+            return
+        task = asyncio.get_running_loop().create_task(self._forward_rows(rows))
+        self._forwarding.add(task)
+        task.add_done_callback(self._forwarding.discard)
+
+    async def _forward_rows(self, rows):
+        for row in rows:
+            try:
+                await asyncio.to_thread(forward_lead, self.forward_url, row)
+            except Exception as e:
+                self.forward_errors += 1
+                logger.warning("Forwarding lead %s to %s failed: %s", row.get("id"), self.forward_url, e)
+            else:
+                self.forwarded += 1
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "written": self.written,
+            "batches": self.batches,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "write_errors": self.write_errors,
+            "lost": self.lost,
+            "forwarded": self.forwarded,
+            "forward_errors": self.forward_errors,
+            "running": self.running,
+            "spill_pending": self._spill_pending(),
+        }
+
+
+lead_writer = LeadWriter()
+lead_limiter = TokenBucketLimiter(LEAD_RATE_SECONDS, LEAD_BURST)
+
+
+@metrics.register_collector
+def lead_metric_lines():
+    stats = lead_writer.stats()
+    lines = []
+    for key in ("accepted", "rejected", "written", "batches", "spilled", "replayed", "write_errors", "lost",
+                "forwarded", "forward_errors"):
+        lines.extend(metrics.gauge_lines(f"apptelier_leads_{key}_total", f"Leads {key.replace('_', ' ')}.",
+                                         [({}, stats[key])], "counter"))
+    lines.extend(metrics.gauge_lines("apptelier_leads_throttled_total", "Lead submissions rejected by the per-IP limit.",
+                                     [({}, lead_limiter.limited)], "counter"))
+    lines.extend(metrics.gauge_lines("apptelier_leads_queued", "Leads waiting to be written.",
+                                     [({}, stats["queued"])]))
+    return lines
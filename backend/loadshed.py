@@ -0,0 +1,252 @@
+"""Per-route concurrency limits and load shedding.
+
+``LoadShedMiddleware`` admits at most ``limit`` concurrent requests per
+route. Up to LOADSHED_QUEUE more wait for a slot for at most
+LOADSHED_QUEUE_TIMEOUT_MS; anything beyond that is answered straight away
+with 503 and ``Retry-After`` instead of piling onto the database pool and
+timing out for everyone. A ``fallback(request)`` hook may answer a shed
+request some other way (the catalog routes serve their last payload).
+
+With LOADSHED_ADAPTIVE (off by default) the limit follows AIMD on latency
+measured against the route's own baseline: the fastest request seen over
+the last one to two LOADSHED_BASELINE_SECONDS windows. A request that
+finishes within LOADSHED_TOLERANCE times that baseline (and never under
+LOADSHED_MIN_TARGET_MS) while the limit is in use grows it by ``1/limit``
+(about +1 per full window); a slower or failed one cuts it by
+LOADSHED_BACKOFF, at most once per target interval. A route that is slow by
+design (bulk upserts, exports) therefore keeps its limit, and only a route
+slowing down relative to itself, which is what queueing in front of MySQL
+looks like, converges on the concurrency MySQL can actually serve.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+
+LOADSHED_ENABLED = os.environ.get('LOADSHED_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+LOADSHED_LIMIT = int(os.environ.get('LOADSHED_LIMIT', '32'))
+LOADSHED_MIN_LIMIT = int(os.environ.get('LOADSHED_MIN_LIMIT', '2'))
+LOADSHED_MAX_LIMIT = int(os.environ.get('LOADSHED_MAX_LIMIT', '256'))
+LOADSHED_QUEUE = int(os.environ.get('LOADSHED_QUEUE', '64'))
+LOADSHED_QUEUE_TIMEOUT_MS = float(os.environ.get('LOADSHED_QUEUE_TIMEOUT_MS', '250'))
+LOADSHED_ADAPTIVE = os.environ.get('LOADSHED_ADAPTIVE', 'false').lower() in ('1', 'true', 'yes')
+LOADSHED_TOLERANCE = float(os.environ.get('LOADSHED_TOLERANCE', '2'))
+LOADSHED_MIN_TARGET_MS = float(os.environ.get('LOADSHED_MIN_TARGET_MS', '50'))
+LOADSHED_BASELINE_SECONDS = float(os.environ.get('LOADSHED_BASELINE_SECONDS', '60'))
+LOADSHED_BACKOFF = float(os.environ.get('LOADSHED_BACKOFF', '0.9'))
+LOADSHED_RETRY_AFTER = int(os.environ.get('LOADSHED_RETRY_AFTER', '1'))
+
+# Probes and scrapes must keep answering while the worker sheds load, and
+# change feed streams stay open idle for hours, which would pin a slot each.
+EXEMPT_PATHS = frozenset({"/api/health", "/api/ready", "/metrics", "/api/changes"})
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit: int = LOADSHED_LIMIT, queue_size: int = LOADSHED_QUEUE,
+                 queue_timeout: float = LOADSHED_QUEUE_TIMEOUT_MS / 1000, adaptive: bool = LOADSHED_ADAPTIVE,
+                 min_limit: int = LOADSHED_MIN_LIMIT, max_limit: int = LOADSHED_MAX_LIMIT,
+                 tolerance: float = LOADSHED_TOLERANCE, min_target: float = LOADSHED_MIN_TARGET_MS / 1000,
+                 baseline_window: float = LOADSHED_BASELINE_SECONDS, backoff: float = LOADSHED_BACKOFF):
+        self.limit = float(limit)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.adaptive = adaptive
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.min_target = min_target
+        self.baseline_window = baseline_window
+        self.backoff = backoff
+        # Fastest latency in the current and the previous baseline window
+        self._window_min = None
+        self._previous_min = None
+        self._window_started = time.monotonic()
+        self.in_flight = 0
+        self._waiters = deque()
+        self._last_decrease = 0.0
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _capacity(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    async def acquire(self) -> bool:
+        """Take a slot, waiting in the bounded queue if necessary; False means shed."""
+        if self.in_flight < self._capacity() and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= self.queue_size:
+            self.rejected += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._discard(waiter)
+            self.timeouts += 1
+            return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._hand_over()  # granted a slot we will never use
+            else:
+                self._discard(waiter)
+            raise
+        # _hand_over() passed its slot to us; in_flight already counts it.
+        self.admitted += 1
+        return True
+
+    def _discard(self, waiter):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self, latency: float, failed: bool):
+        if self.adaptive:
+            self._adapt(latency, failed)
+        self._hand_over()
+
+    def _hand_over(self):
+        while self._waiters and self.in_flight <= self._capacity():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @property
+    def baseline(self):
+        """The route's uncongested latency, or None before any request."""
+        mins = [value for value in (self._window_min, self._previous_min) if value is not None]
+        return min(mins) if mins else None
+
+    @property
+    def target(self) -> float:
+        baseline = self.baseline
+        return max(self.min_target, baseline * self.tolerance if baseline is not None else 0.0)
+
+    def _observe(self, latency, now):
+        if now - self._window_started >= self.baseline_window:
+            # Rolling over lets the baseline rise when the route really got slower
+            self._previous_min, self._window_min = self._window_min, None
+            self._window_started = now
+        if self._window_min is None or latency < self._window_min:
+            self._window_min = latency
+
+    def _adapt(self, latency, failed):
+        now = time.monotonic()
+        if not failed:
+            self._observe(latency, now)
+        target = self.target
+        if failed or latency > target:
+            if now - self._last_decrease >= target:
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                self._last_decrease = now
+        elif self.in_flight >= self._capacity():
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+    def stats(self) -> dict:
+        return {
+            "limit": round(self.limit, 2),
+            "baseline_ms": round(self.baseline * 1000, 2) if self.baseline is not None else None,
+            "target_ms": round(self.target * 1000, 2),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+
+class LoadShedder:
+    """One ``ConcurrencyLimiter`` per (method, route), created on first use."""
+
+    def __init__(self, router, fallback=None, enabled: bool = LOADSHED_ENABLED):
+        self.router = router
+        self.fallback = fallback
+        self.enabled = enabled
+        self.limiters = {}
+        self.fallbacks = 0
+        self._routes = {}
+
+    def limiter_for(self, scope):
+        route = self._route(scope)
+        if route is None or route.path in EXEMPT_PATHS:
+            return None
+        key = (scope["method"], route.path)
+        limiter = self.limiters.get(key)
+        if limiter is None:
+            limiter = self.limiters[key] = ConcurrencyLimiter()
+        return limiter
+
+    def _route(self, scope):
+        cache_key = (scope["method"], scope["path"])
+        route = self._routes.get(cache_key, False)
+        if route is False:
+            route = None
+            for candidate in self.router.routes:
+                match, _ = candidate.matches(scope)
+                if match == Match.FULL:
+                    route = candidate
+                    break
+            # Bounded: paths with ids (admin routes) would otherwise grow it forever
+            if len(self._routes) >= 4096:
+                self._routes.clear()
+            self._routes[cache_key] = route
+        return route
+
+    def shed_response(self, request: Request):
+        response = self.fallback(request) if self.fallback is not None else None
+        if response is not None:
+            self.fallbacks += 1
+            return response
+        return JSONResponse(status_code=503, content={"detail": "Server is busy, please retry shortly"},
+                            headers={"Retry-After": str(LOADSHED_RETRY_AFTER)})
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "fallbacks": self.fallbacks,
+            "routes": {f"{method} {path}": limiter.stats()
+                       for (method, path), limiter in sorted(self.limiters.items())},
+        }
+
+
+class LoadShedMiddleware:
+    def __init__(self, app, shedder: LoadShedder):
+        self.app = app
+        self.shedder = shedder
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.shedder.enabled:
+            return await self.app(scope, receive, send)
+        limiter = self.shedder.limiter_for(scope)
+        if limiter is None:
+            return await self.app(scope, receive, send)
+        if not await limiter.acquire():
+            response = self.shedder.shed_response(Request(scope, receive))
+            return await response(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+        latency = None
+
+        async def send_wrapper(message):
+            nonlocal status, latency
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # Time to first byte, so a long NDJSON stream does not read as a slow route
+                latency = time.perf_counter() - start
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            limiter.release(latency if latency is not None else time.perf_counter() - start, status >= 500)
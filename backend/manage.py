@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Management commands for the Apptelier backend.
+
+Run these once per deploy (or from a migration job) when workers start with
+STARTUP_MODE=fast:
+
+    python manage.py init                 # migrate, then seed if empty
+    python manage.py migrate [--target VERSION] [--list]
+    python manage.py create-schema        # create_all without recording migrations
+    python manage.py seed [--fixture FILE] [--chunk-size N] [--tenant ID]
+
+Add a tenant (a white-label business with its own catalog), optionally
+served from its own domain and seeded with the sample catalog:
+
+    python manage.py tenant add ID [--name NAME] [--domain HOST] [--seed]
+
+Export the catalog as static, content-hashed JSON for the WordPress embed
+(run after `npm run build`, which empties frontend/build):
+
+    python manage.py snapshot [--out DIR] [--tenant ID]
+
+Each tenant is written to its own directory, frontend/build/catalog/<tenant>/
+unless --out says otherwise.
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+from cache import catalog_cache
+from database import SessionLocal
+from models import DEFAULT_TENANT, Tenant, create_schema
+from migrations import MIGRATIONS, migrate, pending
+from seed_data import seed_database, load_fixture, DEFAULT_CHUNK_SIZE
+from snapshot import export_snapshot
+from tenants import TENANT_ID
+
+DEFAULT_SNAPSHOT_DIR = ROOT_DIR.parent / 'frontend' / 'build' / 'catalog'
+
+
+def cmd_create_schema(args):
+    create_schema()
+    print("Schema created")
+
+
+def cmd_migrate(args):
+    if args.list:
+        waiting = set(pending())
+        for version, description, _ in MIGRATIONS:
+            print("%s %s  %s" % ("pending" if version in waiting else "applied", version, description))
+        return
+    applied = migrate(target=args.target)
+    print("Applied: %s" % (", ".join(applied) or "nothing, schema is up to date"))
+
+
+def cmd_seed(args):
+    db = SessionLocal()
+    try:
+        if args.fixture:
+            print(load_fixture(db, args.fixture, args.chunk_size, args.tenant))
+        else:
+            seed_database(db, args.tenant)
+    finally:
+        db.close()
+
+
+def cmd_snapshot(args):
+    db = SessionLocal()
+    try:
+        out = args.out if args.out is not None else DEFAULT_SNAPSHOT_DIR / args.tenant
+        result = export_snapshot(db, out, tenant_id=args.tenant)
+    finally:
+        db.close()
+    for state in ("written", "unchanged", "removed"):
+        print("%-9s %s" % (state + ":", ", ".join(result[state]) or "-"))
+
+
+def cmd_tenant_add(args):
+    if not TENANT_ID.match(args.id):
+        sys.exit("Tenant ids are 1-64 lowercase letters, digits and hyphens: %r" % args.id)
+    db = SessionLocal()
+    try:
+        if db.get(Tenant, args.id) is not None:
+            sys.exit("Tenant %s already exists" % args.id)
+        db.add(Tenant(id=args.id, name=args.name or args.id, domain=args.domain.lower() if args.domain else None))
+        db.commit()
+        # Global, so every worker's tenant registry reloads and picks it up
+        catalog_cache.invalidate()
+        print("Tenant %s added" % args.id)
+        if args.seed:
+            seed_database(db, args.id)
+    finally:
+        db.close()
+
+
+def cmd_init(args):
+    print("Applied: %s" % (", ".join(migrate()) or "nothing, schema is up to date"))
+    cmd_seed(args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apptelier management commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("create-schema", help="create missing tables").set_defaults(func=cmd_create_schema)
+
+    sub = commands.add_parser("migrate", help="apply pending schema migrations")
+    sub.add_argument("--target", help="stop after this version")
+    sub.add_argument("--list", action="store_true", help="show applied and pending migrations")
+    sub.set_defaults(func=cmd_migrate)
+
+    for name, func, help_text in (
+        ("seed", cmd_seed, "seed an empty database or load a fixture"),
+        ("init", cmd_init, "migrate followed by seed"),
+    ):
+        sub = commands.add_parser(name, help=help_text)
+        sub.add_argument("--fixture", help="NDJSON (optionally .gz) fixture file to load")
+        sub.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+        sub.add_argument("--tenant", default=DEFAULT_TENANT, help="tenant to seed (default: %(default)s)")
+        sub.set_defaults(func=func)
+
+    tenant = commands.add_parser("tenant", help="manage tenants").add_subparsers(dest="tenant_command", required=True)
+    sub = tenant.add_parser("add", help="add a tenant")
+    sub.add_argument("id")
+    sub.add_argument("--name")
+    sub.add_argument("--domain", help="host name serving the tenant's landing page")
+    sub.add_argument("--seed", action="store_true", help="give it the sample catalog")
+    sub.set_defaults(func=cmd_tenant_add)
+
+    sub = commands.add_parser("snapshot", help="export catalog sections as static JSON for the frontend")
+    sub.add_argument("--out", type=Path, help="output directory (default: %s/<tenant>)" % DEFAULT_SNAPSHOT_DIR)
+    sub.add_argument("--tenant", default=DEFAULT_TENANT)
+    sub.set_defaults(func=cmd_snapshot)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Request, database and serialization metrics in Prometheus text format.
+
+``instrument_engine`` hooks SQLAlchemy cursor events so every statement is
+counted and timed, both globally and against the request that issued it
+(tracked through a context variable that also follows ``asyncio.to_thread``
+and ``AsyncSession.run_sync``). ``render`` produces the exposition served at
+``/metrics``; other modules contribute extra lines with ``register_collector``.
+"""
+import contextvars
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labels):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+        for label_values, (counts, total, count) in series:
+            labels = _labels(zip(self.labels, label_values))
+            prefix = labels[1:-1] + "," if labels else ""
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def _labels(pairs):
+    pairs = list(pairs)
+    if not pairs:
+        return ""
+    body = ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+class RequestStats:
+    """Per-request accumulator for SQL statements and time spent in phases."""
+    __slots__ = ("_lock", "scope", "sql_count", "db_seconds", "serialize_seconds")
+
+    def __init__(self, scope=None):
+        self._lock = threading.Lock()
+        self.scope = scope
+        self.sql_count = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+
+    @property
+    def route(self):
+        """``"METHOD /route/template"`` once routing has matched, else the raw path."""
+        if self.scope is None:
+            return None
+        route = self.scope.get("route")
+        return "%s %s" % (self.scope.get("method"), route.path if route is not None else self.scope.get("path"))
+
+    def add_query(self, seconds):
+        with self._lock:
+            self.sql_count += 1
+            self.db_seconds += seconds
+
+    def add_serialize(self, seconds):
+        with self._lock:
+            self.serialize_seconds += seconds
+
+
+_current = contextvars.ContextVar("apptelier_request_stats", default=None)
+
+request_latency = Histogram(
+    "apptelier_http_request_duration_seconds", "Request latency by route.",
+    LATENCY_BUCKETS, ("method", "route", "status"))
+request_db_time = Histogram(
+    "apptelier_http_request_db_seconds", "Cumulative SQL time per request.",
+    LATENCY_BUCKETS, ("method", "route"))
+request_sql_count = Histogram(
+    "apptelier_http_request_sql_statements", "SQL statements executed per request.",
+    COUNT_BUCKETS, ("method", "route"))
+response_size = Histogram(
+    "apptelier_http_response_size_bytes", "Response body size by route.",
+    SIZE_BUCKETS, ("method", "route"))
+
+_totals_lock = threading.Lock()
+_sql_totals = defaultdict(float)
+_collectors = []
+
+
+def begin_request(scope=None) -> RequestStats:
+    stats = RequestStats(scope)
+    _current.set(stats)
+    return stats
+
+
+def current_request():
+    return _current.get()
+
+
+def record_serialize(seconds):
+    stats = _current.get()
+    if stats is not None:
+        stats.add_serialize(seconds)
+
+
+def observe_request(method, route, status, seconds, stats: RequestStats, size):
+    request_latency.observe(seconds, method, route, status)
+    request_db_time.observe(stats.db_seconds, method, route)
+    request_sql_count.observe(stats.sql_count, method, route)
+    if size is not None:
+        response_size.observe(size, method, route)
+
+
+def server_timing(stats: RequestStats, total_seconds) -> str:
+    return "db;dur=%.2f, serialize;dur=%.2f, total;dur=%.2f" % (
+        stats.db_seconds * 1000, stats.serialize_seconds * 1000, total_seconds * 1000)
+
+
+def instrument_engine(sync_engine, name):
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._apptelier_query_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_apptelier_query_start", None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        with _totals_lock:
+            _sql_totals[(name, "count")] += 1
+            _sql_totals[(name, "seconds")] += elapsed
+        stats = _current.get()
+        if stats is not None:
+            stats.add_query(elapsed)
+
+
+def sql_totals():
+    """Return ``(statements, seconds)`` executed across all engines so far."""
+    with _totals_lock:
+        count = sum(v for (_, kind), v in _sql_totals.items() if kind == "count")
+        seconds = sum(v for (_, kind), v in _sql_totals.items() if kind == "seconds")
+    return int(count), seconds
+
+
+def register_collector(fn):
+    """Register ``fn() -> list[str]`` whose lines are appended to ``render()``."""
+    _collectors.append(fn)
+    return fn
+
+
+def gauge_lines(name, help_text, samples, metric_type="gauge"):
+    """Format ``[(labels_dict, value), ...]`` as one Prometheus metric family."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels.items())} {value}")
+    return lines
+
+
+def render() -> str:
+    lines = []
+    for histogram in (request_latency, request_db_time, request_sql_count, response_size):
+        lines.extend(histogram.render())
+    with _totals_lock:
+        totals = dict(_sql_totals)
+    engines = sorted({engine for engine, _ in totals})
+    lines.extend(gauge_lines(
+        "apptelier_db_statements_total", "SQL statements executed.",
+        [({"engine": e}, int(totals[(e, "count")])) for e in engines], "counter"))
+    lines.extend(gauge_lines(
+        "apptelier_db_statement_seconds_total", "Time spent executing SQL.",
+        [({"engine": e}, totals[(e, "seconds")]) for e in engines], "counter"))
+    for collector in _collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,187 @@
+"""Versioned schema migrations.
+
+``MIGRATIONS`` is an ordered list of ``(version, description, fn)``; ``migrate``
+runs every version not yet recorded in ``schema_migrations`` and records it
+in the same step. Each ``fn(conn)`` must be safe on a database that already
+has the change, because tables created by ``create_all`` (tests, the
+benchmark, older deploys) come with the current models' indexes: the index
+migrations reflect the live table and create or drop only what differs.
+
+Migration 0003 makes the catalog multi-tenant: it adds the ``tenants`` table
+with the ``default`` tenant, which owns every existing row, and a
+``tenant_id`` column leading each catalog index. Migration 0004 adds the
+``plan_features.plan_id`` foreign key that tables from before the models
+declared it lack (deleting features whose plan is gone), so a migrated
+database ends up with the same schema as ``create_all``.
+
+On MySQL the run holds ``GET_LOCK('apptelier_migrations')`` so workers
+booting with STARTUP_MODE=auto do not migrate concurrently.
+"""
+import logging
+
+from sqlalchemy import Column, DateTime, Index, MetaData, String, Table, insert, inspect, select, text
+from sqlalchemy.sql import func
+
+from database import Base, engine
+from models import DEFAULT_TENANT, PlanFeature, Tenant
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_LOCK_TIMEOUT = 60
+
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _meta,
+    Column("version", String(32), primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False, server_default=func.now()),
+)
+
+
+def _create_tables(conn):
+    Base.metadata.create_all(bind=conn)
+
+
+def _index_changes(create, drop=()):
+    """Build a migration creating ``{name: (table, columns)}`` indexes and
+    then dropping ``[(table, name)]``, each only if needed."""
+    def run(conn):
+        inspector = inspect(conn)
+        existing = {table: {index["name"] for index in inspector.get_indexes(table)}
+                    for table in {table for table, _ in create.values()} | {table for table, _ in drop}}
+        reflected = MetaData()
+        for name, (table_name, columns) in create.items():
+            if name in existing[table_name]:
+                continue
+            table = Table(table_name, reflected, autoload_with=conn)
+            Index(name, *(table.c[column] for column in columns)).create(conn)
+            logger.info("Created index %s on %s(%s)", name, table_name, ", ".join(columns))
+        for table_name, name in drop:
+            if name in existing[table_name]:
+                conn.execute(text(f"DROP INDEX {name} ON {table_name}") if conn.dialect.name in ("mysql", "mariadb")
+                             else text(f"DROP INDEX {name}"))
+                logger.info("Dropped index %s on %s", name, table_name)
+    return run
+
+
+TENANT_TABLES = ("subscription_plans", "plan_features", "services", "testimonials", "hero_stats", "leads")
+
+_tenant_indexes = _index_changes(
+    {
+        "ix_subscription_plans_tenant_order": ("subscription_plans", ("tenant_id", "order_index", "id")),
+        "ix_plan_features_tenant_plan_order": ("plan_features", ("tenant_id", "plan_id", "order_index")),
+        "ix_services_tenant_order": ("services", ("tenant_id", "order_index", "id")),
+        "ix_testimonials_tenant_created": ("testimonials", ("tenant_id", "created_at", "id")),
+        "ix_hero_stats_tenant_order": ("hero_stats", ("tenant_id", "order_index", "id")),
+        "ix_leads_tenant_created": ("leads", ("tenant_id", "created_at")),
+    },
+    # Leftmost prefixes of nothing any query still uses: every read filters on tenant_id
+    drop=[("subscription_plans", "ix_subscription_plans_order"), ("services", "ix_services_order"),
+          ("testimonials", "ix_testimonials_created"), ("hero_stats", "ix_hero_stats_order"),
+          ("leads", "ix_leads_created_at")],
+)
+
+
+def _tenant_scope(conn):
+    # Existing rows all belong to the default tenant
+    Tenant.__table__.create(conn, checkfirst=True)
+    if conn.execute(select(Tenant.id).where(Tenant.id == DEFAULT_TENANT)).first() is None:
+        conn.execute(insert(Tenant).values(id=DEFAULT_TENANT, name="Default"))
+    inspector = inspect(conn)
+    for table in TENANT_TABLES:
+        if "tenant_id" not in {column["name"] for column in inspector.get_columns(table)}:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN tenant_id VARCHAR(64) NOT NULL "
+                              f"DEFAULT '{DEFAULT_TENANT}'"))
+            logger.info("Added tenant_id to %s", table)
+    _tenant_indexes(conn)
+
+
+def _plan_features_foreign_key(conn):
+    # Tables that predate the models' ForeignKey were left as they were by 0001
+    inspector = inspect(conn)
+    if any(fk["constrained_columns"] == ["plan_id"] for fk in inspector.get_foreign_keys("plan_features")):
+        return
+    orphans = conn.execute(text("DELETE FROM plan_features WHERE plan_id NOT IN "
+                                "(SELECT id FROM subscription_plans)")).rowcount
+    if orphans:
+        logger.info("Deleted %d plan features without a plan", orphans)
+    if conn.dialect.name in ("mysql", "mariadb"):
+        _plan_order_index(conn)
+        conn.execute(text("ALTER TABLE plan_features ADD CONSTRAINT fk_plan_features_plan_id FOREIGN KEY (plan_id) "
+                          "REFERENCES subscription_plans (id) ON DELETE CASCADE"))
+    else:
+        # SQLite cannot add a constraint to an existing table: rebuild it from the model
+        for index in inspector.get_indexes("plan_features"):
+            conn.execute(text(f"DROP INDEX {index['name']}"))
+        columns = ", ".join(column["name"] for column in inspector.get_columns("plan_features")
+                            if column["name"] in PlanFeature.__table__.c)
+        conn.execute(text("ALTER TABLE plan_features RENAME TO plan_features_old"))
+        PlanFeature.__table__.create(conn)
+        conn.execute(text(f"INSERT INTO plan_features ({columns}) SELECT {columns} FROM plan_features_old"))
+        conn.execute(text("DROP TABLE plan_features_old"))
+    logger.info("Added foreign key plan_features.plan_id -> subscription_plans.id")
+
+
+_plan_order_index = _index_changes({"ix_plan_features_plan_order": ("plan_features", ("plan_id", "order_index"))})
+
+
+MIGRATIONS = [
+    ("0001", "create tables", _create_tables),
+    ("0002", "composite indexes for catalog ORDER BY and keyset paths", _index_changes(
+        {
+            "ix_subscription_plans_order": ("subscription_plans", ("order_index", "id")),
+            "ix_plan_features_plan_order": ("plan_features", ("plan_id", "order_index")),
+            "ix_services_order": ("services", ("order_index", "id")),
+            "ix_testimonials_created": ("testimonials", ("created_at", "id")),
+            "ix_hero_stats_order": ("hero_stats", ("order_index", "id")),
+        },
+        # Leftmost prefix of ix_plan_features_plan_order, which also serves the foreign key
+        drop=[("plan_features", "ix_plan_features_plan_id")],
+    )),
+    ("0003", "tenants table, tenant_id on catalog tables and tenant-led indexes", _tenant_scope),
+    ("0004", "foreign key and its index on plan_features.plan_id", _plan_features_foreign_key),
+]
+
+
+def applied_versions(conn):
+    return {row.version for row in conn.execute(schema_migrations.select())}
+
+
+def pending(bind=engine):
+    with bind.connect() as conn:
+        if not inspect(conn).has_table("schema_migrations"):
+            return [version for version, _, _ in MIGRATIONS]
+        done = applied_versions(conn)
+    return [version for version, _, _ in MIGRATIONS if version not in done]
+
+
+def migrate(bind=engine, target=None):
+    """Apply pending migrations up to and including ``target`` (default all);
+    return the versions applied."""
+    applied = []
+    with bind.connect() as conn:
+        locked = conn.dialect.name in ("mysql", "mariadb")
+        if locked and not conn.execute(text("SELECT GET_LOCK('apptelier_migrations', :timeout)"),
+                                       {"timeout": MIGRATION_LOCK_TIMEOUT}).scalar():
+            raise RuntimeError("Another process is running migrations")
+        try:
+            _meta.create_all(bind=conn)
+            conn.commit()
+            done = applied_versions(conn)
+            conn.commit()
+            for version, description, fn in MIGRATIONS:
+                if target is not None and version > target:
+                    break
+                if version in done:
+                    continue
+                logger.info("Applying migration %s: %s", version, description)
+                # MySQL commits DDL implicitly, hence the idempotent migrations
+                with conn.begin():
+                    fn(conn)
+                    conn.execute(schema_migrations.insert().values(version=version, description=description))
+                applied.append(version)
+        finally:
+            if locked:
+                conn.execute(text("SELECT RELEASE_LOCK('apptelier_migrations')"))
+                conn.commit()
+    return applied
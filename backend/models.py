@@ -1,12 +1,33 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, Text, DateTime
+from sqlalchemy import Column, Integer, String, Float, Boolean, Text, DateTime, ForeignKey, Index
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from database import Base
+from database import Base, engine
 import uuid
 
+# Every catalog row belongs to a tenant (one white-label business). Composite
+# indexes lead with tenant_id, then match each table's ORDER BY (plus id for
+# keyset pages); existing databases get them from migrations 0002 to 0004
+# (see migrations.py).
+DEFAULT_TENANT = "default"
+
+def tenant_column():
+    return Column(String(64), nullable=False, default=DEFAULT_TENANT, server_default=DEFAULT_TENANT)
+
+class Tenant(Base):
+    __tablename__ = "tenants"
+
+    id = Column(String(64), primary_key=True)
+    name = Column(String(200), nullable=False)
+    # Host name the tenant's landing page is served from, if not a subdomain
+    domain = Column(String(255), unique=True)
+    created_at = Column(DateTime, server_default=func.now())
+
 class SubscriptionPlan(Base):
     __tablename__ = "subscription_plans"
+    __table_args__ = (Index("ix_subscription_plans_tenant_order", "tenant_id", "order_index", "id"),)
     
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    tenant_id = tenant_column()
     name = Column(String(100), nullable=False)
     price = Column(Float, nullable=False)
     period = Column(String(50), default="month")
@@ -16,19 +37,40 @@ class SubscriptionPlan(Base):
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
+    features = relationship(
+        "PlanFeature",
+        back_populates="plan",
+        order_by="[PlanFeature.order_index, PlanFeature.id]",
+        cascade="all, delete-orphan",
+    )
+
 class PlanFeature(Base):
     __tablename__ = "plan_features"
+    __table_args__ = (
+        Index("ix_plan_features_tenant_plan_order", "tenant_id", "plan_id", "order_index"),
+        # The foreign key (and its cascade) looks features up by plan_id alone
+        Index("ix_plan_features_plan_order", "plan_id", "order_index"),
+    )
     
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    plan_id = Column(String(36), nullable=False)
+    tenant_id = tenant_column()
+    plan_id = Column(
+        String(36),
+        ForeignKey("subscription_plans.id", ondelete="CASCADE"),
+        nullable=False,
+    )
     name = Column(String(255), nullable=False)
     included = Column(Boolean, default=True)
     order_index = Column(Integer, default=0)
 
+    plan = relationship("SubscriptionPlan", back_populates="features")
+
 class Service(Base):
     __tablename__ = "services"
+    __table_args__ = (Index("ix_services_tenant_order", "tenant_id", "order_index", "id"),)
     
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    tenant_id = tenant_column()
     title = Column(String(200), nullable=False)
     description = Column(Text)
     icon = Column(String(100))
@@ -37,8 +79,10 @@ class Service(Base):
 
 class Testimonial(Base):
     __tablename__ = "testimonials"
+    __table_args__ = (Index("ix_testimonials_tenant_created", "tenant_id", "created_at", "id"),)
     
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    tenant_id = tenant_column()
     name = Column(String(200), nullable=False)
     role = Column(String(200))
     content = Column(Text, nullable=False)
@@ -48,8 +92,28 @@ class Testimonial(Base):
 
 class HeroStat(Base):
     __tablename__ = "hero_stats"
+    __table_args__ = (Index("ix_hero_stats_tenant_order", "tenant_id", "order_index", "id"),)
     
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    tenant_id = tenant_column()
     value = Column(String(50), nullable=False)
     label = Column(String(100), nullable=False)
     order_index = Column(Integer, default=0)
+
+class Lead(Base):
+    __tablename__ = "leads"
+    __table_args__ = (Index("ix_leads_tenant_created", "tenant_id", "created_at"),)
+
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    tenant_id = tenant_column()
+    name = Column(String(100), nullable=False)
+    mobile = Column(String(20), nullable=False)
+    email = Column(String(255))
+    business = Column(String(100), nullable=False)
+    message = Column(Text, nullable=False)
+    ip = Column(String(45))
+    # Set when the API accepted the lead; rows are written later in batches
+    created_at = Column(DateTime, nullable=False)
+
+def create_schema(bind=engine):
+    Base.metadata.create_all(bind=bind)
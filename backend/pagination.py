@@ -0,0 +1,119 @@
+"""Keyset pagination and NDJSON streaming for the long catalog lists.
+
+``GET /api/services`` and ``/api/testimonials`` accept ``limit`` and
+``cursor``. A page is ``WHERE tenant_id = ? AND (key, id) > cursor ORDER BY
+key, id LIMIT n`` (key is ``order_index`` for services and ``created_at``
+for testimonials), so every page is one range scan of the tenant-led index
+however deep it is and however many tenants there are, and rows added
+meanwhile never shift or repeat others. The cursor is an opaque base64url
+token holding the last row's sort key; the next one is sent in
+``X-Next-Cursor`` and ``Link: <...>; rel="next"`` so the body stays a plain
+JSON array.
+
+``?format=ndjson`` streams the list (from ``cursor`` on, if given) as one JSON
+object per line, encoded batch by batch straight off a server-side cursor.
+"""
+import base64
+import json
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import DateTime, and_, func, or_, select
+from sqlalchemy.orm import Session
+
+import schemas
+from catalog import FAST_SERIALIZATION, orjson, _fields
+from database import engine, stream_db
+from models import DEFAULT_TENANT, Service, Testimonial
+from payload import Payload
+import metrics
+
+PAGE_DEFAULT_LIMIT = int(os.environ.get('PAGE_DEFAULT_LIMIT', '50'))
+PAGE_MAX_LIMIT = int(os.environ.get('PAGE_MAX_LIMIT', '500'))
+STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', '1000'))
+
+# Cache key -> (model, response schema, sort column, cursor value parser)
+PAGED = {
+    "services": (Service, schemas.Service, Service.order_index, int),
+    "testimonials": (Testimonial, schemas.Testimonial, Testimonial.created_at, datetime.fromisoformat),
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(value, row_id: str) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(key: str, token: str):
+    parse = PAGED[key][3]
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if not isinstance(row_id, str):
+            raise TypeError("row id must be a string")
+        return (None if value is None else parse(value)), row_id
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor for {key}") from e
+
+
+def _comparable(expr, column):
+    # SQLite keeps datetimes as text, and CURRENT_TIMESTAMP defaults lack the
+    # fraction SQLAlchemy writes, so equal instants would compare unequal.
+    if engine.dialect.name == "sqlite" and isinstance(column.type, DateTime):
+        return func.strftime("%Y-%m-%d %H:%M:%f", expr)
+    return expr
+
+
+def _after(sort, ident, cursor):
+    # NULL keys sort first in MySQL and SQLite, so rows with a NULL key come
+    # before every other row and are paged by id alone.
+    value, row_id = cursor
+    if value is not None:
+        value = _comparable(value, sort)
+    sort = _comparable(sort, sort)
+    if value is None:
+        return or_(and_(sort.is_(None), ident > row_id), sort.is_not(None))
+    return or_(sort > value, and_(sort == value, ident > row_id))
+
+
+def _select(key: str, cursor=None, tenant_id: str = DEFAULT_TENANT):
+    model, schema, sort, _ = PAGED[key]
+    names, columns = _fields(schema, model)
+    stmt = select(*columns).where(model.tenant_id == tenant_id).order_by(_comparable(sort, sort), model.id)
+    if cursor is not None:
+        stmt = stmt.where(_after(sort, model.id, cursor))
+    return names, stmt
+
+
+def read_page(db: Session, key: str, cursor, limit: int, tenant_id: str = DEFAULT_TENANT):
+    """Return ``(payload, next_cursor)`` for up to ``limit`` rows after
+    ``cursor``; ``next_cursor`` is None on the last page."""
+    schema, sort = PAGED[key][1], PAGED[key][2]
+    names, stmt = _select(key, cursor, tenant_id)
+    rows = db.execute(stmt.limit(limit + 1)).all()
+    records = [dict(zip(names, row)) for row in rows[:limit]]
+    next_cursor = encode_cursor(records[-1][sort.key], records[-1]["id"]) if len(rows) > limit else None
+    if FAST_SERIALIZATION and orjson is not None:
+        start = time.perf_counter()
+        payload = Payload(orjson.dumps(records))
+        metrics.record_serialize(time.perf_counter() - start)
+    else:
+        payload = Payload.from_models(schema, [schema.model_validate(record) for record in records])
+    return payload, next_cursor
+
+
+async def stream_ndjson(key: str, cursor=None, tenant_id: str = DEFAULT_TENANT):
+    schema = PAGED[key][1]
+    names, stmt = _select(key, cursor, tenant_id)
+    async for rows in stream_db(stmt, STREAM_BATCH_SIZE):
+        if FAST_SERIALIZATION and orjson is not None:
+            yield b"".join(orjson.dumps(dict(zip(names, row))) + b"\n" for row in rows)
+        else:
+            yield "".join(schema.model_validate(dict(zip(names, row))).model_dump_json() + "\n"
+                          for row in rows).encode()
@@ -0,0 +1,154 @@
+"""Pre-serialized catalog responses.
+
+A ``Payload`` holds the JSON bytes for one catalog section together with a
+strong ETag derived from those bytes. It is built once per cache version and
+served as-is, so requests that hit the cache skip Pydantic validation and JSON
+encoding entirely and conditional requests are answered with 304.
+
+Compressed variants (brotli, gzip) are produced at most once per payload and
+memoized alongside the identity body, so content negotiation costs no
+compression CPU per request.
+"""
+import gzip
+import hashlib
+import os
+import time
+from typing import List
+
+from pydantic import TypeAdapter
+from starlette.requests import Request
+from starlette.responses import Response
+
+from metrics import record_serialize
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+HTTP_CACHE_MAX_AGE = int(os.environ.get('HTTP_CACHE_MAX_AGE', '60'))
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '9'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '11'))
+
+# Server preference order when the client accepts several encodings equally
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+_adapters = {}
+
+
+def _adapter(schema) -> TypeAdapter:
+    adapter = _adapters.get(schema)
+    if adapter is None:
+        adapter = _adapters[schema] = TypeAdapter(List[schema])
+    return adapter
+
+
+def _compress(encoding: str, body: bytes) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output (and therefore its ETag) deterministic
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class Payload:
+    __slots__ = ('body', 'etag', '_variants')
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+        self._variants = {}
+
+    def variant(self, encoding: str):
+        """Return ``(body, etag)`` for ``encoding``, compressing on first use."""
+        cached = self._variants.get(encoding)
+        if cached is None:
+            # Each representation needs its own strong ETag
+            cached = self._variants[encoding] = (_compress(encoding, self.body),
+                                                 self.etag[:-1] + '-' + encoding + '"')
+        return cached
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the body and the compressed variants built so far."""
+        return len(self.body) + sum(len(body) for body, _ in self._variants.values())
+
+    def precompress(self):
+        """Build every compressed variant now, e.g. from a worker thread."""
+        if len(self.body) >= COMPRESS_MIN_BYTES:
+            for encoding in ENCODINGS:
+                self.variant(encoding)
+        return self
+
+    @classmethod
+    def from_models(cls, schema, items) -> "Payload":
+        # Same bytes FastAPI would produce for ``response_model=List[schema]``.
+        start = time.perf_counter()
+        payload = cls(_adapter(schema).dump_json(items))
+        record_serialize(time.perf_counter() - start)
+        return payload
+
+    @classmethod
+    def combine(cls, parts) -> "Payload":
+        """Build a JSON object from ``(name, payload)`` pairs by splicing the
+        already-encoded section bodies together."""
+        body = b','.join(b'"%s":%s' % (name.encode(), part.body) for name, part in parts)
+        return cls(b'{' + body + b'}')
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison function (RFC 9110 13.1.2).
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def negotiate_encoding(accept_encoding: str):
+    """Pick the preferred encoding from ``ENCODINGS`` allowed by an
+    Accept-Encoding header, or None for identity."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in ENCODINGS:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def payload_response(request: Request, payload: Payload) -> Response:
+    body, etag = payload.body, payload.etag
+    headers = {
+        'Cache-Control': f'public, max-age={HTTP_CACHE_MAX_AGE}',
+        'Vary': 'Accept-Encoding',
+    }
+    encoding = None
+    if len(body) >= COMPRESS_MIN_BYTES:
+        encoding = negotiate_encoding(request.headers.get('accept-encoding'))
+        if encoding is not None:
+            body, etag = payload.variant(encoding)
+            headers['Content-Encoding'] = encoding
+    headers['ETag'] = etag
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        headers.pop('Content-Encoding', None)
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type='application/json', headers=headers)
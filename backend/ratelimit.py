@@ -0,0 +1,58 @@
+"""Per-client token buckets.
+
+Each key (usually a client IP) gets ``burst`` tokens that refill at one per
+``interval`` seconds; a request spends one token. Buckets live in an LRU
+capped at ``max_keys`` so a flood of distinct addresses cannot grow memory
+without bound (an evicted client simply starts again with a full bucket).
+"""
+import os
+import time
+from collections import OrderedDict
+
+from starlette.requests import Request
+
+# Only enable behind a proxy that sets X-Forwarded-For; otherwise any client
+# could pick its own bucket.
+TRUST_FORWARDED_FOR = os.environ.get('TRUST_FORWARDED_FOR', 'false').lower() in ('1', 'true', 'yes')
+
+
+class TokenBucketLimiter:
+    def __init__(self, interval: float, burst: int, max_keys: int = 100_000):
+        self.interval = interval
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self.allowed = 0
+        self.limited = 0
+
+    def acquire(self, key: str) -> float:
+        """Spend a token for ``key``; return 0 if allowed, otherwise the
+        number of seconds until the next token is available."""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = float(self.burst)
+        else:
+            tokens, updated = bucket
+            tokens = min(float(self.burst), tokens + (now - updated) / self.interval)
+            self._buckets.move_to_end(key)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            self.limited += 1
+            return (1 - tokens) * self.interval
+        self._buckets[key] = (tokens - 1, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        self.allowed += 1
+        return 0.0
+
+    def stats(self) -> dict:
+        return {"keys": len(self._buckets), "allowed": self.allowed, "limited": self.limited}
+
+
+def client_ip(request: Request) -> str:
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client is not None else "unknown"
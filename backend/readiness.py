@@ -0,0 +1,56 @@
+"""Readiness probe with cached results.
+
+Each registered check is an ``async`` callable that raises when its
+dependency is unhealthy. Checks run concurrently with a per-check timeout,
+and the combined result is cached for ``READY_CACHE_SECONDS`` behind the
+same single-flight cache used for the catalog, so a load balancer polling
+every worker every second costs at most one database ping per interval.
+"""
+import asyncio
+import os
+import time
+
+from cache import CatalogCache
+
+READY_TIMEOUT_SECONDS = float(os.environ.get('READY_TIMEOUT_SECONDS', '1'))
+READY_CACHE_SECONDS = float(os.environ.get('READY_CACHE_SECONDS', '2'))
+
+
+class Readiness:
+    def __init__(self, timeout: float = READY_TIMEOUT_SECONDS, cache_seconds: float = READY_CACHE_SECONDS):
+        self.timeout = timeout
+        self.cache_seconds = cache_seconds
+        self._checks = {}
+        self._cache = CatalogCache(max_entries=1, enabled=True)
+
+    def check(self, name: str, required: bool = True):
+        """Decorator registering an async dependency check."""
+        def register(fn):
+            self._checks[name] = (fn, required)
+            return fn
+        return register
+
+    async def probe(self) -> dict:
+        return await self._cache.get_or_load("ready", self._run, ttl=self.cache_seconds)
+
+    async def _run(self) -> dict:
+        names = list(self._checks)
+        results = await asyncio.gather(*(self._run_check(*self._checks[name]) for name in names))
+        checks = dict(zip(names, results))
+        ready = all(result["status"] == "ok" for name, result in checks.items() if self._checks[name][1])
+        return {"status": "ready" if ready else "unavailable", "checked_at": time.time(), "checks": checks}
+
+    async def _run_check(self, fn, required) -> dict:
+        start = time.perf_counter()
+        try:
+            detail = await asyncio.wait_for(fn(), self.timeout)
+            result = {"status": "ok"}
+            if detail:
+                result["detail"] = detail
+        except asyncio.TimeoutError:
+            result = {"status": "timeout"}
+        except Exception as e:
+            result = {"status": "error", "detail": str(e).splitlines()[0] if str(e) else type(e).__name__}
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        result["required"] = required
+        return result
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
 
@@ -30,6 +30,10 @@ class SubscriptionPlanBase(BaseModel):
 class SubscriptionPlanCreate(SubscriptionPlanBase):
     features: List[PlanFeatureCreate] = []
 
+# Bulk upsert rows: an existing id updates that row, no id inserts a new one
+class SubscriptionPlanUpsert(SubscriptionPlanCreate):
+    id: Optional[str] = None
+
 class SubscriptionPlan(SubscriptionPlanBase):
     id: str
     features: List[PlanFeature] = []
@@ -49,6 +53,9 @@ class ServiceBase(BaseModel):
 class ServiceCreate(ServiceBase):
     pass
 
+class ServiceUpsert(ServiceCreate):
+    id: Optional[str] = None
+
 class Service(ServiceBase):
     id: str
     created_at: Optional[datetime] = None
@@ -67,6 +74,9 @@ class TestimonialBase(BaseModel):
 class TestimonialCreate(TestimonialBase):
     pass
 
+class TestimonialUpsert(TestimonialCreate):
+    id: Optional[str] = None
+
 class Testimonial(TestimonialBase):
     id: str
     created_at: Optional[datetime] = None
@@ -83,8 +93,49 @@ class HeroStatBase(BaseModel):
 class HeroStatCreate(HeroStatBase):
     pass
 
+class HeroStatUpsert(HeroStatCreate):
+    id: Optional[str] = None
+
 class HeroStat(HeroStatBase):
     id: str
     
     class Config:
         from_attributes = True
+
+# Landing Page Schema (all sections in one response)
+class LandingPage(BaseModel):
+    hero_stats: Optional[List[HeroStat]] = None
+    services: Optional[List[Service]] = None
+    plans: Optional[List[SubscriptionPlan]] = None
+    testimonials: Optional[List[Testimonial]] = None
+
+# Lead Schemas (same rules as the contact form)
+class LeadCreate(BaseModel):
+    name: str = Field(pattern=r"^[A-Za-z][A-Za-z\s'\-]{1,58}[A-Za-z]$")
+    mobile: str = Field(pattern=r"^[986]\d{7}$")
+    email: Optional[str] = Field(default=None, max_length=255,
+                                 pattern=r"^([A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,})?$")
+    business: str = Field(min_length=1, max_length=100)
+    message: str = Field(min_length=10, max_length=5000)
+
+    class Config:
+        str_strip_whitespace = True
+
+class LeadAccepted(BaseModel):
+    id: str
+    status: str = "accepted"
+
+# Search Schemas
+class SearchResult(BaseModel):
+    type: str  # service, feature or testimonial
+    id: str
+    title: str
+    text: Optional[str] = None
+    plan_id: Optional[str] = None
+    score: float
+
+class SearchResponse(BaseModel):
+    query: str
+    total: int
+    took_ms: float
+    results: List[SearchResult]
@@ -0,0 +1,308 @@
+"""In-memory full-text search over the catalog.
+
+``SearchIndex`` is an inverted index (term -> {doc: weighted term frequency})
+over service titles and descriptions, plan feature names and testimonial
+content, built from the catalog snapshot so queries never reach MySQL.
+Text is lowercased, stripped of accents and split on non-alphanumerics.
+Each query term also matches up to SEARCH_MAX_EXPANSIONS indexed terms it is
+a prefix of (found by bisecting the sorted vocabulary), at a reduced weight,
+so "book" finds "booking". Matches are ranked with BM25.
+
+``CatalogSearch`` keeps an index per tenant, for the SEARCH_MAX_TENANTS most
+recently searched tenants, in step with that tenant's snapshot: after a swap
+it diffs the new records against the indexed ones and re-indexes only the
+documents that changed. The first build, or a change touching more than
+SEARCH_REBUILD_FRACTION of the documents, is done from scratch in a worker
+thread and swapped in whole; incremental updates run on the event loop,
+where queries run too, so neither ever sees the other half done.
+"""
+import asyncio
+import heapq
+import logging
+import math
+import os
+import re
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import OrderedDict, defaultdict
+
+from cache import catalog_cache
+from catalog_snapshot import catalog_snapshot
+from models import DEFAULT_TENANT
+
+logger = logging.getLogger(__name__)
+
+SEARCH_DEFAULT_LIMIT = int(os.environ.get('SEARCH_DEFAULT_LIMIT', '10'))
+SEARCH_MAX_LIMIT = int(os.environ.get('SEARCH_MAX_LIMIT', '50'))
+SEARCH_MAX_QUERY_CHARS = int(os.environ.get('SEARCH_MAX_QUERY_CHARS', '200'))
+SEARCH_MAX_EXPANSIONS = int(os.environ.get('SEARCH_MAX_EXPANSIONS', '32'))
+SEARCH_REBUILD_FRACTION = float(os.environ.get('SEARCH_REBUILD_FRACTION', '0.2'))
+SEARCH_MAX_TENANTS = int(os.environ.get('SEARCH_MAX_TENANTS', '1000'))
+
+TYPES = ("service", "feature", "testimonial")
+# BM25 parameters, and the weight of a prefix match relative to an exact one
+BM25_K1 = 1.2
+BM25_B = 0.75
+PREFIX_WEIGHT = 0.5
+TITLE_WEIGHT = 2.0
+MIN_PREFIX_CHARS = 2
+SNIPPET_CHARS = 160
+
+_WORD = re.compile(r"[^\W_]+")
+
+
+def tokenize(text):
+    if not text:
+        return []
+    text = text.lower()
+    if not text.isascii():
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+    return _WORD.findall(text)
+
+
+def catalog_documents(snapshot):
+    """Map ``(type, id)`` to ``(source, title, text, plan_id)`` for every
+    searchable record; ``source`` is compared to spot changed documents."""
+    docs = {}
+    for service in snapshot.sections["services"]:
+        docs[("service", service.id)] = (service, service.title, service.description, None)
+    for plan in snapshot.sections["plans"]:
+        for feature in plan.features:
+            docs[("feature", feature.id)] = ((feature, plan.name), feature.name, plan.name, plan.id)
+    for testimonial in snapshot.sections["testimonials"]:
+        title = testimonial.name + (", " + testimonial.role if testimonial.role else "")
+        docs[("testimonial", testimonial.id)] = (testimonial, title, testimonial.content, None)
+    return docs
+
+
+def _field_terms(doc_type, title, text):
+    # Services are matched on title and description, features on their name
+    # (the plan name is only shown), testimonials on their content.
+    terms = defaultdict(float)
+    if doc_type != "testimonial":
+        for term in tokenize(title):
+            terms[term] += TITLE_WEIGHT
+    if doc_type != "feature":
+        for term in tokenize(text):
+            terms[term] += 1.0
+    return terms
+
+
+class SearchIndex:
+    def __init__(self):
+        self.postings = {}
+        self.vocabulary = []  # sorted, for prefix lookups
+        self.docs = {}
+        self.lengths = {}
+        self.total_length = 0.0
+        self._slots = {}
+        self._free = []
+        self._bulk = False
+
+    def __len__(self):
+        return len(self._slots)
+
+    def add(self, key, source, title, text, plan_id):
+        slot = self._free.pop() if self._free else len(self.docs)
+        terms = _field_terms(key[0], title, text)
+        self._slots[key] = slot
+        self.docs[slot] = (key, source, title, text, plan_id, tuple(terms))
+        self.lengths[slot] = length = sum(terms.values())
+        self.total_length += length
+        for term, tf in terms.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                if not self._bulk:
+                    insort(self.vocabulary, term)
+            postings[slot] = tf
+
+    def remove(self, key):
+        slot = self._slots.pop(key)
+        terms = self.docs.pop(slot)[5]
+        self.total_length -= self.lengths.pop(slot)
+        for term in terms:
+            postings = self.postings[term]
+            del postings[slot]
+            if not postings:
+                del self.postings[term]
+                del self.vocabulary[bisect_left(self.vocabulary, term)]
+        self._free.append(slot)
+
+    def source(self, key):
+        slot = self._slots.get(key)
+        return None if slot is None else self.docs[slot][1]
+
+    def keys(self):
+        return self._slots.keys()
+
+    def _expand(self, token):
+        if token in self.postings:
+            yield token, 1.0
+        if len(token) < MIN_PREFIX_CHARS:
+            return
+        start = bisect_left(self.vocabulary, token)
+        for term in self.vocabulary[start:start + SEARCH_MAX_EXPANSIONS + 1]:
+            if not term.startswith(token):
+                break
+            if term != token:
+                yield term, PREFIX_WEIGHT
+
+    def search(self, query, limit, types=None):
+        """Return ``(total_matches, [(score, slot), ...])`` best first."""
+        count = len(self._slots)
+        if not count:
+            return 0, []
+        average = self.total_length / count or 1.0
+        scores = defaultdict(float)
+        for token in dict.fromkeys(tokenize(query)):
+            for term, weight in self._expand(token):
+                postings = self.postings[term]
+                df = len(postings)
+                idf = weight * math.log(1 + (count - df + 0.5) / (df + 0.5))
+                for slot, tf in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[slot] / average)
+                    scores[slot] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        if types is not None:
+            scores = {slot: score for slot, score in scores.items() if self.docs[slot][0][0] in types}
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return len(scores), [(score, slot) for slot, score in best]
+
+    def result(self, slot, score):
+        (doc_type, doc_id), _, title, text, plan_id, _ = self.docs[slot]
+        if text is not None and len(text) > SNIPPET_CHARS:
+            text = text[:SNIPPET_CHARS].rsplit(" ", 1)[0] + "…"
+        return {"type": doc_type, "id": doc_id, "title": title, "text": text, "plan_id": plan_id,
+                "score": round(score, 4)}
+
+
+def build_index(docs):
+    index = SearchIndex()
+    index._bulk = True  # sort the vocabulary once at the end
+    for key, (source, title, text, plan_id) in docs.items():
+        index.add(key, source, title, text, plan_id)
+    index.vocabulary = sorted(index.postings)
+    index._bulk = False
+    return index
+
+
+class _TenantIndex:
+    __slots__ = ("index", "sections", "version", "lock")
+
+    def __init__(self):
+        self.index = SearchIndex()
+        self.sections = None
+        self.version = None
+        self.lock = asyncio.Lock()
+
+
+class CatalogSearch:
+    def __init__(self, max_tenants: int = SEARCH_MAX_TENANTS):
+        self.max_tenants = max_tenants
+        self.tenants = OrderedDict()  # tenant -> _TenantIndex, least recently searched first
+        self.builds = 0
+        self.updates = 0
+        self.updated_docs = 0
+        self.evictions = 0
+        # The loop only keeps weak references to tasks
+        self._refreshing = set()
+        catalog_snapshot.on_swap(self._on_swap)
+
+    def _on_swap(self, snapshot):
+        # Only once searched: tenants nobody searches never get an index
+        if snapshot.tenant_id in self.tenants:
+            task = asyncio.get_running_loop().create_task(self._refresh_logged(snapshot))
+            self._refreshing.add(task)
+            task.add_done_callback(self._refreshing.discard)
+
+    async def _refresh_logged(self, snapshot):
+        try:
+            await self.refresh(snapshot)
+        except Exception as e:
+            logger.warning("Search index refresh failed for tenant %s: %s", snapshot.tenant_id, e)
+
+    @staticmethod
+    def _diff(index, snapshot):
+        docs = catalog_documents(snapshot)
+        stale = [key for key in index.keys() if key not in docs]
+        changed = [key for key, doc in docs.items() if index.source(key) != doc[0]]
+        return docs, stale, changed
+
+    def _entry(self, tenant):
+        entry = self.tenants.get(tenant)
+        if entry is None:
+            entry = self.tenants[tenant] = _TenantIndex()
+            while len(self.tenants) > self.max_tenants:
+                self.tenants.popitem(last=False)
+                self.evictions += 1
+        self.tenants.move_to_end(tenant)
+        return entry
+
+    async def refresh(self, snapshot):
+        entry = self._entry(snapshot.tenant_id)
+        async with entry.lock:
+            current = catalog_snapshot.peek(snapshot.tenant_id)
+            if current is not None and current.version > snapshot.version:
+                snapshot = current
+            # A retagged snapshot shares its sections with the one it came from
+            if snapshot.sections is entry.sections:
+                entry.version = max(entry.version, snapshot.version)
+                return entry
+            # Only reads the index; mutations happen below, on the loop, under the lock
+            docs, stale, changed = await asyncio.to_thread(self._diff, entry.index, snapshot)
+            index = entry.index
+            if entry.sections is None or len(stale) + len(changed) > SEARCH_REBUILD_FRACTION * max(len(index), 1):
+                start = time.perf_counter()
+                entry.index = await asyncio.to_thread(build_index, docs)
+                self.builds += 1
+                logger.info("Search index built for tenant %s: %d documents in %.1f ms", snapshot.tenant_id,
+                            len(docs), (time.perf_counter() - start) * 1000)
+            else:
+                for key in stale:
+                    index.remove(key)
+                for key in changed:
+                    if index.source(key) is not None:
+                        index.remove(key)
+                    index.add(key, *docs[key])
+                self.updates += 1
+                self.updated_docs += len(stale) + len(changed)
+            entry.sections = snapshot.sections
+            entry.version = snapshot.version
+        return entry
+
+    async def search(self, query: str, limit: int, types=None, tenant: str = DEFAULT_TENANT):
+        entry = self.tenants.get(tenant)
+        # Compared by version, not through get(): an oversize tenant's
+        # snapshot is not kept, so get() would reload it on every query
+        if entry is None or entry.version is None or entry.version < catalog_cache.version_of(tenant):
+            entry = await self.refresh(await catalog_snapshot.get(tenant))
+        else:
+            self.tenants.move_to_end(tenant)
+        index = entry.index
+        start = time.perf_counter()
+        total, hits = index.search(query, limit, types)
+        results = [index.result(slot, score) for score, slot in hits]
+        return {"query": query, "total": total, "took_ms": round((time.perf_counter() - start) * 1000, 3),
+                "results": results}
+
+    def stats(self, tenant: str = None) -> dict:
+        indexes = [entry.index for entry in self.tenants.values()]
+        stats = {
+            "tenants": len(self.tenants),
+            "max_tenants": self.max_tenants,
+            "documents": sum(len(index) for index in indexes),
+            "terms": sum(len(index.postings) for index in indexes),
+            "builds": self.builds,
+            "incremental_updates": self.updates,
+            "updated_documents": self.updated_docs,
+            "evictions": self.evictions,
+        }
+        if tenant is not None:
+            entry = self.tenants.get(tenant)
+            stats["tenant"] = {"id": tenant, "documents": len(entry.index) if entry is not None else 0,
+                               "terms": len(entry.index.postings) if entry is not None else 0}
+        return stats
+
+
+catalog_search = CatalogSearch()
@@ -1,122 +1,238 @@
+from sqlalchemy import insert, text
 from sqlalchemy.orm import Session
-from models import SubscriptionPlan, PlanFeature, Service, Testimonial, HeroStat
+from models import DEFAULT_TENANT, SubscriptionPlan, PlanFeature, Service, Testimonial, HeroStat
+from cache import catalog_cache
+from contextlib import contextmanager
+import gzip
+import json
 import uuid
 
-def seed_database(db: Session):
-    # Check if data already exists
-    if db.query(SubscriptionPlan).first():
-        print("Database already seeded")
+SEED_LOCK_NAME = "apptelier_seed"
+SEED_LOCK_TIMEOUT = 30
+DEFAULT_CHUNK_SIZE = 5000
+
+# Seed Hero Stats
+HERO_STATS = [
+    {"value": "10K+", "label": "Active Businesses", "order_index": 0},
+    {"value": "2M+", "label": "Orders Processed", "order_index": 1},
+    {"value": "99.9%", "label": "Uptime", "order_index": 2},
+    {"value": "4.9/5", "label": "Customer Rating", "order_index": 3},
+]
+
+# Seed Subscription Plans with Features
+PLANS = [
+    {
+        "name": "Basic",
+        "price": 49,
+        "period": "month",
+        "description": "Perfect for small businesses just getting started",
+        "popular": False,
+        "order_index": 0,
+        "features": [
+            {"name": "Up to 100 orders/month", "included": True},
+            {"name": "Basic booking calendar", "included": True},
+            {"name": "Email notifications", "included": True},
+            {"name": "Standard support", "included": True},
+            {"name": "1 user account", "included": True},
+            {"name": "Basic analytics", "included": True},
+            {"name": "Custom branding", "included": False},
+            {"name": "API access", "included": False},
+            {"name": "Priority support", "included": False},
+        ]
+    },
+    {
+        "name": "Growth",
+        "price": 129,
+        "period": "month",
+        "description": "Ideal for growing businesses with higher demands",
+        "popular": True,
+        "order_index": 1,
+        "features": [
+            {"name": "Up to 1,000 orders/month", "included": True},
+            {"name": "Advanced booking system", "included": True},
+            {"name": "SMS & Email notifications", "included": True},
+            {"name": "Priority support", "included": True},
+            {"name": "5 user accounts", "included": True},
+            {"name": "Advanced analytics", "included": True},
+            {"name": "Custom branding", "included": True},
+            {"name": "API access", "included": True},
+            {"name": "Integrations (Zapier, etc.)", "included": False},
+        ]
+    },
+    {
+        "name": "Professional",
+        "price": 299,
+        "period": "month",
+        "description": "Enterprise-grade solution for maximum scalability",
+        "popular": False,
+        "order_index": 2,
+        "features": [
+            {"name": "Unlimited orders", "included": True},
+            {"name": "Full booking suite", "included": True},
+            {"name": "Multi-channel notifications", "included": True},
+            {"name": "24/7 dedicated support", "included": True},
+            {"name": "Unlimited user accounts", "included": True},
+            {"name": "Real-time analytics & reports", "included": True},
+            {"name": "White-label branding", "included": True},
+            {"name": "Full API access", "included": True},
+            {"name": "Custom integrations", "included": True},
+        ]
+    }
+]
+
+# Seed Services
+SERVICES = [
+    {"title": "Online Ordering System", "description": "Accept and manage orders seamlessly with our intuitive ordering platform. Works across web and mobile.", "icon": "ShoppingCart", "order_index": 0},
+    {"title": "Appointment Booking", "description": "Let customers book appointments 24/7 with automated scheduling and reminders.", "icon": "Calendar", "order_index": 1},
+    {"title": "Table Reservations", "description": "Manage restaurant bookings efficiently with real-time availability and waitlist management.", "icon": "Utensils", "order_index": 2},
+    {"title": "Queue Management", "description": "Reduce wait times and improve customer experience with smart queue systems.", "icon": "Users", "order_index": 3},
+    {"title": "Custom Integrations", "description": "Connect with your existing tools - POS, CRM, payment gateways, and more.", "icon": "Plug", "order_index": 4},
+    {"title": "Analytics Dashboard", "description": "Gain insights into your business with real-time data and comprehensive reports.", "icon": "BarChart3", "order_index": 5},
+]
+
+# Seed Testimonials
+TESTIMONIALS = [
+    {"name": "Sarah Chen", "role": "Owner, Sakura Bistro", "content": "Apptelier transformed how we handle reservations. Our no-show rate dropped by 60% and our staff can focus on what matters - serving customers.", "rating": 5, "avatar": "SC"},
+    {"name": "Marcus Johnson", "role": "CEO, TechFit Gym", "content": "The booking system is incredibly intuitive. Our members love being able to book classes anytime, and we've seen a 40% increase in class attendance.", "rating": 5, "avatar": "MJ"},
+    {"name": "Emily Rodriguez", "role": "Manager, StyleCraft Salon", "content": "Since implementing Apptelier, we've reduced phone time by 70%. The automated reminders have been a game-changer for reducing missed appointments.", "rating": 5, "avatar": "ER"},
+    {"name": "David Kim", "role": "Director, MedCare Clinic", "content": "The professional tier gives us everything we need for our multi-location practice. The analytics help us optimize scheduling across all our clinics.", "rating": 5, "avatar": "DK"},
+]
+
+# Fixture record type -> model. Inserts are flushed in this order so plans
+# always exist before the features that reference them.
+FIXTURE_MODELS = {
+    "hero_stat": HeroStat,
+    "plan": SubscriptionPlan,
+    "feature": PlanFeature,
+    "service": Service,
+    "testimonial": Testimonial,
+}
+
+def _with_id(row):
+    return row if row.get("id") else {**row, "id": str(uuid.uuid4())}
+
+def _insert_ignore(db: Session, model):
+    # Rows that already exist (same primary key) are skipped, which makes
+    # re-running a fixture idempotent.
+    dialect = db.get_bind().dialect.name
+    stmt = insert(model)
+    if dialect in ("mysql", "mariadb"):
+        return stmt.prefix_with("IGNORE")
+    if dialect == "sqlite":
+        return stmt.prefix_with("OR IGNORE")
+    return stmt
+
+def bulk_insert(db: Session, model, rows, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Insert ``rows`` (dicts of column values) with one executemany per chunk."""
+    stmt = _insert_ignore(db, model)
+    for start in range(0, len(rows), chunk_size):
+        db.execute(stmt, rows[start:start + chunk_size])
+
+@contextmanager
+def seed_lock(db: Session, timeout: int = SEED_LOCK_TIMEOUT):
+    """Serialize seeding across workers with a MySQL advisory lock.
+
+    Yields ``False`` if another worker held the lock for the whole timeout.
+    The lock lives on its own connection because commits hand the session's
+    connection back to the pool. Other databases run unlocked.
+    """
+    bind = db.get_bind()
+    if bind.dialect.name not in ("mysql", "mariadb"):
+        yield True
         return
-    
-    print("Seeding database...")
-    
-    # Seed Hero Stats
-    hero_stats = [
-        {"value": "10K+", "label": "Active Businesses", "order_index": 0},
-        {"value": "2M+", "label": "Orders Processed", "order_index": 1},
-        {"value": "99.9%", "label": "Uptime", "order_index": 2},
-        {"value": "4.9/5", "label": "Customer Rating", "order_index": 3},
-    ]
-    for stat in hero_stats:
-        db.add(HeroStat(id=str(uuid.uuid4()), **stat))
-    
-    # Seed Subscription Plans with Features
-    plans_data = [
-        {
-            "name": "Basic",
-            "price": 49,
-            "period": "month",
-            "description": "Perfect for small businesses just getting started",
-            "popular": False,
-            "order_index": 0,
-            "features": [
-                {"name": "Up to 100 orders/month", "included": True},
-                {"name": "Basic booking calendar", "included": True},
-                {"name": "Email notifications", "included": True},
-                {"name": "Standard support", "included": True},
-                {"name": "1 user account", "included": True},
-                {"name": "Basic analytics", "included": True},
-                {"name": "Custom branding", "included": False},
-                {"name": "API access", "included": False},
-                {"name": "Priority support", "included": False},
-            ]
-        },
-        {
-            "name": "Growth",
-            "price": 129,
-            "period": "month",
-            "description": "Ideal for growing businesses with higher demands",
-            "popular": True,
-            "order_index": 1,
-            "features": [
-                {"name": "Up to 1,000 orders/month", "included": True},
-                {"name": "Advanced booking system", "included": True},
-                {"name": "SMS & Email notifications", "included": True},
-                {"name": "Priority support", "included": True},
-                {"name": "5 user accounts", "included": True},
-                {"name": "Advanced analytics", "included": True},
-                {"name": "Custom branding", "included": True},
-                {"name": "API access", "included": True},
-                {"name": "Integrations (Zapier, etc.)", "included": False},
-            ]
-        },
-        {
-            "name": "Professional",
-            "price": 299,
-            "period": "month",
-            "description": "Enterprise-grade solution for maximum scalability",
-            "popular": False,
-            "order_index": 2,
-            "features": [
-                {"name": "Unlimited orders", "included": True},
-                {"name": "Full booking suite", "included": True},
-                {"name": "Multi-channel notifications", "included": True},
-                {"name": "24/7 dedicated support", "included": True},
-                {"name": "Unlimited user accounts", "included": True},
-                {"name": "Real-time analytics & reports", "included": True},
-                {"name": "White-label branding", "included": True},
-                {"name": "Full API access", "included": True},
-                {"name": "Custom integrations", "included": True},
-            ]
-        }
-    ]
-    
-    for plan_data in plans_data:
-        features = plan_data.pop("features")
-        plan_id = str(uuid.uuid4())
-        plan = SubscriptionPlan(id=plan_id, **plan_data)
-        db.add(plan)
-        
-        for idx, feature in enumerate(features):
-            db.add(PlanFeature(
-                id=str(uuid.uuid4()),
-                plan_id=plan_id,
-                name=feature["name"],
-                included=feature["included"],
-                order_index=idx
-            ))
-    
-    # Seed Services
-    services = [
-        {"title": "Online Ordering System", "description": "Accept and manage orders seamlessly with our intuitive ordering platform. Works across web and mobile.", "icon": "ShoppingCart", "order_index": 0},
-        {"title": "Appointment Booking", "description": "Let customers book appointments 24/7 with automated scheduling and reminders.", "icon": "Calendar", "order_index": 1},
-        {"title": "Table Reservations", "description": "Manage restaurant bookings efficiently with real-time availability and waitlist management.", "icon": "Utensils", "order_index": 2},
-        {"title": "Queue Management", "description": "Reduce wait times and improve customer experience with smart queue systems.", "icon": "Users", "order_index": 3},
-        {"title": "Custom Integrations", "description": "Connect with your existing tools - POS, CRM, payment gateways, and more.", "icon": "Plug", "order_index": 4},
-        {"title": "Analytics Dashboard", "description": "Gain insights into your business with real-time data and comprehensive reports.", "icon": "BarChart3", "order_index": 5},
-    ]
-    for service in services:
-        db.add(Service(id=str(uuid.uuid4()), **service))
-    
-    # Seed Testimonials
-    testimonials = [
-        {"name": "Sarah Chen", "role": "Owner, Sakura Bistro", "content": "Apptelier transformed how we handle reservations. Our no-show rate dropped by 60% and our staff can focus on what matters - serving customers.", "rating": 5, "avatar": "SC"},
-        {"name": "Marcus Johnson", "role": "CEO, TechFit Gym", "content": "The booking system is incredibly intuitive. Our members love being able to book classes anytime, and we've seen a 40% increase in class attendance.", "rating": 5, "avatar": "MJ"},
-        {"name": "Emily Rodriguez", "role": "Manager, StyleCraft Salon", "content": "Since implementing Apptelier, we've reduced phone time by 70%. The automated reminders have been a game-changer for reducing missed appointments.", "rating": 5, "avatar": "ER"},
-        {"name": "David Kim", "role": "Director, MedCare Clinic", "content": "The professional tier gives us everything we need for our multi-location practice. The analytics help us optimize scheduling across all our clinics.", "rating": 5, "avatar": "DK"},
-    ]
-    for testimonial in testimonials:
-        db.add(Testimonial(id=str(uuid.uuid4()), **testimonial))
-    
-    db.commit()
-    print("Database seeded successfully!")
+    with bind.connect() as conn:
+        acquired = conn.execute(
+            text("SELECT GET_LOCK(:name, :timeout)"), {"name": SEED_LOCK_NAME, "timeout": timeout}
+        ).scalar()
+        try:
+            yield bool(acquired)
+        finally:
+            if acquired:
+                conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": SEED_LOCK_NAME})
+
+def seed_rows(tenant_id: str = DEFAULT_TENANT):
+    """The sample catalog as ``{model: [row, ...]}`` for ``tenant_id``, with fresh ids."""
+    plans, features = [], []
+    for plan_data in PLANS:
+        plan = _with_id({"tenant_id": tenant_id, **{k: v for k, v in plan_data.items() if k != "features"}})
+        plans.append(plan)
+        for idx, feature in enumerate(plan_data["features"]):
+            features.append(_with_id({"tenant_id": tenant_id, "plan_id": plan["id"], "order_index": idx, **feature}))
+    return {
+        HeroStat: [_with_id({"tenant_id": tenant_id, **stat}) for stat in HERO_STATS],
+        SubscriptionPlan: plans,
+        PlanFeature: features,
+        Service: [_with_id({"tenant_id": tenant_id, **service}) for service in SERVICES],
+        Testimonial: [_with_id({"tenant_id": tenant_id, **testimonial}) for testimonial in TESTIMONIALS],
+    }
+
+def seed_database(db: Session, tenant_id: str = DEFAULT_TENANT):
+    with seed_lock(db) as acquired:
+        if not acquired:
+            print("Another worker is seeding the database")
+            return
+
+        # Check if data already exists
+        if db.query(SubscriptionPlan.id).filter(SubscriptionPlan.tenant_id == tenant_id).first():
+            print("Database already seeded")
+            return
+
+        print("Seeding database...")
+        for model, rows in seed_rows(tenant_id).items():
+            bulk_insert(db, model, rows)
+
+        db.commit()
+        catalog_cache.invalidate(tenant_id)
+        print("Database seeded successfully!")
+
+def _fixture_records(path):
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def load_fixture(db: Session, path, chunk_size: int = DEFAULT_CHUNK_SIZE, tenant_id: str = DEFAULT_TENANT):
+    """Stream an NDJSON fixture into ``tenant_id``'s catalog in chunks.
+
+    Each line is one record: ``{"type": "testimonial", "name": ..., ...}``
+    where ``type`` is a key of ``FIXTURE_MODELS``. A ``plan`` record may
+    carry its features inline as a ``features`` list. Memory use is bounded
+    by ``chunk_size`` rows per table regardless of file size.
+    """
+    buffers = {record_type: [] for record_type in FIXTURE_MODELS}
+    counts = dict.fromkeys(FIXTURE_MODELS, 0)
+
+    def flush():
+        for record_type, model in FIXTURE_MODELS.items():
+            rows = buffers[record_type]
+            if rows:
+                bulk_insert(db, model, rows, chunk_size)
+                counts[record_type] += len(rows)
+                rows.clear()
+        db.commit()
+
+    with seed_lock(db) as acquired:
+        if not acquired:
+            raise RuntimeError("Timed out waiting for the seed lock")
+        pending = 0
+        for record in _fixture_records(path):
+            record_type = record.pop("type")
+            if record_type not in FIXTURE_MODELS:
+                raise ValueError(f"Unknown fixture record type: {record_type!r}")
+            record = _with_id({**record, "tenant_id": tenant_id})
+            if record_type == "plan":
+                for idx, feature in enumerate(record.pop("features", [])):
+                    buffers["feature"].append(_with_id({"tenant_id": tenant_id, "plan_id": record["id"],
+                                                        "order_index": idx, **feature}))
+                    pending += 1
+            buffers[record_type].append(record)
+            pending += 1
+            if pending >= chunk_size:
+                flush()
+                pending = 0
+        flush()
+
+    catalog_cache.invalidate(tenant_id)
+    return counts
@@ -1,26 +1,53 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Query, Request
 from dotenv import load_dotenv
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.datastructures import MutableHeaders
 from starlette.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+import asyncio
+import math
 import os
+import uuid
 import logging
+import time
 from pathlib import Path
-from typing import List
-
-from database import engine, get_db, Base
-from models import SubscriptionPlan as PlanModel, PlanFeature as FeatureModel
-from models import Service as ServiceModel, Testimonial as TestimonialModel, HeroStat as HeroStatModel
-from schemas import SubscriptionPlan, Service, Testimonial, HeroStat, PlanFeature
-from seed_data import seed_database
+from datetime import datetime, timezone
+from typing import List, Optional
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+from database import run_db, dispose_engines, pool_stats, ping, reads_on_primary, replicas, route_reads_to_replica
+from migrations import migrate
+from schemas import SubscriptionPlan, Service, Testimonial, HeroStat, PlanFeature, LandingPage, LeadCreate, LeadAccepted, SearchResponse
+from seed_data import seed_database
+from catalog import CATALOG, read_payload
+from payload import Payload, payload_response
+from cache import catalog_cache, ttl_for
+from readiness import Readiness
+from admin import admin_router, require_admin
+from leads import lead_writer, lead_limiter
+from ratelimit import client_ip
+from loadshed import LoadShedder, LoadShedMiddleware
+from slowlog import slow_queries
+from changes import CHANGES_FEED, change_feed
+from search import SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT, SEARCH_MAX_QUERY_CHARS, TYPES, catalog_search
+from catalog_snapshot import CATALOG_SNAPSHOT, catalog_snapshot, snapshot_payload
+from pagination import PAGE_DEFAULT_LIMIT, PAGE_MAX_LIMIT, InvalidCursor, decode_cursor, read_page, stream_ndjson
+from models import DEFAULT_TENANT
+from tenants import TenantMiddleware, current_tenant, tenant_registry
+import metrics
+
+# Startup mode:
+#   auto - apply migrations and seed an empty database when the worker boots
+#   fast - touch nothing at boot; run `python manage.py init` out of band
+STARTUP_MODE = os.environ.get('STARTUP_MODE', 'auto').lower()
+
+# When true, /api/ready fails until every catalog section is cached
+READY_REQUIRE_WARM_CACHE = os.environ.get('READY_REQUIRE_WARM_CACHE', 'true').lower() in ('1', 'true', 'yes')
 
 # Create the main app
 app = FastAPI(title="Apptelier API", version="1.0.0")
+app.state.ready = False
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -37,67 +64,255 @@ logger = logging.getLogger(__name__)
 async def root():
     return {"message": "Welcome to Apptelier API"}
 
-# Health check
+# Health check (liveness: the process is up and serving)
 @api_router.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "Apptelier"}
 
+# Readiness: startup has finished and the dependencies answer in time.
+# Probe results are cached (READY_CACHE_SECONDS) so polling never stampedes MySQL.
+readiness = Readiness()
+
+@api_router.get("/ready")
+async def readiness_check():
+    if not app.state.ready:
+        return JSONResponse(status_code=503, content={"status": "starting", "startup_mode": STARTUP_MODE})
+    result = await readiness.probe()
+    return JSONResponse(status_code=200 if result["status"] == "ready" else 503,
+                        content={**result, "startup_mode": STARTUP_MODE})
+
+# Catalog sections are cached per tenant as pre-serialized payloads: JSON
+# bytes plus ETag. If MySQL fails or times out, the last payload is served
+# rather than an error.
+async def load_section(key: str, tenant: str):
+    if CATALOG_SNAPSHOT and not catalog_snapshot.oversize(tenant):
+        # Encoded from the in-memory snapshot; MySQL is only read to refresh it
+        snapshot = await catalog_snapshot.get(tenant)
+        return await asyncio.to_thread(snapshot_payload, snapshot, key)
+    return await run_db(read_payload, key, tenant)
+
+async def cached_section(key: str, tenant: str):
+    return await catalog_cache.get_or_load(key, lambda: load_section(key, tenant), stale_on_error=True,
+                                           tenant=tenant)
+
+@readiness.check("database")
+async def check_database():
+    # The probe arrives as a GET, which would otherwise be answered by a replica
+    with reads_on_primary():
+        await run_db(ping)
+
+@readiness.check("cache", required=READY_REQUIRE_WARM_CACHE)
+async def check_cache():
+    # Warms any cold section through the cache, so a worker only reports
+    # ready once it can serve the catalog without waiting on MySQL.
+    cold = [key for key in CATALOG if not catalog_cache.contains(key, DEFAULT_TENANT)]
+    await asyncio.gather(*(cached_section(key, DEFAULT_TENANT) for key in cold))
+    return {"warmed": cold} if cold else None
+
 # Subscription Plans Endpoints
-@api_router.get("/plans", response_model=List[SubscriptionPlan])
-async def get_subscription_plans(db: Session = Depends(get_db)):
-    plans = db.query(PlanModel).order_by(PlanModel.order_index).all()
-    result = []
-    for plan in plans:
-        features = db.query(FeatureModel).filter(
-            FeatureModel.plan_id == plan.id
-        ).order_by(FeatureModel.order_index).all()
-        plan_dict = {
-            "id": plan.id,
-            "name": plan.name,
-            "price": plan.price,
-            "period": plan.period,
-            "description": plan.description,
-            "popular": plan.popular,
-            "order_index": plan.order_index,
-            "created_at": plan.created_at,
-            "updated_at": plan.updated_at,
-            "features": [
-                {
-                    "id": f.id,
-                    "plan_id": f.plan_id,
-                    "name": f.name,
-                    "included": f.included,
-                    "order_index": f.order_index
-                }
-                for f in features
-            ]
-        }
-        result.append(plan_dict)
-    return result
+@api_router.get("/plans", responses={200: {"model": List[SubscriptionPlan]}})
+async def get_subscription_plans(request: Request, tenant: str = Depends(current_tenant)):
+    return payload_response(request, await cached_section("plans", tenant))
+
+# Paged lists: the whole cached array by default, keyset pages with
+# limit/cursor (next page in X-Next-Cursor), or an NDJSON stream.
+async def list_section(request: Request, key: str, limit: Optional[int], cursor: Optional[str], format: str,
+                       tenant: str):
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+    try:
+        after = decode_cursor(key, cursor) if cursor else None
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if format == "ndjson":
+        return StreamingResponse(stream_ndjson(key, after, tenant), media_type="application/x-ndjson")
+    if limit is None and after is None:
+        return payload_response(request, await cached_section(key, tenant))
+    limit = min(limit or PAGE_DEFAULT_LIMIT, PAGE_MAX_LIMIT)
+    payload, next_cursor = await run_db(read_page, key, after, limit, tenant)
+    response = payload_response(request, payload)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+        next_url = request.url.include_query_params(cursor=next_cursor, limit=limit)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return response
 
 # Services Endpoints
-@api_router.get("/services", response_model=List[Service])
-async def get_services(db: Session = Depends(get_db)):
-    services = db.query(ServiceModel).order_by(ServiceModel.order_index).all()
-    return services
+@api_router.get("/services", responses={200: {"model": List[Service]}})
+async def get_services(request: Request, limit: Optional[int] = Query(None, ge=1), cursor: Optional[str] = None,
+                       format: str = "json", tenant: str = Depends(current_tenant)):
+    return await list_section(request, "services", limit, cursor, format, tenant)
 
 # Testimonials Endpoints
-@api_router.get("/testimonials", response_model=List[Testimonial])
-async def get_testimonials(db: Session = Depends(get_db)):
-    testimonials = db.query(TestimonialModel).all()
-    return testimonials
+@api_router.get("/testimonials", responses={200: {"model": List[Testimonial]}})
+async def get_testimonials(request: Request, limit: Optional[int] = Query(None, ge=1), cursor: Optional[str] = None,
+                           format: str = "json", tenant: str = Depends(current_tenant)):
+    return await list_section(request, "testimonials", limit, cursor, format, tenant)
 
 # Hero Stats Endpoints
-@api_router.get("/hero-stats", response_model=List[HeroStat])
-async def get_hero_stats(db: Session = Depends(get_db)):
-    stats = db.query(HeroStatModel).order_by(HeroStatModel.order_index).all()
-    return stats
+@api_router.get("/hero-stats", responses={200: {"model": List[HeroStat]}})
+async def get_hero_stats(request: Request, tenant: str = Depends(current_tenant)):
+    return payload_response(request, await cached_section("hero_stats", tenant))
+
+# Landing page: every section in one response
+LANDING_SECTIONS = ("hero_stats", "services", "plans", "testimonials")
+
+def parse_sections(sections: Optional[str]):
+    if not sections:
+        return LANDING_SECTIONS
+    requested = {name.strip().replace("-", "_") for name in sections.split(",") if name.strip()}
+    unknown = requested - set(LANDING_SECTIONS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(sorted(unknown))}")
+    return tuple(name for name in LANDING_SECTIONS if name in requested)
+
+async def load_landing(keys, tenant):
+    payloads = await asyncio.gather(*(cached_section(key, tenant) for key in keys))
+    return await asyncio.to_thread(lambda: Payload.combine(zip(keys, payloads)).precompress())
+
+@api_router.get("/landing", responses={200: {"model": LandingPage}})
+async def get_landing(request: Request, sections: Optional[str] = None, tenant: str = Depends(current_tenant)):
+    keys = parse_sections(sections)
+    payload = await catalog_cache.get_or_load(
+        "landing:" + ",".join(keys), lambda: load_landing(keys, tenant), ttl=ttl_for("landing"),
+        stale_on_error=True, tenant=tenant,
+    )
+    return payload_response(request, payload)
+
+# Catalog search, answered from an in-memory index (see search.py)
+@api_router.get("/search", responses={200: {"model": SearchResponse}})
+async def search_catalog(q: str, limit: int = Query(SEARCH_DEFAULT_LIMIT, ge=1), type: Optional[str] = None,
+                         tenant: str = Depends(current_tenant)):
+    if len(q) > SEARCH_MAX_QUERY_CHARS:
+        raise HTTPException(status_code=400, detail=f"Query longer than {SEARCH_MAX_QUERY_CHARS} characters")
+    types = None
+    if type:
+        types = {name.strip() for name in type.split(",") if name.strip()}
+        unknown = types - set(TYPES)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown types: {', '.join(sorted(unknown))}")
+    result = await catalog_search.search(q, min(limit, SEARCH_MAX_LIMIT), types, tenant)
+    return JSONResponse(result)
+
+@api_router.get("/search/stats")
+async def search_stats(tenant: str = Depends(current_tenant)):
+    return catalog_search.stats(tenant)
+
+# Catalog change feed (Server-Sent Events, see changes.py)
+@api_router.get("/changes")
+async def catalog_changes(request: Request, tenant: str = Depends(current_tenant)):
+    if not CHANGES_FEED:
+        raise HTTPException(status_code=404, detail="Change feed disabled")
+    if change_feed.full():
+        raise HTTPException(status_code=503, detail="Too many change feed clients",
+                            headers={"Retry-After": "30"})
+    last_event_id = request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+    return StreamingResponse(change_feed.stream(last_event_id, tenant), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@api_router.get("/changes/stats")
+async def changes_stats(tenant: str = Depends(current_tenant)):
+    return change_feed.stats(tenant)
+
+# Lead capture: accepted immediately, written to the database in batches
+@api_router.post("/leads", status_code=202, response_model=LeadAccepted)
+async def create_lead(lead: LeadCreate, request: Request, tenant: str = Depends(current_tenant)):
+    ip = client_ip(request)
+    wait = lead_limiter.acquire(ip)
+    if wait:
+        raise HTTPException(status_code=429, detail="Too many submissions. Please try again shortly.",
+                            headers={"Retry-After": str(math.ceil(wait))})
+    row = {
+        "id": str(uuid.uuid4()),
+        "tenant_id": tenant,
+        **lead.model_dump(),
+        "email": lead.email or None,
+        "ip": ip,
+        "created_at": datetime.now(timezone.utc).replace(tzinfo=None),
+    }
+    if not lead_writer.running:
+        logger.error("Lead writer is not running; refusing lead")
+        raise HTTPException(status_code=503, detail="Submissions are unavailable right now. Please try again later.",
+                            headers={"Retry-After": "60"})
+    if not lead_writer.submit(row):
+        raise HTTPException(status_code=503, detail="Too many submissions right now. Please try again shortly.",
+                            headers={"Retry-After": "5"})
+    return LeadAccepted(id=row["id"])
+
+@api_router.get("/leads/stats")
+async def lead_stats():
+    return {**lead_writer.stats(), "throttle": lead_limiter.stats()}
+
+# Load shedding: requests beyond a route's concurrency limit and wait queue
+# get a fast 503, or for catalog routes the last payload marked as stale.
+CATALOG_ROUTES = {"/api/plans": "plans", "/api/services": "services",
+                  "/api/testimonials": "testimonials", "/api/hero-stats": "hero_stats"}
+
+def stale_catalog_response(request: Request):
+    path = request.url.path
+    if path == "/api/landing":
+        try:
+            key = "landing:" + ",".join(parse_sections(request.query_params.get("sections")))
+        except HTTPException:
+            return None
+    else:
+        key = CATALOG_ROUTES.get(path)
+    # Resolved by TenantMiddleware, which runs outside load shedding
+    tenant = request.scope.get("tenant")
+    payload = (catalog_cache.peek_stale(key, tenant)
+               if key is not None and tenant is not None and request.method == "GET" else None)
+    if payload is None:
+        return None
+    response = payload_response(request, payload)
+    response.headers["Warning"] = '110 - "Response is Stale"'
+    return response
+
+load_shedder = LoadShedder(app.router, fallback=stale_catalog_response)
+
+@api_router.get("/loadshed/stats")
+async def loadshed_stats():
+    return load_shedder.stats()
+
+# In-memory catalog snapshot (size, row counts, reloads)
+@api_router.get("/snapshot/stats")
+async def snapshot_stats(tenant: str = Depends(current_tenant)):
+    return catalog_snapshot.stats(tenant)
+
+# Cache statistics (hit/miss/eviction counters and per-tenant memory for sizing)
+@api_router.get("/cache/stats")
+async def cache_stats(tenant: str = Depends(current_tenant)):
+    return catalog_cache.stats(tenant)
+
+# Tenants using the most cache memory (names other tenants, so admin only)
+@api_router.get("/cache/tenants", dependencies=[Depends(require_admin)])
+async def cache_tenants(limit: int = Query(5, ge=1, le=100)):
+    return {"largest_tenants": catalog_cache.largest_tenants(limit)}
+
+# Known tenants (ids and domains, so admin only)
+@api_router.get("/tenants/stats", dependencies=[Depends(require_admin)])
+async def tenants_stats():
+    return tenant_registry.stats()
+
+# Connection pool statistics (saturation, overflow, checkout wait)
+@api_router.get("/pool/stats")
+async def get_pool_stats():
+    return pool_stats()
+
+# Read-replica routing status
+@api_router.get("/replicas/stats")
+async def get_replica_stats():
+    return replicas.stats()
+
+# Recent slow statements with their routes and plans (SQL text, so admin only)
+@api_router.get("/slow-queries", dependencies=[Depends(require_admin)])
+async def get_slow_queries():
+    return slow_queries.stats()
 
 # Seed data endpoint (for initial setup)
 @api_router.post("/seed")
-async def seed_data(db: Session = Depends(get_db)):
+async def seed_data(tenant: str = Depends(current_tenant)):
     try:
-        seed_database(db)
+        await run_db(seed_database, tenant)
         return {"message": "Database seeded successfully"}
     except Exception as e:
         logger.error(f"Error seeding database: {e}")
@@ -105,6 +320,77 @@ async def seed_data(db: Session = Depends(get_db)):
 
 # Include the router in the main app
 app.include_router(api_router)
+app.include_router(admin_router)
+
+# Prometheus metrics
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@metrics.register_collector
+def cache_metric_lines():
+    stats = catalog_cache.stats()
+    lines = []
+    for key in ("hits", "misses", "evictions", "tenant_evictions", "oversize", "loads", "coalesced", "load_errors",
+                "shared_hits", "shared_misses", "store_errors", "stale_served"):
+        lines.extend(metrics.gauge_lines(f"apptelier_cache_{key}_total", f"Catalog cache {key.replace('_', ' ')}.",
+                                         [({}, stats[key])], "counter"))
+    for key in ("size", "bytes", "tenants", "version"):
+        lines.extend(metrics.gauge_lines(f"apptelier_cache_{key}", f"Catalog cache {key}.", [({}, stats[key])]))
+    return lines
+
+@metrics.register_collector
+def loadshed_metric_lines():
+    routes = [({"method": method, "route": path}, limiter)
+              for (method, path), limiter in sorted(load_shedder.limiters.items())]
+    lines = metrics.gauge_lines("apptelier_loadshed_limit", "Current concurrency limit per route.",
+                                [(labels, round(limiter.limit, 2)) for labels, limiter in routes])
+    lines.extend(metrics.gauge_lines("apptelier_loadshed_in_flight", "Requests in flight per route.",
+                                     [(labels, limiter.in_flight) for labels, limiter in routes]))
+    lines.extend(metrics.gauge_lines("apptelier_loadshed_shed_total", "Requests shed per route.",
+                                     [(labels, limiter.rejected + limiter.timeouts) for labels, limiter in routes],
+                                     "counter"))
+    lines.extend(metrics.gauge_lines("apptelier_loadshed_stale_total", "Shed requests answered with stale data.",
+                                     [({}, load_shedder.fallbacks)], "counter"))
+    return lines
+
+# Concurrency limits sit inside the timing middleware so shed requests are measured too
+app.add_middleware(LoadShedMiddleware, shedder=load_shedder)
+
+# Resolve the tenant (host or X-Tenant) once per request, before shedding
+# so stale fallbacks serve the right tenant's payload
+app.add_middleware(TenantMiddleware)
+
+# Per-request latency, SQL count/time and response size, plus a
+# Server-Timing header so slow paths show up in browser devtools. Plain
+# ASGI rather than @app.middleware, which would put every response (and
+# every open /api/changes stream) through an extra task and memory stream.
+class TimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        stats = metrics.begin_request(scope)
+        # Reads made while serving GET/HEAD may be answered by a replica
+        route_reads_to_replica(scope["method"] in ("GET", "HEAD"))
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - start
+                route = scope.get("route")
+                headers = MutableHeaders(scope=message)
+                size = headers.get("content-length")
+                metrics.observe_request(scope["method"], route.path if route is not None else "unmatched",
+                                        message["status"], elapsed, stats, int(size) if size is not None else None)
+                headers["Server-Timing"] = metrics.server_timing(stats, elapsed)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+app.add_middleware(TimingMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -112,20 +398,39 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Link"],
 )
 
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting Apptelier API...")
-    # Auto-seed on startup if database is empty
-    db = next(get_db())
+    if STARTUP_MODE == "auto":
+        # Apply pending migrations and auto-seed if the database is empty
+        try:
+            await asyncio.to_thread(migrate)
+            await run_db(seed_database)
+        except Exception as e:
+            logger.error(f"Error during startup seed: {e}")
     try:
-        seed_database(db)
+        await tenant_registry.reload()
     except Exception as e:
-        logger.error(f"Error during startup seed: {e}")
-    finally:
-        db.close()
+        logger.error(f"Error loading tenants: {e}")
+    tenant_registry.start()
+    lead_writer.start()
+    # The change feed diffs snapshots, so it needs the refresher too
+    if CATALOG_SNAPSHOT or CHANGES_FEED:
+        catalog_snapshot.start()
+    if CHANGES_FEED:
+        change_feed.start()
+    app.state.ready = True
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down Apptelier API...")
+    await lead_writer.stop()
+    await tenant_registry.stop()
+    await change_feed.stop()
+    await catalog_snapshot.stop()
+    if catalog_cache.store is not None:
+        await catalog_cache.store.close()
+    await dispose_engines()
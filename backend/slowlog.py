@@ -0,0 +1,151 @@
+"""Slow-query log with automatic EXPLAIN.
+
+Every statement that takes longer than SLOW_QUERY_MS (0 disables the log)
+is logged on the ``slowlog`` logger and kept in a ring of the last
+SLOW_QUERY_LOG_SIZE entries (``GET /api/slow-queries``), together with the
+route of the request that issued it, taken from the metrics request context.
+
+SELECTs also get their query plan. EXPLAIN runs in a background thread on a
+separate connection, never on the one still holding the slow result, and at
+most once per distinct statement every SLOW_QUERY_EXPLAIN_SECONDS. Bound
+parameters are only passed to EXPLAIN; they are never stored or logged, as
+lead inserts carry personal data.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+
+import metrics
+
+logger = logging.getLogger("slowlog")
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', 'true').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_EXPLAIN_SECONDS = float(os.environ.get('SLOW_QUERY_EXPLAIN_SECONDS', '300'))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE', '100'))
+
+MAX_STATEMENT_CHARS = 4000
+
+
+def _plain(value):
+    return value if value is None or isinstance(value, (str, int, float, bool)) else str(value)
+
+
+def explain(bind, statement, parameters):
+    """Return the plan of ``statement`` as a list of row dicts."""
+    prefix = "EXPLAIN QUERY PLAN " if bind.dialect.name == "sqlite" else "EXPLAIN "
+    with bind.connect() as conn:
+        conn.execution_options(apptelier_explain=True)
+        result = conn.exec_driver_sql(prefix + statement, parameters)
+        keys = list(result.keys())
+        return [{key: _plain(value) for key, value in zip(keys, row)} for row in result]
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS, size: int = SLOW_QUERY_LOG_SIZE,
+                 explain_plans: bool = SLOW_QUERY_EXPLAIN, explain_seconds: float = SLOW_QUERY_EXPLAIN_SECONDS):
+        self.threshold = threshold_ms / 1000
+        self.explain_plans = explain_plans
+        self.explain_seconds = explain_seconds
+        self.entries = deque(maxlen=size)
+        self.counts = defaultdict(int)
+        self._lock = threading.Lock()
+        self._plans = {}
+        self._queue = queue.Queue(maxsize=100)
+        self._worker = None
+
+    def instrument(self, sync_engine, name, explain_bind):
+        """Watch ``sync_engine``; plans are fetched through ``explain_bind``
+        (a synchronous engine for the same database)."""
+        if self.threshold <= 0:
+            return
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if context is not None:
+                context._apptelier_slowlog_start = time.perf_counter()
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            start = getattr(context, "_apptelier_slowlog_start", None)
+            if start is None:
+                return
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.threshold and not conn.get_execution_options().get("apptelier_explain"):
+                self.record(name, statement, parameters, elapsed, executemany, explain_bind)
+
+    def record(self, name, statement, parameters, seconds, executemany=False, explain_bind=None):
+        stats = metrics.current_request()
+        route = stats.route if stats is not None else None
+        entry = {
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "engine": name,
+            "route": route,
+            "ms": round(seconds * 1000, 2),
+            "statement": statement[:MAX_STATEMENT_CHARS],
+            "plan": None,
+        }
+        with self._lock:
+            self.entries.append(entry)
+            self.counts[name] += 1
+        logger.warning("Slow query (%.1f ms on %s, %s): %s", seconds * 1000, name, route or "no request",
+                       " ".join(statement.split())[:500])
+        if (self.explain_plans and explain_bind is not None and not executemany
+                and statement.lstrip()[:6].upper() == "SELECT"):
+            self._request_plan(entry, explain_bind, statement, parameters)
+
+    def _request_plan(self, entry, bind, statement, parameters):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._plans.get(statement)
+            if cached is not None and now - cached[0] < self.explain_seconds:
+                entry["plan"] = cached[1]
+                return
+            if len(self._plans) >= 1000:
+                self._plans.clear()
+            self._plans[statement] = (now, None)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="slowlog-explain", daemon=True)
+                self._worker.start()
+        try:
+            self._queue.put_nowait((entry, bind, statement, parameters))
+        except queue.Full:
+            pass
+
+    def _run(self):
+        while True:
+            entry, bind, statement, parameters = self._queue.get()
+            try:
+                plan = explain(bind, statement, parameters)
+            except Exception as e:
+                plan = [{"error": str(e).splitlines()[0]}]
+            with self._lock:
+                entry["plan"] = plan
+                self._plans[statement] = (time.monotonic(), plan)
+            logger.warning("Plan for slow query on %s (%s): %s", entry["engine"], entry["route"] or "no request", plan)
+
+    def recent(self):
+        with self._lock:
+            return list(reversed(self.entries))
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+        return {"threshold_ms": self.threshold * 1000, "counts": counts, "recent": self.recent()}
+
+
+slow_queries = SlowQueryLog()
+
+
+@metrics.register_collector
+def slow_query_metric_lines():
+    with slow_queries._lock:
+        counts = sorted(slow_queries.counts.items())
+    return metrics.gauge_lines("apptelier_db_slow_queries_total", "Statements slower than SLOW_QUERY_MS.",
+                               [({"engine": name}, count) for name, count in counts], "counter")
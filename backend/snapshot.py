@@ -0,0 +1,117 @@
+"""Static export of the catalog for the WordPress embed.
+
+``export_snapshot`` writes each catalog section as the exact bytes its API
+endpoint serves, under a content-hashed name with precompressed siblings, in
+a directory of its own per tenant:
+
+    catalog/<tenant>/plans.3f2a9c0d51e4b7a8.json
+    catalog/<tenant>/plans.3f2a9c0d51e4b7a8.json.br
+    catalog/<tenant>/plans.3f2a9c0d51e4b7a8.json.gz
+    catalog/<tenant>/manifest.json
+
+Hashed files never change, so a CDN can serve them with
+``Cache-Control: public, max-age=31536000, immutable`` (and nginx
+``gzip_static``/``brotli_static`` picks up the .gz/.br files). Only
+``manifest.json``, which maps sections to files and names the tenant it was
+exported for, needs a short max-age.
+
+Regeneration is incremental: a section whose bytes hash the same as in the
+existing manifest is left untouched, and when nothing changed the manifest is
+not rewritten either. Files from the generation before the current one are
+kept so pages still holding the previous manifest can finish loading; older
+ones are removed, and nothing that manifest does not name is ever touched.
+"""
+import json
+import os
+import time
+from pathlib import Path
+
+from sqlalchemy.orm import Session
+
+from catalog import read_payload
+from models import DEFAULT_TENANT
+from payload import ENCODINGS
+
+SNAPSHOT_SECTIONS = ("hero_stats", "plans", "services", "testimonials")
+MANIFEST_NAME = "manifest.json"
+HASH_LENGTH = 16
+_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def _write_atomic(path: Path, data: bytes):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _read_manifest(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _section_files(name: str):
+    return [name] + [name + _SUFFIXES[encoding] for encoding in ENCODINGS]
+
+
+def export_snapshot(db: Session, out_dir, sections=SNAPSHOT_SECTIONS, tenant_id: str = DEFAULT_TENANT) -> dict:
+    """Write ``tenant_id``'s changed sections and the manifest to ``out_dir``.
+
+    Returns ``{"written": [...], "unchanged": [...], "removed": [...]}``.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = out_dir / MANIFEST_NAME
+    previous = _read_manifest(manifest_path).get("sections", {})
+
+    entries, written, unchanged = {}, [], []
+    for key in sections:
+        payload = read_payload(db, key, tenant_id)
+        digest = payload.etag.strip('"')[:HASH_LENGTH]
+        name = "%s.%s.json" % (key.replace("_", "-"), digest)
+        old = previous.get(key)
+        if old is not None and old["file"] == name and all((out_dir / f).exists() for f in _section_files(name)):
+            entries[key] = old
+            unchanged.append(key)
+            continue
+        _write_atomic(out_dir / name, payload.body)
+        for encoding in ENCODINGS:
+            body, _ = payload.variant(encoding)
+            _write_atomic(out_dir / (name + _SUFFIXES[encoding]), body)
+        entries[key] = {
+            "file": name,
+            "etag": payload.etag,
+            "bytes": len(payload.body),
+            "encodings": list(ENCODINGS),
+        }
+        if old is not None and old["file"] != name:
+            entries[key]["previous"] = old["file"]
+        written.append(key)
+
+    # Keep the current and the immediately previous file of each section.
+    keep = {MANIFEST_NAME}
+    for entry in entries.values():
+        for name in filter(None, (entry["file"], entry.get("previous"))):
+            keep.update(_section_files(name))
+    # Only files an earlier export wrote (named in its manifest) are ever
+    # removed; --out may be a directory shared with other build output.
+    written_before = set()
+    for entry in previous.values():
+        for name in filter(None, (entry.get("file"), entry.get("previous"))):
+            written_before.update(_section_files(name))
+    removed = []
+    for name in sorted(written_before - keep):
+        path = out_dir / name
+        if path.exists():
+            path.unlink()
+            removed.append(name)
+
+    if written or set(entries) != set(previous):
+        manifest = {
+            "tenant": tenant_id,
+            "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "sections": entries,
+        }
+        _write_atomic(manifest_path, json.dumps(manifest, indent=2).encode())
+    return {"written": written, "unchanged": unchanged, "removed": sorted(removed)}
@@ -0,0 +1,178 @@
+"""Tenant resolution.
+
+Every white-label business is a row in ``tenants`` and owns the catalog rows
+carrying its id. A request's tenant is the first of:
+
+1. the TENANT_HEADER header (``X-Tenant``), or a ``tenant`` query parameter
+   for clients that cannot set headers (``EventSource``), naming a tenant id;
+2. the request's host name, matched against ``tenants.domain``;
+3. the subdomain of TENANT_BASE_DOMAIN (``acme.apptelier.sg`` -> ``acme``);
+4. TENANT_FALLBACK (``default``; set it empty to answer 404 instead).
+
+Resolution is a couple of dictionary lookups against ``TenantRegistry``, an
+in-memory copy of the tenants table reloaded every TENANT_REFRESH_SECONDS
+and after every global catalog invalidation, so it costs the same for ten
+tenants or ten thousand. ``TenantMiddleware`` resolves each request once
+into ``scope["tenant"]`` (None when unknown) and endpoints take
+``Depends(current_tenant)``, which turns None into a 404.
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+
+from fastapi import HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.datastructures import Headers, MutableHeaders, QueryParams
+
+from cache import catalog_cache, wake
+from database import run_db
+from models import DEFAULT_TENANT, Tenant
+
+logger = logging.getLogger(__name__)
+
+TENANT_HEADER = os.environ.get('TENANT_HEADER', 'X-Tenant')
+TENANT_BASE_DOMAIN = os.environ.get('TENANT_BASE_DOMAIN', '').strip('.').lower()
+TENANT_FALLBACK = os.environ.get('TENANT_FALLBACK', DEFAULT_TENANT)
+TENANT_REFRESH_SECONDS = float(os.environ.get('TENANT_REFRESH_SECONDS', '60'))
+
+TENANT_ID = re.compile(r"^[a-z0-9][a-z0-9-]{0,63}$")
+
+
+def _host_name(host: str) -> str:
+    host = host.strip().lower()
+    if host.startswith("["):  # IPv6 literal
+        return host[:host.find("]") + 1]
+    return host.split(":", 1)[0].rstrip(".")
+
+
+def load_tenants(db: Session):
+    return db.execute(select(Tenant.id, Tenant.domain)).all()
+
+
+class TenantRegistry:
+    def __init__(self, refresh_seconds: float = TENANT_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        # Until the first load only the default tenant is known
+        self.ids = frozenset({DEFAULT_TENANT})
+        self.domains = {}
+        self.loaded_at = None
+        self.loads = 0
+        self.load_errors = 0
+        self._loop = None
+        self._changed = None
+        self._task = None
+        catalog_cache.on_invalidate(self._on_invalidate)
+
+    def resolve(self, host: str, requested: str = None):
+        """Return the tenant id for a request, or None if it names an unknown tenant."""
+        if requested:
+            requested = requested.strip().lower()
+            return requested if requested in self.ids else None
+        host = _host_name(host or "")
+        tenant = self.domains.get(host)
+        if tenant is not None:
+            return tenant
+        if TENANT_BASE_DOMAIN and host.endswith("." + TENANT_BASE_DOMAIN):
+            subdomain = host[:-len(TENANT_BASE_DOMAIN) - 1]
+            if subdomain in self.ids:
+                return subdomain
+        return TENANT_FALLBACK if TENANT_FALLBACK in self.ids else None
+
+    def resolve_scope(self, scope):
+        headers = Headers(scope=scope)
+        requested = headers.get(TENANT_HEADER) if TENANT_HEADER else None
+        if not requested and b"tenant=" in scope.get("query_string", b""):
+            requested = QueryParams(scope["query_string"]).get("tenant")
+        return self.resolve(headers.get("host", ""), requested)
+
+    def set(self, rows):
+        """Replace the registry with ``(id, domain)`` rows."""
+        self.ids = frozenset(tenant_id for tenant_id, _ in rows) | {DEFAULT_TENANT}
+        self.domains = {domain.lower(): tenant_id for tenant_id, domain in rows if domain}
+        self.loaded_at = time.time()
+
+    async def reload(self):
+        try:
+            rows = await run_db(load_tenants)
+        except Exception:
+            self.load_errors += 1
+            raise
+        self.loads += 1
+        self.set(rows)
+
+    def _on_invalidate(self, version, tenant):
+        # New tenants come with a global invalidation (manage.py tenant add)
+        if tenant is None:
+            wake(self._loop, self._changed)
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._changed.wait(), self.refresh_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._changed.clear()
+            try:
+                await self.reload()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Tenant registry refresh failed: %s", e)
+
+    def stats(self) -> dict:
+        return {
+            "tenants": len(self.ids),
+            "domains": len(self.domains),
+            "loaded_at": (time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.loaded_at))
+                          if self.loaded_at is not None else None),
+            "loads": self.loads,
+            "load_errors": self.load_errors,
+        }
+
+
+tenant_registry = TenantRegistry()
+
+
+def current_tenant(request: Request) -> str:
+    tenant = request.scope["tenant"] if "tenant" in request.scope else tenant_registry.resolve_scope(request.scope)
+    if tenant is None:
+        raise HTTPException(status_code=404, detail="Unknown tenant")
+    return tenant
+
+
+class TenantMiddleware:
+    def __init__(self, app, registry: TenantRegistry = tenant_registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        scope["tenant"] = self.registry.resolve_scope(scope)
+        if not TENANT_HEADER:
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message):
+            # Shared HTTP caches must not hand one tenant's catalog to another
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).add_vary_header(TENANT_HEADER)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
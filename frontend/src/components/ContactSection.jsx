@@ -1,13 +1,17 @@
-import React, { useMemo, useRef, useState } from "react";
+import React, { useMemo, useState } from "react";
 import { ArrowRight, Calendar, Mail } from "lucide-react";
 import { toast } from "sonner";
+import { tenantHeaders } from "../lib/catalog";
+
+const BACKEND_URL = (window?.ApptelierConfig?.apiBaseUrl || process.env.REACT_APP_BACKEND_URL || "").replace(/\/$/, "");
 
 /**
  * ContactSection
  * - React-themed CTA + Form (below Testimonials)
  * - Validates inputs client-side
- * - Submits to your existing WP endpoint (POST)
- * - Anti-spam: 10s cooldown
+ * - Submits to the backend lead endpoint (POST /api/leads), or to the
+ *   WordPress handler when no backend URL is configured
+ * - Anti-spam: per-IP throttling on the server (429 + Retry-After)
  */
 export const ContactSection = () => {
     const waPhone = "6592209445";
@@ -17,10 +21,10 @@ export const ContactSection = () => {
         "Hi Apptélier! I'd like to schedule a call to discuss a customised AI ordering & booking solution.";
     return `https://wa.me/${waPhone}?text=${encodeURIComponent(text)}`;
         }, []); 
-    const endpoint = useMemo(() => {
-        // keep using your existing WP handler
-        return "https://cart.apptelier.sg/wp-content/themes/woostify-child/apptelier-contact.php";
-    }, []);
+    // Without a backend, keep posting to the WP handler (form fields, not JSON)
+    const endpoint = BACKEND_URL
+        ? `${BACKEND_URL}/api/leads`
+        : "https://cart.apptelier.sg/wp-content/themes/woostify-child/apptelier-contact.php";
 
     const fireScheduleAnalytics = () => {
         const eventName = "whatsapp_schedule_call_click";
@@ -56,8 +60,6 @@ export const ContactSection = () => {
         });
     };
 
-  const lastSubmitRef = useRef(0);
-
   const [form, setForm] = useState({
     name: "",
     mobile: "",
@@ -130,34 +132,41 @@ export const ContactSection = () => {
       return;
     }
 
-    // 10s cooldown
-    const now = Date.now();
-    if (now - lastSubmitRef.current < 10000) {
-      toast.error("You're submitting too fast. Please wait 10 seconds.");
-      return;
-    }
-    lastSubmitRef.current = now;
-
     setSubmitting(true);
 
     try {
-      // WordPress PHP endpoint likely expects standard form fields
-      const body = new URLSearchParams();
-      body.set("name", form.name.trim());
-      body.set("mobile", form.mobile.trim());
-      body.set("email", form.email.trim());
-      body.set("business", form.business.trim());
-      body.set("message", form.message.trim());
-
-      const res = await fetch(endpoint, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/x-www-form-urlencoded;charset=UTF-8",
-        },
-        body: body.toString(),
-      });
+      const fields = {
+        name: form.name.trim(),
+        mobile: form.mobile.trim(),
+        email: form.email.trim(),
+        business: form.business.trim(),
+        message: form.message.trim(),
+      };
+      const res = await fetch(endpoint, BACKEND_URL
+        ? {
+            method: "POST",
+            headers: { "Content-Type": "application/json", ...tenantHeaders },
+            body: JSON.stringify({ ...fields, email: fields.email || null }),
+          }
+        : {
+            method: "POST",
+            headers: { "Content-Type": "application/x-www-form-urlencoded;charset=UTF-8" },
+            body: new URLSearchParams(fields).toString(),
+          });
+
+      // Throttled (per IP): tell the user when to retry
+      if (res.status === 429) {
+        const wait = parseInt(res.headers.get("Retry-After") || "10", 10);
+        toast.error(`You're submitting too fast. Please wait ${wait} seconds.`);
+        return;
+      }
+
+      // Overloaded or not accepting leads right now: nothing the user did
+      if (res.status === 503) {
+        toast.error("We can't take enquiries right now. Please try again later or WhatsApp us.");
+        return;
+      }
 
-      // Some WP handlers redirect or return HTML; treat non-2xx as error
       if (!res.ok) {
         throw new Error(`HTTP ${res.status}`);
       }
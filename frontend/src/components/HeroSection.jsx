@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from "react";
 import { companyInfo } from "../data/mock";
 import { ArrowRight, Play, CheckCircle2 } from "lucide-react";
-import axios from "axios";
+import { fetchSection, subscribeToChanges } from "../lib/catalog";
 import { DemoVideoModal } from "./DemoVideoModal"; // ✅ add this
 import { DashboardPreview } from "./DashboardPreview";
 
@@ -26,8 +26,8 @@ export const HeroSection = () => {
     const fetchHeroStats = async () => {
       try {
         if (!BACKEND_URL) { setHeroStats(fallbackStats); setLoading(false); return; }
-        const response = await axios.get(`${BACKEND_URL}/api/hero-stats`);
-        if (response.data && response.data.length > 0) setHeroStats(response.data);
+        const data = await fetchSection(BACKEND_URL, "hero_stats");
+        if (data && data.length > 0) setHeroStats(data);
       } catch (error) {
         console.debug("Hero stats unavailable, using fallback.");
         setHeroStats(fallbackStats);
@@ -36,6 +36,7 @@ export const HeroSection = () => {
       }
     };
     fetchHeroStats();
+    if (BACKEND_URL) return subscribeToChanges(BACKEND_URL, "hero_stats", fetchHeroStats);
   }, [BACKEND_URL]);
 
   const highlights = [
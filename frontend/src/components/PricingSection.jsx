@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from "react";
 import { Check, X, Sparkles } from "lucide-react";
-import axios from "axios";
+import { fetchSection, subscribeToChanges } from "../lib/catalog";
 
 const BACKEND_URL = (window?.ApptelierConfig?.apiBaseUrl || process.env.REACT_APP_BACKEND_URL || "").replace(/\/$/, "");
 // Fallback data
@@ -76,9 +76,9 @@ export const PricingSection = () => {
     const fetchPlans = async () => {
       try {
         if (!BACKEND_URL) { setLoading(false); return; }
-        const response = await axios.get(`${BACKEND_URL}/api/plans`);
-        if (response.data && response.data.length > 0) {
-          setPlans(response.data);
+        const data = await fetchSection(BACKEND_URL, "plans");
+        if (data && data.length > 0) {
+          setPlans(data);
         }
       } catch (error) {
         console.debug("plans unavailable, using fallback:", error);
@@ -88,6 +88,7 @@ export const PricingSection = () => {
       }
     };
     fetchPlans();
+    if (BACKEND_URL) return subscribeToChanges(BACKEND_URL, "plans", fetchPlans);
   }, []);
 
   return (
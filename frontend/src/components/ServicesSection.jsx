@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from "react";
 import { ShoppingCart, Calendar, Utensils, Users, Plug, BarChart3, ArrowRight } from "lucide-react";
-import axios from "axios";
+import { fetchSection, subscribeToChanges } from "../lib/catalog";
 
 const BACKEND_URL = (window?.ApptelierConfig?.apiBaseUrl || process.env.REACT_APP_BACKEND_URL || "").replace(/\/$/, "");
 const iconMap = {
@@ -40,9 +40,9 @@ export const ServicesSection = () => {
     const fetchServices = async () => {
       try {
         if (!BACKEND_URL) { setLoading(false); return; }
-        const response = await axios.get(`${BACKEND_URL}/api/services`);
-        if (response.data && response.data.length > 0) {
-          setServices(response.data);
+        const data = await fetchSection(BACKEND_URL, "services");
+        if (data && data.length > 0) {
+          setServices(data);
         }
       } catch (error) {
         console.debug("services unavailable, using fallback:", error);
@@ -52,6 +52,7 @@ export const ServicesSection = () => {
       }
     };
     fetchServices();
+    if (BACKEND_URL) return subscribeToChanges(BACKEND_URL, "services", fetchServices);
   }, []);
 
   return (
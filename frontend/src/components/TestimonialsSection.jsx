@@ -1,6 +1,6 @@
 import React, { useEffect, useRef, useState } from "react";
 import { Star, Quote } from "lucide-react";
-import axios from "axios";
+import { fetchSection, subscribeToChanges } from "../lib/catalog";
 
 const BACKEND_URL = (window?.ApptelierConfig?.apiBaseUrl || process.env.REACT_APP_BACKEND_URL || "").replace(/\/$/, "");
 
@@ -41,8 +41,8 @@ export const TestimonialsSection = () => {
     const fetchTestimonials = async () => {
       try {
         if (!BACKEND_URL) { setLoading(false); return; }
-        const response = await axios.get(`${BACKEND_URL}/api/testimonials`);
-        if (response.data && response.data.length > 0) setTestimonials(response.data);
+        const data = await fetchSection(BACKEND_URL, "testimonials");
+        if (data && data.length > 0) setTestimonials(data);
       } catch (error) {
         console.debug("testimonials unavailable, using fallback:", error);
         setTestimonials(fallbackTestimonials);
@@ -51,6 +51,7 @@ export const TestimonialsSection = () => {
       }
     };
     fetchTestimonials();
+    if (BACKEND_URL) return subscribeToChanges(BACKEND_URL, "testimonials", fetchTestimonials);
   }, []);
 
   // Measure card width + gap so carousel works on mobile/desktop
@@ -0,0 +1,116 @@
+import axios from "axios";
+
+const SECTION_PATHS = {
+  hero_stats: "/api/hero-stats",
+  plans: "/api/plans",
+  services: "/api/services",
+  testimonials: "/api/testimonials",
+};
+
+// Tenant whose catalog to show. Without one the API picks it from the host
+// name, which is enough when each business has its own domain; the WordPress
+// plugin passes APPTELIER_TENANT for sites sharing one API host.
+export const TENANT = window?.ApptelierConfig?.tenant || process.env.REACT_APP_TENANT || "";
+export const tenantHeaders = TENANT ? { "X-Tenant": TENANT } : {};
+
+// Static snapshot written by `python manage.py snapshot`; the WordPress
+// plugin passes its URL when frontend/build/catalog/<tenant>/manifest.json
+// exists. A manifest exported for another tenant is never used.
+const SNAPSHOT_TENANT = TENANT || "default";
+const SNAPSHOT_URL = (window?.ApptelierConfig?.catalogSnapshotUrl || process.env.REACT_APP_CATALOG_SNAPSHOT_URL || "").replace(/([^/])$/, "$1/");
+const SNAPSHOT_VERSION = window?.ApptelierConfig?.catalogSnapshotVersion || "";
+
+let manifestRequest = null;
+
+const fetchManifest = () => {
+  if (!manifestRequest) {
+    // The manifest is small and short-lived; the files it names are immutable.
+    const query = SNAPSHOT_VERSION ? `?v=${encodeURIComponent(SNAPSHOT_VERSION)}` : "";
+    manifestRequest = axios.get(`${SNAPSHOT_URL}manifest.json${query}`).then((response) => response.data);
+  }
+  return manifestRequest;
+};
+
+const fetchSnapshot = async (section) => {
+  const manifest = await fetchManifest();
+  if (manifest?.tenant !== SNAPSHOT_TENANT) return null;
+  const entry = manifest?.sections?.[section];
+  if (!entry) return null;
+  const response = await axios.get(`${SNAPSHOT_URL}${entry.file}`);
+  return Array.isArray(response.data) ? response.data : null;
+};
+
+// Every landing section shares a single /api/landing request per page load.
+let landingRequest = null;
+
+const fetchLanding = (backendUrl) => {
+  if (!landingRequest) {
+    landingRequest = axios
+      .get(`${backendUrl}/api/landing`, { headers: tenantHeaders })
+      .then((response) => response.data)
+      .catch((error) => {
+        landingRequest = null;
+        throw error;
+      });
+  }
+  return landingRequest;
+};
+
+export const fetchSection = async (backendUrl, section) => {
+  if (SNAPSHOT_URL) {
+    try {
+      const data = await fetchSnapshot(section);
+      if (data) return data;
+    } catch (error) {
+      console.debug("catalog snapshot unavailable, using the API:", error);
+    }
+  }
+  try {
+    const landing = await fetchLanding(backendUrl);
+    if (landing && Array.isArray(landing[section])) return landing[section];
+  } catch (error) {
+    console.debug("landing endpoint unavailable, fetching section directly:", error);
+  }
+  const response = await axios.get(`${backendUrl}${SECTION_PATHS[section]}`, { headers: tenantHeaders });
+  return response.data;
+};
+
+// One EventSource per page tells every mounted section when its data changed
+// (GET /api/changes), so sections keep what they fetched until then. The
+// browser reconnects on its own and resumes with Last-Event-ID. Pages served
+// from a static snapshot don't subscribe: the export only changes when it is
+// regenerated, and keeping them off the API is the point of exporting it.
+const changeListeners = new Set();
+let changeSource = null;
+
+const notifyChanged = (sections) => {
+  landingRequest = null;
+  changeListeners.forEach((listener) => {
+    if (!sections || sections.includes(listener.section)) listener.onChange();
+  });
+};
+
+export const subscribeToChanges = (backendUrl, section, onChange) => {
+  if (SNAPSHOT_URL || typeof EventSource === "undefined") return () => {};
+  const listener = { section, onChange };
+  changeListeners.add(listener);
+  if (!changeSource) {
+    // EventSource cannot send headers, so the tenant goes in the query string
+    const query = TENANT ? `?tenant=${encodeURIComponent(TENANT)}` : "";
+    changeSource = new EventSource(`${backendUrl}/api/changes${query}`);
+    changeSource.addEventListener("change", (event) => {
+      notifyChanged(Object.keys(JSON.parse(event.data).changed || {}));
+    });
+    // Sent with reset when the server cannot tell what was missed
+    changeSource.addEventListener("state", (event) => {
+      if (JSON.parse(event.data).reset) notifyChanged(null);
+    });
+  }
+  return () => {
+    changeListeners.delete(listener);
+    if (!changeListeners.size && changeSource) {
+      changeSource.close();
+      changeSource = null;
+    }
+  };
+};
@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# The backend modules read MYSQL_URL at import time; point them at a
+# throwaway SQLite file so the suite runs without a MySQL server.
+_db_dir = tempfile.mkdtemp(prefix="apptelier-tests-")
+os.environ.setdefault("MYSQL_URL", f"sqlite:///{_db_dir}/apptelier.db")
+
+import pytest
+
+from database import Base, SessionLocal, engine
+from seed_data import seed_database
+
+
+@pytest.fixture
+def db():
+    """A session on freshly created tables seeded with the sample catalog."""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    seed_database(session)
+    try:
+        yield session
+    finally:
+        session.close()
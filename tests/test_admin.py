@@ -0,0 +1,29 @@
+import schemas
+from admin import _merge, create_item, update_item
+from models import Service, SubscriptionPlan
+
+
+def test_merge_inserts_new_ids_and_updates_existing_ones(db):
+    existing = db.query(Service).order_by(Service.order_index).first()
+    rows = [
+        {"id": existing.id, "tenant_id": "default", "title": "Renamed", "description": "d", "icon": "x",
+         "order_index": 0},
+        {"id": "new-service", "tenant_id": "default", "title": "New", "description": "d", "icon": "x",
+         "order_index": 99},
+    ]
+    _merge(db, Service, rows)
+    db.commit()
+    db.expire_all()
+    assert db.get(Service, existing.id).title == "Renamed"
+    assert db.get(Service, "new-service").tenant_id == "default"
+
+
+def test_created_and_updated_items_carry_database_defaults(db):
+    data = {"name": "Pro", "price": 10, "period": "month", "order_index": 5,
+            "features": [{"name": "One", "order_index": 0}]}
+    created = create_item(db, SubscriptionPlan, schemas.SubscriptionPlan, data, "default")
+    assert created.created_at is not None and created.updated_at is not None
+    assert [feature.name for feature in created.features] == ["One"]
+
+    updated = update_item(db, Service, schemas.Service, db.query(Service).first().id, {"title": "T"}, "default")
+    assert updated.title == "T" and updated.created_at is not None
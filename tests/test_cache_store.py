@@ -0,0 +1,218 @@
+import asyncio
+import time
+
+import pytest
+
+import cache
+from cache import CatalogCache
+import cache_store
+from cache_store import MemoryStore, RedisStore, encode_command, read_reply
+
+
+class StandInRedis:
+    """Just enough of a Redis server (GET, MGET, SET PX, INCR, PING, SELECT) to
+    exercise ``RedisStore`` over a real socket."""
+
+    def __init__(self):
+        self.data = {}
+        self.commands = []
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return "redis://127.0.0.1:%d/0" % self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                args = await read_reply(reader)
+                writer.write(self._reply(args))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _reply(self, args):
+        name = args[0].upper().decode()
+        self.commands.append(name)
+        if name in ("PING", "SELECT"):
+            return b"+OK\r\n"
+        if name == "GET":
+            return self._bulk(args[1])
+        if name == "MGET":
+            return b"*%d\r\n" % (len(args) - 1) + b"".join(self._bulk(key) for key in args[1:])
+        if name == "SET":
+            expires_at = None
+            if len(args) == 5 and args[3].upper() == b"PX":
+                expires_at = time.monotonic() + int(args[4]) / 1000
+            self.data[args[1]] = (args[2], expires_at)
+            return b"+OK\r\n"
+        if name == "INCR":
+            value = int(self.data.get(args[1], (b"0", None))[0]) + 1
+            self.data[args[1]] = (str(value).encode(), None)
+            return b":%d\r\n" % value
+        return b"-ERR unknown command '%s'\r\n" % name.encode()
+
+    def _bulk(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if value is None or (expires_at is not None and expires_at <= time.monotonic()):
+            return b"$-1\r\n"
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture(autouse=True)
+def poll_every_request(monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_VERSION_CHECK_SECONDS", 0)
+
+
+def make_cache(url):
+    return CatalogCache(store=RedisStore(url), encode=lambda value: value, decode=lambda raw: raw)
+
+
+def test_encode_command():
+    assert encode_command(("SET", "k", b"v", "PX", 1500)) == b"*5\r\n$3\r\nSET\r\n$1\r\nk\r\n$1\r\nv\r\n$2\r\nPX\r\n$4\r\n1500\r\n"
+
+
+def test_incomplete_store_cannot_be_built():
+    class GetOnlyStore(cache_store.CacheStore):
+        async def get(self, key):
+            return None
+
+    with pytest.raises(TypeError, match="get_changes"):
+        GetOnlyStore()
+
+
+def test_redis_store_round_trip():
+    async def scenario():
+        server = StandInRedis()
+        store = RedisStore(await server.start())
+        try:
+            assert await store.get("missing") is None
+            await store.set("k", b"\x00binary\r\n", ttl=60)
+            assert await store.get("k") == b"\x00binary\r\n"
+            assert await store.get_version() == 0
+            assert await store.incr_version() == 1
+            assert await store.get_version() == 1
+        finally:
+            await store.close()
+            await server.stop()
+
+    run(scenario())
+
+
+def test_workers_share_entries_and_invalidation():
+    async def scenario():
+        server = StandInRedis()
+        url = await server.start()
+        first, second = make_cache(url), make_cache(url)
+        loads = []
+
+        def loader(value):
+            loads.append(value)
+            return value
+
+        try:
+            assert await first.get_or_load("plans", lambda: loader(b"v1")) == b"v1"
+            # Another worker is served from the shared store without touching the DB.
+            assert await second.get_or_load("plans", lambda: loader(b"unused")) == b"v1"
+            assert loads == [b"v1"]
+            assert second.stats()["shared_hits"] == 1
+
+            first.invalidate()
+            await asyncio.gather(*first._publishing)
+            assert await second.get_or_load("plans", lambda: loader(b"v2")) == b"v2"
+            assert await first.get_or_load("plans", lambda: loader(b"unused")) == b"v2"
+            assert loads == [b"v1", b"v2"]
+            assert second.version == 1
+        finally:
+            await first.store.close()
+            await second.store.close()
+            await server.stop()
+
+    run(scenario())
+
+
+def test_tenant_invalidation_only_reaches_that_tenant():
+    async def scenario():
+        server = StandInRedis()
+        url = await server.start()
+        first, second = make_cache(url), make_cache(url)
+        loads = []
+
+        async def load(worker, tenant, value):
+            return await worker.get_or_load("plans", lambda: loads.append(value) or value, tenant=tenant)
+
+        try:
+            for tenant in ("acme", "globex"):
+                await load(first, tenant, tenant.encode() + b"-v1")
+                await load(second, tenant, b"unused")
+            assert len(loads) == 2
+
+            first.invalidate("acme")
+            await asyncio.gather(*first._publishing)
+            assert await load(second, "acme", b"acme-v2") == b"acme-v2"
+            assert await load(second, "globex", b"unused") == b"globex-v1"
+            assert await load(first, "acme", b"unused") == b"acme-v2"
+            assert loads == [b"acme-v1", b"globex-v1", b"acme-v2"]
+            assert second.version == 0 and second.version_of("acme") == (0, 1)
+        finally:
+            await first.store.close()
+            await second.store.close()
+            await server.stop()
+
+    run(scenario())
+
+
+def test_unavailable_store_falls_back_to_loader():
+    async def scenario():
+        server = StandInRedis()
+        url = await server.start()
+        await server.stop()
+        worker = make_cache(url)
+        assert await worker.get_or_load("plans", lambda: b"from-db") == b"from-db"
+        # Served from the local LRU afterwards; the dead store is not retried per request.
+        assert await worker.get_or_load("plans", lambda: b"unused") == b"from-db"
+        stats = worker.stats()
+        assert stats["store_errors"] == 1
+        assert stats["hits"] == 1
+
+    run(scenario())
+
+
+def test_memory_store_is_bounded_and_drops_old_versions():
+    async def scenario():
+        store = MemoryStore(max_entries=2)
+        for name in ("a", "b", "c"):
+            await store.set(store.entry_key(0, name), name.encode(), ttl=60)
+        assert await store.get(store.entry_key(0, "a")) is None
+        assert await store.get(store.entry_key(0, "c")) == b"c"
+
+        await store.set(store.entry_key(0, "acme:plans"), b"acme", ttl=60)
+        await store.set(store.entry_key(0, "globex:plans"), b"globex", ttl=60)
+        assert await store.record_change(await store.incr_version(), "acme") == 1
+        assert await store.get(store.entry_key(0, "acme:plans")) is None
+        assert await store.get(store.entry_key(0, "globex:plans")) == b"globex"
+        assert await store.get_marks("acme") == (0, 1)
+        assert await store.get_changes(1, 2) == ["acme", None]
+
+        await store.record_change(await store.incr_version(), None)
+        assert await store.get(store.entry_key(0, "globex:plans")) is None
+        assert await store.get_marks("globex") == (2, 0)
+
+    run(scenario())
+
+
+def test_no_store_unless_configured(monkeypatch):
+    monkeypatch.setattr(cache_store, "CACHE_STORE", "")
+    assert cache_store.store_from_env() is None
+    monkeypatch.setattr(cache_store, "CACHE_STORE", "memory")
+    assert isinstance(cache_store.store_from_env(), MemoryStore)
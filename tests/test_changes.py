@@ -0,0 +1,88 @@
+import asyncio
+import json
+from collections import namedtuple
+from types import SimpleNamespace
+
+import pytest
+
+import changes
+from changes import ChangeFeed, diff_section
+
+Record = namedtuple("Record", "id title")
+
+
+def snapshot(services, tenant="default", version=(0, 0)):
+    sections = {key: () for key in changes.SECTIONS}
+    sections["services"] = tuple(Record(*service) for service in services)
+    return SimpleNamespace(tenant_id=tenant, version=version, sections=sections)
+
+
+def events(frames):
+    parsed = []
+    for frame in frames:
+        fields = dict(line.split(": ", 1) for line in frame.decode().splitlines() if line and not line.startswith(":"))
+        if "event" in fields:
+            parsed.append((fields["event"], json.loads(fields["data"])))
+    return parsed
+
+
+def test_diff_section_lists_ids_and_truncates():
+    before = (Record("a", "A"), Record("b", "B"))
+    after = (Record("b", "B2"), Record("c", "C"))
+    assert diff_section(before, after) == {"added": ["c"], "updated": ["b"], "removed": ["a"]}
+    many = tuple(Record(str(i), "x") for i in range(changes.MAX_DIFF_IDS + 1))
+    assert diff_section((), many) == {"truncated": True}
+
+
+def test_streams_receive_changes_and_resume_from_last_event_id(monkeypatch):
+    async def scenario():
+        feed = ChangeFeed(heartbeat=3600)
+        first = snapshot([("a", "A")])
+        other = snapshot([("x", "X")], tenant="acme")
+        latest = {"default": first, "acme": other}
+
+        async def get(tenant):
+            return latest[tenant]
+        monkeypatch.setattr(changes.catalog_snapshot, "get", get)
+        monkeypatch.setattr(changes.catalog_cache, "version_of", lambda tenant: (0, 0))
+        feed.start()
+        await feed._advance(first)
+
+        live = feed.stream()
+        hello = [await live.__anext__(), await live.__anext__()]
+        (kind, state), = events(hello)
+        assert kind == "state" and state["reset"] is False
+        first_id = state["id"]
+
+        # A client that disconnects must not cancel the future others wait on
+        leaving = feed.stream()
+        await leaving.__anext__(), await leaving.__anext__()
+        pending = asyncio.ensure_future(leaving.__anext__())
+        await asyncio.sleep(0)
+        pending.cancel()
+
+        # Another tenant's stream never sees this tenant's changes
+        elsewhere = feed.stream(tenant="acme")
+        await elsewhere.__anext__(), await elsewhere.__anext__()
+        quiet = asyncio.ensure_future(elsewhere.__anext__())
+
+        second = latest["default"] = snapshot([("a", "A2"), ("b", "B")], version=(0, 1))
+        await feed._advance(second)
+        (kind, change), = events([await asyncio.wait_for(live.__anext__(), 1)])
+        assert not quiet.done()
+        assert kind == "change" and change["previous"] == first_id
+        assert change["changed"] == {"services": {"added": ["b"], "updated": ["a"], "removed": []}}
+
+        resumed = feed.stream(first_id)
+        assert events([await resumed.__anext__(), await resumed.__anext__()]) == [("change", change)]
+        unknown = feed.stream("0000")
+        (kind, state), = events([await unknown.__anext__(), await unknown.__anext__()])
+        assert kind == "state" and state["reset"] is True and state["id"] == change["id"]
+
+        await feed.stop()
+        assert [frame async for frame in live] == []
+        with pytest.raises(StopAsyncIteration):
+            await quiet
+        assert feed.stats()["resumed"] == 1 and feed.stats()["resets"] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,44 @@
+import datetime
+import uuid
+
+import pytest
+
+import catalog
+from catalog import CATALOG, read_payload_fast
+from catalog_snapshot import load_snapshot, snapshot_payload
+from models import PlanFeature, Service, SubscriptionPlan, Testimonial
+from payload import Payload
+
+
+def add_edge_cases(db):
+    stamp = datetime.datetime(2024, 2, 29, 23, 59, 58, 123456)
+    plan = SubscriptionPlan(
+        id=str(uuid.uuid4()), name="Éntreprise “quoted” \\ slash / ✓", price=1234.5,
+        description=None, popular=True, order_index=9, created_at=stamp, updated_at=stamp,
+    )
+    plan.features = [
+        PlanFeature(id=str(uuid.uuid4()), name="Tab\tand newline\n and \x01 control", included=False, order_index=1),
+        PlanFeature(id=str(uuid.uuid4()), name="日本語 emoji 🚀", included=True, order_index=0),
+    ]
+    db.add(plan)
+    db.add(Service(id=str(uuid.uuid4()), title="No extras", description=None, icon=None, order_index=7))
+    db.add(Testimonial(id=str(uuid.uuid4()), name="Zoë", role=None, content="<b>&</b>", rating=4,
+                       avatar=None, created_at=datetime.datetime(2025, 1, 1, 0, 0)))
+    db.commit()
+
+
+@pytest.mark.skipif(catalog.orjson is None, reason="orjson not installed")
+@pytest.mark.parametrize("key", sorted(CATALOG))
+def test_fast_payload_matches_pydantic_bytes(db, key):
+    add_edge_cases(db)
+    expected = Payload.from_models(CATALOG[key][1], catalog.read_section(db, key))
+    db.expire_all()
+    assert read_payload_fast(db, key).body == expected.body
+
+
+@pytest.mark.parametrize("key", sorted(CATALOG))
+def test_snapshot_payload_matches_pydantic_bytes(db, key):
+    add_edge_cases(db)
+    expected = Payload.from_models(CATALOG[key][1], catalog.read_section(db, key))
+    db.expire_all()
+    assert snapshot_payload(load_snapshot(db, "default", (0, 0)), key).body == expected.body
@@ -0,0 +1,68 @@
+import asyncio
+from datetime import datetime
+
+import leads
+from leads import LeadWriter, _append_spill, _file_lock, _lock_path
+
+
+def row(i):
+    return {"id": f"lead-{i}", "name": "N", "mobile": "1", "email": None, "business": "B",
+            "message": "M", "ip": None, "created_at": datetime(2026, 1, 1)}
+
+
+def test_only_one_worker_replays_and_a_failed_batch_keeps_the_writer(tmp_path, monkeypatch):
+    written = []
+
+    async def run_db(fn, rows):
+        if rows[0]["id"] == "lead-bad":
+            raise RuntimeError("database down")
+        written.extend(r["id"] for r in rows)
+    monkeypatch.setattr(leads, "run_db", run_db)
+
+    async def scenario():
+        spill = tmp_path / "spill.ndjson"
+        _append_spill(spill, [row(1), row(2)])
+        writer = LeadWriter(spill_path=spill, flush_seconds=0.01)
+        # Another worker is replaying: this one leaves the file alone
+        with _file_lock(_lock_path(spill, ".replay.lock")):
+            await writer._replay()
+        assert written == [] and spill.exists()
+        await writer._replay()
+        assert written == ["lead-1", "lead-2"] and not writer._spill_pending()
+
+        monkeypatch.setattr(leads, "_append_spill", lambda path, rows: (_ for _ in ()).throw(OSError("disk full")))
+        writer.start()
+        assert writer.submit(row("bad"))
+        await asyncio.sleep(0.1)
+        assert writer.running and writer.lost == 1
+        assert writer.submit(row(3))
+        await writer.stop()
+        assert written[-1] == "lead-3" and not writer.submit(row(4))
+
+    asyncio.run(scenario())
+
+
+def test_written_leads_are_forwarded(tmp_path, monkeypatch):
+    forwarded = []
+
+    async def run_db(fn, rows):
+        pass
+    monkeypatch.setattr(leads, "run_db", run_db)
+
+    def forward_lead(url, lead):
+        if lead["id"] == "lead-2":
+            raise OSError("handler down")
+        forwarded.append((url, lead["id"]))
+    monkeypatch.setattr(leads, "forward_lead", forward_lead)
+
+    async def scenario():
+        writer = LeadWriter(spill_path=tmp_path / "spill.ndjson", flush_seconds=0.01,
+                            forward_url="https://example.test/contact.php")
+        writer.start()
+        for i in (1, 2, 3):
+            assert writer.submit(row(i))
+        await writer.stop()
+        assert forwarded == [("https://example.test/contact.php", "lead-1"), ("https://example.test/contact.php", "lead-3")]
+        assert writer.forwarded == 2 and writer.forward_errors == 1
+
+    asyncio.run(scenario())
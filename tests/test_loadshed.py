@@ -0,0 +1,24 @@
+import asyncio
+
+from loadshed import ConcurrencyLimiter
+
+
+def run_requests(limiter, latencies):
+    async def scenario():
+        for latency in latencies:
+            assert await limiter.acquire()
+            limiter.release(latency, failed=False)
+
+    asyncio.run(scenario())
+
+
+def test_slow_by_design_route_keeps_its_limit():
+    limiter = ConcurrencyLimiter(limit=4, adaptive=True)
+    run_requests(limiter, [2.0, 2.3, 2.1, 3.5])
+    assert limiter.limit == 4 and limiter.target == 4.0
+
+
+def test_route_slowing_down_against_its_baseline_is_cut():
+    limiter = ConcurrencyLimiter(limit=4, adaptive=True, min_target=0.01)
+    run_requests(limiter, [0.02, 0.02, 0.2])
+    assert limiter.limit < 4 and limiter.baseline == 0.02
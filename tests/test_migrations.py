@@ -0,0 +1,64 @@
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, String, Table, create_engine, inspect, text
+
+from database import Base
+from migrations import MIGRATIONS, migrate, pending
+
+
+def index_names(bind, table):
+    return {index["name"] for index in inspect(bind).get_indexes(table)}
+
+
+def test_migrate_upgrades_an_existing_schema(tmp_path):
+    bind = create_engine(f"sqlite:///{tmp_path}/old.db")
+    # plan tables as created before migrations existed
+    old = MetaData()
+    Table("subscription_plans", old, Column("id", String(36), primary_key=True),
+          Column("name", String(100)), Column("order_index", Integer))
+    Table("plan_features", old, Column("id", String(36), primary_key=True),
+          Column("plan_id", String(36), ForeignKey("subscription_plans.id"), index=True),
+          Column("order_index", Integer))
+    old.create_all(bind)
+    with bind.begin() as conn:
+        conn.execute(text("INSERT INTO subscription_plans (id, name, order_index) VALUES ('p1', 'Basic', 0)"))
+
+    assert migrate(bind) == [version for version, _, _ in MIGRATIONS]
+    assert index_names(bind, "plan_features") == {"ix_plan_features_plan_order", "ix_plan_features_tenant_plan_order"}
+    assert index_names(bind, "subscription_plans") == {"ix_subscription_plans_tenant_order"}
+    with bind.connect() as conn:
+        # Existing rows move to the default tenant
+        assert conn.execute(text("SELECT tenant_id FROM subscription_plans")).scalar() == "default"
+        assert conn.execute(text("SELECT id FROM tenants")).scalars().all() == ["default"]
+    assert pending(bind) == []
+    assert migrate(bind) == []
+
+
+def test_migrate_adds_the_plan_features_foreign_key(tmp_path):
+    bind = create_engine(f"sqlite:///{tmp_path}/original.db")
+    # plan_features as first shipped, with plan_id neither constrained nor indexed
+    old = MetaData()
+    Table("subscription_plans", old, Column("id", String(36), primary_key=True),
+          Column("name", String(100)), Column("order_index", Integer))
+    Table("plan_features", old, Column("id", String(36), primary_key=True),
+          Column("plan_id", String(36), nullable=False), Column("name", String(255), nullable=False),
+          Column("order_index", Integer))
+    old.create_all(bind)
+    with bind.begin() as conn:
+        conn.execute(text("INSERT INTO subscription_plans (id, name, order_index) VALUES ('p1', 'Basic', 0)"))
+        conn.execute(text("INSERT INTO plan_features (id, plan_id, name, order_index) "
+                          "VALUES ('f1', 'p1', 'Hosting', 0), ('f2', 'gone', 'Orphan', 0)"))
+
+    migrate(bind)
+    foreign_keys = inspect(bind).get_foreign_keys("plan_features")
+    assert [(fk["constrained_columns"], fk["referred_table"]) for fk in foreign_keys] == \
+        [(["plan_id"], "subscription_plans")]
+    assert index_names(bind, "plan_features") == {"ix_plan_features_plan_order", "ix_plan_features_tenant_plan_order"}
+    with bind.connect() as conn:
+        assert conn.execute(text("SELECT id, tenant_id, name FROM plan_features")).all() == \
+            [("f1", "default", "Hosting")]
+
+
+def test_migrate_accepts_a_create_all_schema(tmp_path):
+    bind = create_engine(f"sqlite:///{tmp_path}/fresh.db")
+    Base.metadata.create_all(bind)
+    assert migrate(bind) == [version for version, _, _ in MIGRATIONS]
+    assert index_names(bind, "testimonials") == {"ix_testimonials_tenant_created"}
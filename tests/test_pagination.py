@@ -0,0 +1,44 @@
+import datetime
+import json
+import uuid
+
+import pytest
+from sqlalchemy import update
+
+from catalog import read_section
+from models import Service, Testimonial
+from pagination import InvalidCursor, decode_cursor, encode_cursor, read_page
+
+
+def all_pages(db, key, limit):
+    rows, cursor = [], None
+    while True:
+        payload, cursor = read_page(db, key, cursor and decode_cursor(key, cursor), limit)
+        rows.extend(json.loads(payload.body))
+        if cursor is None:
+            return rows
+
+
+def test_cursor_round_trip():
+    stamp = datetime.datetime(2024, 2, 29, 23, 59, 58)
+    assert decode_cursor("testimonials", encode_cursor(stamp, "abc")) == (stamp, "abc")
+    assert decode_cursor("services", encode_cursor(None, "abc")) == (None, "abc")
+    with pytest.raises(InvalidCursor):
+        decode_cursor("services", "not-a-cursor")
+
+
+def test_pages_cover_the_full_list_once_in_order(db):
+    # Ties on the sort key and NULL keys must neither repeat nor skip rows.
+    stamp = datetime.datetime(2025, 1, 1)
+    for i in range(25):
+        db.add(Testimonial(id=str(uuid.uuid4()), name=f"Customer {i}", content="Great", rating=5,
+                           created_at=stamp))
+        db.add(Service(id=str(uuid.uuid4()), title=f"Service {i}", order_index=i % 3))
+    db.commit()
+    db.execute(update(Testimonial).where(Testimonial.name.in_(["Customer 0", "Customer 10", "Customer 20"]))
+               .values(created_at=None))
+    db.commit()
+    for key in ("testimonials", "services"):
+        expected = [item.model_dump(mode="json") for item in read_section(db, key)]
+        for limit in (1, 4, 100):
+            assert all_pages(db, key, limit) == expected
@@ -0,0 +1,70 @@
+import json
+import uuid
+
+from sqlalchemy import event
+
+from database import engine
+from catalog import load_plans, read_payload_fast
+from catalog_snapshot import load_snapshot
+from models import PlanFeature, SubscriptionPlan
+
+
+def count_queries(fn):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        result = fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return result, len(statements)
+
+
+def add_plans(db, count, features_per_plan=5):
+    for i in range(count):
+        plan = SubscriptionPlan(id=str(uuid.uuid4()), name=f"Extra {i}", price=10 + i, order_index=10 + i)
+        plan.features = [
+            PlanFeature(id=str(uuid.uuid4()), name=f"Feature {j}", order_index=j)
+            for j in range(features_per_plan)
+        ]
+        db.add(plan)
+    db.commit()
+
+
+def test_load_plans_query_count_is_constant(db):
+    db.expire_all()
+    plans, seeded_queries = count_queries(lambda: load_plans(db))
+    assert len(plans) == 3
+
+    add_plans(db, 20)
+    db.expire_all()
+    plans, grown_queries = count_queries(lambda: load_plans(db))
+    assert len(plans) == 23
+    assert grown_queries == seeded_queries <= 2
+
+
+def test_load_plans_orders_features(db):
+    plans = load_plans(db)
+    assert [p.name for p in plans] == ["Basic", "Growth", "Professional"]
+    for plan in plans:
+        indexes = [f.order_index for f in plan.features]
+        assert indexes == sorted(indexes)
+        assert all(f.plan_id == plan.id for f in plan.features)
+
+
+def test_features_with_equal_order_index_come_back_in_id_order(db):
+    plan = SubscriptionPlan(id="tied", name="Tied", price=1, order_index=99)
+    plan.features = [PlanFeature(id=feature_id, name=feature_id, order_index=0) for feature_id in ("c", "a", "b")]
+    db.add(plan)
+    db.commit()
+    db.expire_all()
+
+    tied = [p for p in load_plans(db) if p.id == "tied"][0]
+    assert [f.id for f in tied.features] == ["a", "b", "c"]
+    body = json.loads(read_payload_fast(db, "plans").body)
+    assert [f["id"] for f in body[-1]["features"]] == ["a", "b", "c"]
+    snapshot = load_snapshot(db, "default", (0, 0))
+    assert [f.id for f in snapshot.features_by_plan["tied"]] == ["a", "b", "c"]
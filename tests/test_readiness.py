@@ -0,0 +1,38 @@
+import asyncio
+
+import database
+import server
+from database import ReplicaRouter, route_reads_to_replica, run_db, ping
+
+
+def test_database_check_pings_the_primary_with_a_replica_configured(tmp_path, monkeypatch):
+    router = ReplicaRouter([f"sqlite:///{tmp_path}/replica.db"], "round_robin")
+    monkeypatch.setattr(database, "replicas", router)
+    on_replica = []
+
+    async def run_on_replica(replica, fn, args):
+        on_replica.append(replica.name)
+    monkeypatch.setattr(database, "_run_on_replica", run_on_replica)
+
+    def primary_down(session_factory, fn, *args):
+        raise RuntimeError("primary down")
+
+    async def scenario():
+        route_reads_to_replica(True)
+        await run_db(ping)
+        assert on_replica == ["replica0"]
+
+        monkeypatch.setattr(database, "_run_sync", primary_down)
+        try:
+            await server.check_database()
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("a dead primary must fail the readiness check")
+        assert on_replica == ["replica0"]
+        # Later reads in the same request still go to the replica
+        await run_db(ping)
+        assert on_replica == ["replica0", "replica0"]
+
+    asyncio.run(scenario())
+    router.replicas[0].engine.dispose()
@@ -0,0 +1,43 @@
+from search import SearchIndex, build_index, tokenize
+
+
+DOCS = {
+    ("service", "s1"): ("s1", "Appointment Booking", "Let customers book appointments online.", None),
+    ("service", "s2"): ("s2", "Online Ordering System", "Take orders for pickup and delivery.", None),
+    ("feature", "f1"): ("f1", "API access", "Premium", "p1"),
+    ("testimonial", "t1"): ("t1", "Zoë, Owner", "Bookings doubled after we moved to Apptelier.", None),
+}
+
+
+def ranked(index, query, types=None):
+    return [index.docs[slot][0][1] for _, slot in index.search(query, 10, types)[1]]
+
+
+def test_tokenize_folds_case_and_accents():
+    assert tokenize("Café-Menü API_access") == ["cafe", "menu", "api", "access"]
+
+
+def test_exact_and_prefix_matches_are_ranked():
+    index = build_index(DOCS)
+    assert ranked(index, "api access") == ["f1"]
+    assert ranked(index, "booking")[0] == "s1"
+    assert set(ranked(index, "book")) == {"s1", "t1"}
+    assert ranked(index, "book", types={"testimonial"}) == ["t1"]
+    assert ranked(index, "nothing here") == []
+
+
+def test_incremental_updates_match_a_fresh_build():
+    index = SearchIndex()
+    for key, doc in DOCS.items():
+        index.add(key, *doc)
+    index.remove(("service", "s1"))
+    index.add(("service", "s1"), "s1b", "Table Reservations", "Book tables in seconds.", None)
+    index.remove(("feature", "f1"))
+
+    expected = dict(DOCS)
+    expected[("service", "s1")] = ("s1b", "Table Reservations", "Book tables in seconds.", None)
+    del expected[("feature", "f1")]
+    fresh = build_index(expected)
+    assert index.vocabulary == fresh.vocabulary
+    for query in ("book", "api", "orders delivery", "reservations"):
+        assert ranked(index, query) == ranked(fresh, query)
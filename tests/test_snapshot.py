@@ -0,0 +1,23 @@
+import json
+
+import snapshot
+from payload import Payload
+from snapshot import export_snapshot
+
+
+def test_export_only_removes_files_it_wrote(tmp_path, monkeypatch):
+    bodies = {"plans": b"[1]"}
+    monkeypatch.setattr(snapshot, "read_payload", lambda db, key, tenant_id: Payload(bodies[key]).precompress())
+    (tmp_path / "asset-manifest.json").write_text("{}")
+
+    def export():
+        return export_snapshot(None, tmp_path, sections=("plans",))
+
+    export()
+    first = json.loads((tmp_path / "manifest.json").read_text())["sections"]["plans"]["file"]
+    for body in (b"[2]", b"[3]"):
+        bodies["plans"] = body
+        result = export()
+    # The generation before the current one stays; the one before that goes
+    assert result["removed"] == sorted([first, first + ".br", first + ".gz"])
+    assert (tmp_path / "asset-manifest.json").exists()
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from cache import CatalogCache, catalog_cache
+from catalog import read_payload_fast, read_section
+from catalog_snapshot import SnapshotHolder, load_snapshot
+from models import Service
+from pagination import read_page
+from seed_data import seed_database
+from tenants import TenantRegistry
+import tenants
+
+
+@pytest.fixture
+def db(db):
+    seed_database(db, "acme")
+    return db
+
+
+def test_resolves_header_then_domain_then_subdomain(monkeypatch):
+    monkeypatch.setattr(tenants, "TENANT_BASE_DOMAIN", "apptelier.sg")
+    registry = TenantRegistry()
+    registry.set([("default", None), ("acme", "www.acme.com"), ("globex", None)])
+    assert registry.resolve("anything.example", "Globex") == "globex"
+    assert registry.resolve("www.acme.com", "nobody") is None
+    assert registry.resolve("WWW.ACME.COM:8443") == "acme"
+    assert registry.resolve("globex.apptelier.sg") == "globex"
+    assert registry.resolve("missing.apptelier.sg") == "default"
+    monkeypatch.setattr(tenants, "TENANT_FALLBACK", "")
+    assert registry.resolve("missing.apptelier.sg") is None
+
+
+def test_queries_only_see_their_tenant(db):
+    db.add(Service(id="acme-only", tenant_id="acme", title="Acme only", order_index=99))
+    db.commit()
+    default = [service.title for service in read_section(db, "services")]
+    acme = [service.title for service in read_section(db, "services", "acme")]
+    assert "Acme only" not in default and acme == default + ["Acme only"]
+    assert len(read_section(db, "plans", "acme")) == len(read_section(db, "plans"))
+    assert read_payload_fast(db, "services", "nobody").body == b"[]"
+    assert read_page(db, "services", None, 100, "acme")[0].body.count(b'"id"') == len(acme)
+    snapshot = load_snapshot(db, "acme", (0, 0))
+    assert snapshot.tenant_id == "acme" and len(snapshot.sections["services"]) == len(acme)
+
+
+def test_cache_quota_only_evicts_the_tenants_own_entries():
+    async def scenario():
+        cache = CatalogCache(tenant_max_bytes=1000, max_bytes=2500)
+
+        async def load(tenant, key, size):
+            return await cache.get_or_load(key, lambda: b"x" * size, tenant=tenant)
+
+        await load("small", "plans", 100)
+        await load("big", "plans", 600)
+        await load("big", "services", 600)  # over big's quota: drops big's plans only
+        assert cache.contains("plans", "small") and cache.contains("services", "big")
+        assert not cache.contains("plans", "big")
+
+        await load("huge", "plans", 5000)  # over any quota: served, never kept
+        assert cache.oversize == 1 and not cache.contains("plans", "huge")
+
+        # Past the global budget the least recently used tenant goes first
+        await load("small", "plans", 100)
+        await load("third", "plans", 900)
+        await load("fourth", "plans", 900)
+        assert not cache.contains("services", "big") and cache.contains("plans", "small")
+        assert cache.bytes <= cache.max_bytes
+
+        # Invalidating one tenant leaves the others fresh, and its old value as the stale fallback
+        cache.invalidate("small")
+        assert not cache.contains("plans", "small") and cache.contains("plans", "third")
+        assert cache.peek_stale("plans", "small") == b"x" * 100
+        assert cache.peek_stale("plans", "other") is None
+
+        # Other tenants' names stay out of the public stats
+        assert "largest_tenants" not in cache.stats("small")
+        assert {entry["tenant"] for entry in cache.largest_tenants(2)} == {"third", "fourth"}
+
+    asyncio.run(scenario())
+
+
+def test_snapshots_reload_only_the_tenants_that_changed(db):
+    async def scenario():
+        holder = SnapshotHolder(refresh_seconds=3600)
+        holder.start()
+        try:
+            await holder.get()
+            await holder.get("acme")
+            loads = holder.loads
+
+            # A global invalidation retags; each tenant reloads on its next read
+            catalog_cache.invalidate()
+            await asyncio.sleep(0.05)
+            assert holder.loads == loads
+            await holder.get("acme")
+            assert holder.loads == loads + 1
+
+            catalog_cache.invalidate("acme")
+            await asyncio.sleep(0.05)
+            assert holder.loads == loads + 2
+
+            # Only a read re-checks a snapshot that has not been compared for a while
+            holder.refresh_seconds = 0
+            await holder.get()
+            await asyncio.gather(*holder._checks)
+            assert holder.loads == loads + 3
+        finally:
+            await holder.stop()
+
+    asyncio.run(scenario())